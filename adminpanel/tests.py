@@ -1,3 +1,50 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from users.models import CustomUser
+
+
+class DashboardPagingTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user("staff", password="pw", is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_invalid_cursors_start_from_the_newest_page(self):
+        for cursor in ("abc", "1.5", "-3", str(2 ** 70)):
+            response = self.client.get(reverse("admin_dashboard"), {"users_before": cursor, "flags_before": cursor})
+            self.assertEqual(response.status_code, 200, cursor)
+            self.assertIn(self.staff, response.context["users"])
+
+    def test_paging_links_are_not_chart_period_buttons(self):
+        response = self.client.get(reverse("admin_dashboard"))
+        self.assertContains(response, 'class="btn btn-sm btn-page"')
+        self.assertNotContains(response, "btn-sm btn-period")
+
+
+class MetricsAccessTests(TestCase):
+    def setUp(self):
+        self.url = reverse("metrics")
+
+    def test_staff_can_read_metrics(self):
+        self.client.force_login(CustomUser.objects.create_user("staff", password="pw", is_staff=True))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertContains(response, "# TYPE mindcare_response_cache_entries gauge")
+
+    def test_other_users_are_refused(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(CustomUser.objects.create_user("student", password="pw"))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    @override_settings(REQUEST_METRICS={"TOKEN": "s3cret"})
+    def test_scrapers_need_the_bearer_token(self):
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+        for header in ("Bearer wrong", "s3cret", "Basic s3cret"):
+            with self.subTest(header=header):
+                self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION=header).status_code, 403)
+
+    @override_settings(REQUEST_METRICS={"TOKEN": None})
+    def test_no_token_means_staff_only(self):
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION="Bearer None").status_code, 403)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION="Bearer ").status_code, 403)
@@ -1,6 +1,10 @@
 from django.urls import path
-from .views import dashboard
+from .views import dashboard, response_cache_stats, llm_upstream_stats, metrics, slow_requests
 
 urlpatterns = [
     path('', dashboard, name='admin_dashboard'),
+    path('response-cache/', response_cache_stats, name='response_cache_stats'),
+    path('llm-upstream/', llm_upstream_stats, name='llm_upstream_stats'),
+    path('metrics/', metrics, name='metrics'),
+    path('slow-requests/', slow_requests, name='slow_requests'),
 ]
\ No newline at end of file
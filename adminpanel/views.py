@@ -1,28 +1,173 @@
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
+from django.http import HttpResponse, JsonResponse
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from datetime import date, timedelta
 from users.models import CustomUser
-from mood.models import MoodEntry
 from chatbot.models import FlaggedMessage
-from django.db.models import Avg
-from datetime import timedelta
-from django.utils import timezone
+from chatbot.admission import get_scheduler
+from chatbot.llm import IN_FLIGHT, RESPONSE_CACHE
+from chatbot.backends import get_backend
+from jobs.models import DeadJob, Job
+from middleware.metrics import REGISTRY, get_config as get_metrics_config
+
+# Rows per page for the users and flagged-message tables
+PAGE_SIZE = 25
+# Summary tiles are shared by all staff and allowed to lag this many seconds
+SUMMARY_CACHE_TIMEOUT = 60
+
+
+def dashboard_summary():
+    """Counts for the summary tiles: one aggregate query per table, cached briefly."""
+    def compute():
+        users = CustomUser.objects.aggregate(
+            total=Count("id"),
+            active=Count("id", filter=Q(last_login__gte=timezone.now() - timedelta(days=30))),
+            consenting=Count("id", filter=Q(allow_data_collection=True)),
+        )
+        flags = FlaggedMessage.objects.aggregate(
+            total=Count("id"),
+            unreviewed=Count("id", filter=Q(reviewed=False)),
+        )
+        return {
+            "total_users": users["total"],
+            "active_users": users["active"],
+            "consenting_users": users["consenting"],
+            "flagged_count": flags["total"],
+            "unreviewed_count": flags["unreviewed"],
+        }
+    return cache.get_or_set("adminpanel:dashboard-summary", compute, SUMMARY_CACHE_TIMEOUT)
+
+
+def keyset_page(queryset, before, size=PAGE_SIZE):
+    """
+    Newest-first page of `queryset` with ids below `before`. Returns
+    (rows, cursor for the next page or None). Unlike OFFSET paging the cost
+    doesn't grow with how deep the reader has gone.
+    """
+    if before:
+        queryset = queryset.filter(id__lt=before)
+    rows = list(queryset.order_by("-id")[:size + 1])
+    return rows[:size], (rows[size - 1].id if len(rows) > size else None)
+
+
+def parse_cursor(value):
+    """A keyset cursor from the query string; anything but a valid id starts from the newest row."""
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    # Past 64 bits the database driver itself rejects the value
+    return cursor if 0 < cursor < 2 ** 63 else None
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
 
 @staff_member_required
 def dashboard(request):
-    # Only users who gave consent
-    active_users = CustomUser.objects.filter(allow_data_collection=True)
+    params = request.GET
 
-    # Mood trends (last 14 days)
-    recent_moods = (
-        MoodEntry.objects.filter(user__allow_data_collection=True, timestamp__gte=timezone.now() - timedelta(days=14))
-        .order_by("timestamp")
+    # Only users who gave consent; mood_count comes from the running profile stats
+    consenting = CustomUser.objects.filter(allow_data_collection=True).select_related("userprofile").only(
+        "id", "username", "email", "last_login", "userprofile__mood_count",
     )
+    users, next_users = keyset_page(consenting, parse_cursor(params.get("users_before")))
 
-    # Flagged messages
-    flagged = FlaggedMessage.objects.all().order_by("-flagged_at")
+    # Flagged messages, with message, conversation and student joined in
+    flagged = FlaggedMessage.objects.select_related("message__conversation__user")
+    status = params.get("status", "")
+    if status == "unreviewed":
+        flagged = flagged.filter(reviewed=False)
+    elif status == "reviewed":
+        flagged = flagged.filter(reviewed=True)
+    flagged_from = parse_date(params.get("from"))
+    flagged_to = parse_date(params.get("to"))
+    if flagged_from:
+        flagged = flagged.filter(flagged_at__date__gte=flagged_from)
+    if flagged_to:
+        flagged = flagged.filter(flagged_at__date__lte=flagged_to)
+    flagged_messages, next_flagged = keyset_page(flagged, parse_cursor(params.get("flags_before")))
 
     return render(request, "adminpanel/dashboard.html", {
-        "users": active_users,
-        "moods": recent_moods,
-        "flagged_messages": flagged,
-    })
\ No newline at end of file
+        **dashboard_summary(),
+        "users": users,
+        "next_users": next_users,
+        "flagged_messages": flagged_messages,
+        "next_flagged": next_flagged,
+        "filters": {
+            "status": status,
+            "from": flagged_from.isoformat() if flagged_from else "",
+            "to": flagged_to.isoformat() if flagged_to else "",
+        },
+    })
+
+
+@staff_member_required
+def response_cache_stats(request):
+    # Per-process counters for tuning CHATBOT_RESPONSE_CACHE thresholds
+    return JsonResponse(RESPONSE_CACHE.stats())
+
+
+@staff_member_required
+def llm_upstream_stats(request):
+    # Retries, breaker state and upstream latency percentiles for this process
+    backend = get_backend()
+    metrics = getattr(backend, "metrics", None)
+    return JsonResponse(metrics.snapshot() if metrics else {"resilience": "disabled"})
+
+
+def scrape_gauges():
+    """Values read at scrape time rather than counted per request."""
+    cache_stats = RESPONSE_CACHE.stats()
+    yield "response_cache_entries", "Replies held in the response cache", {}, cache_stats["entries"]
+    for kind in ("exact_hits", "similar_hits", "misses", "bypassed"):
+        yield "response_cache_lookups", "Response cache lookups by outcome", {"result": kind}, cache_stats[kind]
+    yield "response_cache_hit_ratio", "Response cache hits / lookups", {}, round(cache_stats["hit_ratio"], 4)
+
+    admission = get_scheduler().stats()
+    yield "llm_admission_running", "LLM calls holding an admission slot", {}, admission["running"]
+    yield "llm_admission_waiting", "LLM calls queued for an admission slot", {}, admission["waiting"]
+
+    flights = IN_FLIGHT.stats()
+    yield "llm_in_flight", "Distinct LLM prompts awaiting a reply", {}, flights["in_flight"]
+    for kind in ("executed", "shared"):
+        yield "llm_coalesced_calls", "LLM calls that ran, or shared an identical call in flight", \
+            {"result": kind}, flights[kind]
+
+    metrics = getattr(get_backend(), "metrics", None)
+    if metrics:
+        snapshot = metrics.snapshot()
+        breaker = {"closed": 0, "half_open": 1, "open": 2}.get(snapshot["breaker_state"])
+        yield "llm_breaker_state", "0 closed, 1 half open, 2 open", {}, breaker
+
+    for status, count in Job.objects.values_list("status").annotate(count=Count("id")):
+        yield "jobs_queued", "Background jobs by status", {"status": status}, count
+    yield "jobs_dead", "Jobs that used up their attempts", {}, DeadJob.objects.count()
+
+
+def metrics(request):
+    """
+    Prometheus text exposition for this process. Staff can read it in the
+    browser; scrapers send "Authorization: Bearer <REQUEST_METRICS TOKEN>".
+    """
+    token = get_metrics_config()["TOKEN"]
+    authorized = request.user.is_active and request.user.is_staff
+    if not authorized and token:
+        authorized = constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+    if not authorized:
+        return HttpResponse("Forbidden", status=403, content_type="text/plain")
+    return HttpResponse(REGISTRY.render(scrape_gauges()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@staff_member_required
+def slow_requests(request):
+    # Slowest requests seen by this process, with a cProfile listing when sampled
+    return JsonResponse({"requests": REGISTRY.slow_requests()})
@@ -0,0 +1,395 @@
+"""
+Admission control in front of the LLM backend.
+
+Every upstream call first takes one of MAX_CONCURRENCY slots. When none is
+free it queues, ordered by priority (from the message's intent, so crisis
+goes first), then by whether the user is within their fair share, then by
+arrival. The fair share is a per-user token bucket: a user who has spent
+their burst isn't refused, they only queue behind everyone who hasn't.
+Once the queue is full, a newcomer displaces the worst waiter if it ranks
+higher and is refused otherwise; refused and timed-out calls raise
+Overloaded, which the views turn into a 503 with Retry-After.
+
+LocalScheduler shares the limits between the threads of one process.
+SQLiteScheduler keeps the queue in a SQLite file so every worker process
+on the host shares one set of limits.
+"""
+import bisect
+import itertools
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from chatbot.backends import LLMBackendError
+from middleware.metrics import record_admission
+
+DEFAULT_LLM_ADMISSION = {
+    "BACKEND": "chatbot.admission.LocalScheduler",
+    # Keyword arguments for the scheduler, e.g. {"max_concurrency": 8, "max_queue": 32}
+    "OPTIONS": {},
+    # Lower runs first. Keys are intents from chatbot.llm.detect_intent, plus
+    # "summary" for the conversation summaries written by chatbot.context
+    "PRIORITIES": {
+        "crisis_intervention": 0,
+        "depression_support": 1,
+        "anxiety_support": 1,
+        "stress_management": 2,
+        "sleep_issues": 2,
+        "summary": 5,
+    },
+    "DEFAULT_PRIORITY": 3,
+}
+
+# Calls at this priority are never refused for a full queue
+CRITICAL_PRIORITY = 0
+
+
+class Overloaded(LLMBackendError):
+    """
+    An LLM call refused by the admission scheduler. `reason` is "shed" or
+    "timeout"; `retry_after` is a hint in seconds.
+    """
+
+    def __init__(self, message, retry_after, reason="shed"):
+        super().__init__(message, status_code=503, retry_after=retry_after)
+        self.reason = reason
+
+
+def get_config():
+    return {**DEFAULT_LLM_ADMISSION, **getattr(settings, "LLM_ADMISSION", {})}
+
+
+def priority_for(intent):
+    config = get_config()
+    return config["PRIORITIES"].get(intent, config["DEFAULT_PRIORITY"])
+
+
+def refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class BaseScheduler:
+    """
+    `max_concurrency` upstream calls at a time, at most `max_queue` waiting,
+    each for at most `max_wait` seconds. Each user gets `user_burst` calls
+    at full standing, refilled at `user_rate` per second.
+    """
+
+    # Starting guess for how long a call holds its slot, before any have finished
+    INITIAL_HOLD_SECONDS = 2.0
+
+    def __init__(self, max_concurrency=8, max_queue=32, max_wait=20.0, user_rate=0.2, user_burst=4):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self._hold_seconds = self.INITIAL_HOLD_SECONDS
+        self._counter_lock = threading.Lock()
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    @contextmanager
+    def admit(self, user_id=None, priority=None):
+        """Hold a slot for the duration of the block; raises Overloaded if none is granted."""
+        if priority is None:
+            priority = get_config()["DEFAULT_PRIORITY"]
+        started = time.monotonic()
+        try:
+            ticket = self._acquire(user_id, priority, started + self.max_wait)
+        except Overloaded as e:
+            self._count(e.reason)
+            record_admission(priority, time.monotonic() - started, e.reason)
+            raise
+        admitted = time.monotonic()
+        self._count("admitted")
+        record_admission(priority, admitted - started, "admitted")
+        try:
+            yield
+        finally:
+            self._release(ticket)
+            with self._counter_lock:
+                # Moving average, for the Retry-After estimate
+                self._hold_seconds += (time.monotonic() - admitted - self._hold_seconds) * 0.1
+
+    def _count(self, outcome):
+        with self._counter_lock:
+            if outcome == "admitted":
+                self.admitted += 1
+            elif outcome == "shed":
+                self.shed += 1
+            else:
+                self.timed_out += 1
+
+    def retry_after(self, waiting):
+        """Seconds until the queue ahead of a new caller has roughly drained."""
+        return max(1, min(60, math.ceil(self._hold_seconds * (waiting + 1) / self.max_concurrency)))
+
+    def _overloaded(self, message, waiting, reason="shed"):
+        return Overloaded(message, retry_after=self.retry_after(waiting), reason=reason)
+
+    def _timed_out(self, waiting):
+        return self._overloaded("Timed out waiting for an LLM slot", waiting, reason="timeout")
+
+    def stats(self):
+        running, waiting = self._depth()
+        with self._counter_lock:
+            return {
+                "running": running,
+                "waiting": waiting,
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "timed_out": self.timed_out,
+            }
+
+    def _acquire(self, user_id, priority, deadline):
+        """Block until a slot is granted and return a ticket for _release, or raise Overloaded."""
+        raise NotImplementedError
+
+    def _release(self, ticket):
+        raise NotImplementedError
+
+    def _depth(self):
+        """(running, waiting)"""
+        raise NotImplementedError
+
+
+class _Waiter:
+    __slots__ = ("rank", "shed")
+
+    def __init__(self, rank):
+        self.rank = rank
+        self.shed = False
+
+
+class LocalScheduler(BaseScheduler):
+    """Limits shared by the threads of this process."""
+
+    # Buckets are pruned once there are this many; a pruned user starts full again
+    MAX_BUCKETS = 4096
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._cond = threading.Condition()
+        self._running = 0
+        self._queue = []  # [(priority, over_budget, seq, waiter)], kept sorted
+        self._seq = itertools.count()
+        self._buckets = {}  # user_id -> (tokens, updated)
+
+    def _take_token(self, user_id, now):
+        if user_id is None:
+            return True
+        tokens, updated = self._buckets.get(user_id, (self.user_burst, now))
+        tokens = refill(tokens, updated, now, self.user_rate, self.user_burst)
+        granted = tokens >= 1
+        self._buckets[user_id] = (tokens - 1 if granted else tokens, now)
+        if len(self._buckets) > self.MAX_BUCKETS:
+            full_after = self.user_burst / self.user_rate if self.user_rate else math.inf
+            self._buckets = {user: bucket for user, bucket in self._buckets.items() if now - bucket[1] < full_after}
+        return granted
+
+    def _acquire(self, user_id, priority, deadline):
+        with self._cond:
+            over_budget = not self._take_token(user_id, time.monotonic())
+            if self._running < self.max_concurrency and not self._queue:
+                self._running += 1
+                return None
+
+            waiter = _Waiter((priority, over_budget, next(self._seq)))
+            if len(self._queue) >= self.max_queue:
+                if self._queue and waiter.rank < self._queue[-1][:3]:
+                    self._queue.pop()[3].shed = True
+                    self._cond.notify_all()
+                elif priority > CRITICAL_PRIORITY:
+                    raise self._overloaded("LLM queue is full", len(self._queue))
+            bisect.insort(self._queue, (*waiter.rank, waiter))
+
+            while True:
+                if waiter.shed:
+                    raise self._overloaded("Displaced from the LLM queue by more urgent calls", len(self._queue))
+                if self._queue[0][3] is waiter and self._running < self.max_concurrency:
+                    self._queue.pop(0)
+                    self._running += 1
+                    # The next waiter may fit too
+                    self._cond.notify_all()
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove((*waiter.rank, waiter))
+                    self._cond.notify_all()
+                    raise self._timed_out(len(self._queue))
+                self._cond.wait(remaining)
+
+    def _release(self, ticket):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    def _depth(self):
+        with self._cond:
+            return self._running, len(self._queue)
+
+
+class SQLiteScheduler(BaseScheduler):
+    """
+    Limits shared by every process using the SQLite file at `path`.
+
+    Each call is a row in the tickets table. Waiters poll until theirs is
+    the head of the queue and a slot is free, then claim it in an
+    IMMEDIATE transaction. Tickets of processes that have exited are
+    reclaimed, as are slots held longer than `lease` seconds, so a killed
+    worker can't leak its slots.
+    """
+
+    POLL_INTERVAL = 0.005
+    MAX_POLL_INTERVAL = 0.1
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS tickets ("
+        " id INTEGER PRIMARY KEY, state TEXT NOT NULL, priority INTEGER NOT NULL,"
+        " over_budget INTEGER NOT NULL, pid INTEGER NOT NULL, updated REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS tickets_queue ON tickets (state, priority, over_budget, id)",
+        "CREATE TABLE IF NOT EXISTS buckets (user_id TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)",
+    )
+
+    def __init__(self, path, lease=300.0, **options):
+        super().__init__(**options)
+        self.path = str(path)
+        self.lease = lease
+        self._local = threading.local()
+
+    @property
+    def db(self):
+        # One connection per thread; sqlite3 connections can't be shared between them
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.max_wait + 5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _write(self):
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _reap(self, db, now):
+        pids = [pid for (pid,) in db.execute("SELECT DISTINCT pid FROM tickets") if pid != os.getpid()]
+        dead = [pid for pid in pids if not _alive(pid)]
+        if dead:
+            db.execute(f"DELETE FROM tickets WHERE pid IN ({', '.join('?' * len(dead))})", dead)
+        db.execute("DELETE FROM tickets WHERE state = 'running' AND updated < ?", [now - self.lease])
+        db.execute("DELETE FROM tickets WHERE state != 'running' AND updated < ?", [now - self.max_wait - 60])
+
+    def _take_token(self, db, user_id, now):
+        if user_id is None:
+            return True
+        row = db.execute("SELECT tokens, updated FROM buckets WHERE user_id = ?", [str(user_id)]).fetchone()
+        tokens = refill(*row, now, self.user_rate, self.user_burst) if row else self.user_burst
+        granted = tokens >= 1
+        db.execute(
+            "INSERT OR REPLACE INTO buckets (user_id, tokens, updated) VALUES (?, ?, ?)",
+            [str(user_id), tokens - 1 if granted else tokens, now],
+        )
+        return granted
+
+    def _counts(self, db):
+        running, waiting, head = db.execute(
+            "SELECT (SELECT COUNT(*) FROM tickets WHERE state = 'running'),"
+            " (SELECT COUNT(*) FROM tickets WHERE state = 'waiting'),"
+            " (SELECT id FROM tickets WHERE state = 'waiting' ORDER BY priority, over_budget, id LIMIT 1)"
+        ).fetchone()
+        return running, waiting, head
+
+    def _acquire(self, user_id, priority, deadline):
+        now = time.time()
+        with self._write() as db:
+            self._reap(db, now)
+            over_budget = not self._take_token(db, user_id, now)
+            running, waiting, _ = self._counts(db)
+            state = "running" if running < self.max_concurrency and not waiting else "waiting"
+            if state == "waiting" and waiting >= self.max_queue:
+                worst = db.execute(
+                    "SELECT id, priority, over_budget FROM tickets WHERE state = 'waiting' "
+                    "ORDER BY priority DESC, over_budget DESC, id DESC LIMIT 1"
+                ).fetchone()
+                if worst is not None and (priority, over_budget) < tuple(worst[1:]):
+                    db.execute("UPDATE tickets SET state = 'shed' WHERE id = ?", [worst[0]])
+                elif priority > CRITICAL_PRIORITY:
+                    raise self._overloaded("LLM queue is full", waiting)
+            ticket = db.execute(
+                "INSERT INTO tickets (state, priority, over_budget, pid, updated) VALUES (?, ?, ?, ?, ?)",
+                [state, priority, int(over_budget), os.getpid(), now],
+            ).lastrowid
+        if state == "running":
+            return ticket
+
+        interval = self.POLL_INTERVAL
+        while True:
+            # Read-only check first, so waiters don't queue on the write lock
+            row = self.db.execute("SELECT state FROM tickets WHERE id = ?", [ticket]).fetchone()
+            running, waiting, head = self._counts(self.db)
+            if row is None or row[0] == "shed":
+                self._release(ticket)
+                raise self._overloaded("Displaced from the LLM queue by more urgent calls", waiting)
+            if head == ticket and running < self.max_concurrency:
+                with self._write() as db:
+                    running, _, head = self._counts(db)
+                    if head == ticket and running < self.max_concurrency:
+                        db.execute("UPDATE tickets SET state = 'running', updated = ? WHERE id = ? AND state = 'waiting'",
+                                   [time.time(), ticket])
+                        return ticket
+            if time.monotonic() >= deadline:
+                self._release(ticket)
+                raise self._timed_out(waiting)
+            time.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+            interval = min(interval * 1.5, self.MAX_POLL_INTERVAL)
+
+    def _release(self, ticket):
+        self.db.execute("DELETE FROM tickets WHERE id = ?", [ticket])
+
+    def _depth(self):
+        running, waiting, _ = self._counts(self.db)
+        return running, waiting
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@lru_cache(maxsize=None)
+def get_scheduler():
+    """Return the scheduler configured by settings.LLM_ADMISSION (built once)."""
+    config = get_config()
+    return import_string(config["BACKEND"])(**config["OPTIONS"])
+
+
+@receiver(setting_changed)
+def reset_scheduler(*, setting, **kwargs):
+    if setting == "LLM_ADMISSION":
+        get_scheduler.cache_clear()
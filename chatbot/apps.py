@@ -5,4 +5,8 @@ class ChatbotConfig(AppConfig):
     name = 'chatbot'
 
     def ready(self):
-        import chatbot.signals
\ No newline at end of file
+        import chatbot.signals
+        from chatbot.crisis import safety_message
+
+        # Render the crisis reply now rather than on the first crisis
+        safety_message()
\ No newline at end of file
@@ -0,0 +1,254 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+DEFAULT_LLM_BACKEND = {
+    "BACKEND": "chatbot.backends.AzureInferenceBackend",
+    "OPTIONS": {},
+    # Keyword arguments for chatbot.resilience.ResilientBackend; None disables it
+    "RESILIENCE": {},
+}
+
+
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class LLMBackendError(Exception):
+    """
+    Raised by a backend when the upstream model call fails.
+
+    `status_code` is the upstream HTTP status when there was one;
+    `transient` marks connection errors and timeouts.
+    """
+
+    def __init__(self, message, status_code=None, retry_after=None, transient=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.transient = transient
+
+    @property
+    def retryable(self):
+        return self.transient or self.status_code in RETRYABLE_STATUS_CODES
+
+
+class BaseLLMBackend:
+    """
+    Interface every LLM backend implements.
+
+    `messages` is a list of {"role": "system" | "user" | "assistant",
+    "content": str} dicts; options such as temperature and top_p are passed
+    through as keyword arguments. `timeout` (seconds) bounds a single call.
+    Failures are raised as LLMBackendError.
+    """
+
+    batch_workers = 4
+
+    def complete(self, messages, **options):
+        """Return the full completion text."""
+        raise NotImplementedError
+
+    def stream(self, messages, **options):
+        """Yield the completion text in chunks as it is produced."""
+        yield self.complete(messages, **options)
+
+    def complete_batch(self, batch, **options):
+        """Complete several conversations concurrently, preserving order."""
+        with ThreadPoolExecutor(max_workers=self.batch_workers) as pool:
+            return list(pool.map(lambda messages: self.complete(messages, **options), batch))
+
+
+class AzureInferenceBackend(BaseLLMBackend):
+    """
+    Azure AI Inference / GitHub Models chat completions.
+
+    Requests go through one keep-alive `requests` session whose pool holds at
+    most `pool_maxsize` connections; callers beyond that wait for a free
+    connection instead of opening more. SDK-level retries are disabled since
+    ResilientBackend owns the retry policy.
+    """
+
+    def __init__(self, endpoint="https://models.github.ai/inference", model="openai/gpt-4.1",
+                 token_env="AZURE_MENTALHEALTH_TOKEN", pool_maxsize=10, connection_timeout=5.0,
+                 read_timeout=60.0):
+        self.endpoint = endpoint
+        self.model = model
+        self.token_env = token_env
+        self.pool_maxsize = pool_maxsize
+        self.connection_timeout = connection_timeout
+        self.read_timeout = read_timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Built on first use so importing the app never needs credentials
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    from azure.ai.inference import ChatCompletionsClient
+                    from azure.core.credentials import AzureKeyCredential
+                    from azure.core.pipeline.transport import RequestsTransport
+
+                    token = os.getenv(self.token_env)
+                    if not token:
+                        raise LLMBackendError(f"{self.token_env} is not set")
+                    session = requests.Session()
+                    session.mount("https://", HTTPAdapter(
+                        pool_connections=1, pool_maxsize=self.pool_maxsize, pool_block=True, max_retries=0,
+                    ))
+                    self._client = ChatCompletionsClient(
+                        endpoint=self.endpoint,
+                        credential=AzureKeyCredential(token),
+                        transport=RequestsTransport(
+                            session=session,
+                            session_owner=False,
+                            connection_timeout=self.connection_timeout,
+                            read_timeout=self.read_timeout,
+                        ),
+                        retry_total=0,
+                    )
+        return self._client
+
+    def _convert(self, messages):
+        from azure.ai.inference.models import AssistantMessage, SystemMessage, UserMessage
+
+        types = {"system": SystemMessage, "user": UserMessage, "assistant": AssistantMessage}
+        return [types[message["role"]](message["content"]) for message in messages]
+
+    def _call(self, messages, timeout=None, **options):
+        from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+
+        if timeout is not None:
+            options["read_timeout"] = min(self.read_timeout, timeout)
+        try:
+            return self.client.complete(messages=self._convert(messages), model=self.model, **options)
+        except HttpResponseError as e:
+            headers = e.response.headers if e.response is not None else {}
+            retry_after = headers.get("Retry-After")
+            raise LLMBackendError(
+                str(e),
+                status_code=e.status_code,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+            ) from e
+        except (ServiceRequestError, ServiceResponseError) as e:
+            raise LLMBackendError(str(e), transient=True) from e
+
+    def complete(self, messages, **options):
+        response = self._call(messages, **options)
+        return response.choices[0].message.content
+
+    def stream(self, messages, **options):
+        from azure.core.exceptions import AzureError
+
+        response = self._call(messages, stream=True, **options)
+        try:
+            for update in response:
+                if update.choices and update.choices[0].delta.content:
+                    yield update.choices[0].delta.content
+        except AzureError as e:
+            raise LLMBackendError(str(e), transient=True) from e
+
+
+class StubBackend(BaseLLMBackend):
+    """
+    In-process stand-in for load testing and offline development.
+
+    Replies are derived from the prompt, so the same input always gets the
+    same text. Latency is `latency` seconds plus uniform +/- `jitter`, and
+    `failure_rate` of calls raise a retryable LLMBackendError (503). With a
+    `seed` the latency and failure sequence is reproducible too.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, chunk_size=4,
+                 reply_words=40, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.chunk_size = chunk_size
+        self.reply_words = reply_words
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.total_delay = 0.0  # simulated model time, to separate it from our own overhead
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.failure_rate
+        return delay, failed
+
+    def _sleep(self, seconds):
+        time.sleep(seconds)
+        with self._lock:
+            self.total_delay += seconds
+
+    def _reply(self, messages):
+        prompt = messages[-1]["content"] if messages else ""
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        words = [f"word{digest[i % len(digest)]}{i}" for i in range(self.reply_words)]
+        return f"[stub:{digest[:8]}] " + " ".join(words)
+
+    def complete(self, messages, timeout=None, **options):
+        delay, failed = self._draw()
+        if timeout is not None and delay > timeout:
+            self._sleep(timeout)
+            raise LLMBackendError("stub backend timed out", transient=True)
+        self._sleep(delay)
+        if failed:
+            raise LLMBackendError("stub backend injected failure", status_code=503)
+        return self._reply(messages)
+
+    def stream(self, messages, timeout=None, **options):
+        delay, failed = self._draw()
+        if timeout is not None and delay > timeout:
+            self._sleep(timeout)
+            raise LLMBackendError("stub backend timed out", transient=True)
+        words = self._reply(messages).split(" ")
+        chunks = [words[i:i + self.chunk_size] for i in range(0, len(words), self.chunk_size)]
+        # Spread the latency across chunks so time-to-first-token is realistic
+        per_chunk = delay / max(len(chunks), 1)
+        for index, chunk in enumerate(chunks):
+            self._sleep(per_chunk)
+            if failed and index == len(chunks) // 2:
+                raise LLMBackendError("stub backend injected failure", status_code=503)
+            yield " ".join(chunk) + ("" if index == len(chunks) - 1 else " ")
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    """
+    Return the backend configured by settings.LLM_BACKEND (built once),
+    wrapped in the retry / circuit breaker policy unless RESILIENCE is None.
+    """
+    from chatbot.resilience import ResilientBackend
+
+    config = {**DEFAULT_LLM_BACKEND, **getattr(settings, "LLM_BACKEND", {})}
+    backend = import_string(config["BACKEND"])(**config["OPTIONS"])
+    if config["RESILIENCE"] is None:
+        return backend
+
+    options = dict(config["RESILIENCE"])
+    hook = options.pop("metrics_hook", None)
+    backend = ResilientBackend(backend, **options)
+    if hook:
+        backend.metrics.subscribe(import_string(hook))
+    return backend
+
+
+@receiver(setting_changed)
+def reset_backend(*, setting, **kwargs):
+    if setting == "LLM_BACKEND":
+        get_backend.cache_clear()
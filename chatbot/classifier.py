@@ -0,0 +1,174 @@
+import re
+import string
+import unicodedata
+from collections import namedtuple
+from itertools import chain, product
+
+# Inflections accepted on the last word of a keyword, so "stress" still
+# matches "stressed" / "stressful" and "thank" still matches "thanks".
+KEYWORD_SUFFIXES = ("s", "es", "d", "ed", "ing", "ful", "y")
+
+# Punctuation and whitespace collapse to a plain space, so word boundaries
+# are always b" ", and the same pass lowercases ASCII letters. Apostrophes
+# split too: keywords go through the same tokenizer, so "can't" is the
+# phrase "can t" on both sides, whichever apostrophe the student typed.
+_SEPARATORS = (string.punctuation + "\t\n\r\f\v").encode()
+_TO_SPACE = bytes.maketrans(
+    _SEPARATORS + string.ascii_uppercase.encode(),
+    b" " * len(_SEPARATORS) + string.ascii_lowercase.encode(),
+)
+
+
+class _UnicodeSeparators(dict):
+    """
+    str.translate table for non-ASCII text: punctuation, symbols (emoji
+    included), separators and control characters become a space. Filled in
+    per character on first use.
+    """
+
+    def __missing__(self, char):
+        ch = chr(char)
+        # U+02BC is filed as a letter but typed as an apostrophe
+        if char >= 128 and (unicodedata.category(ch)[0] in "PSZC" or ch == "\u02bc"):
+            ch = " "
+        return self.setdefault(char, ch)
+
+
+_UNICODE_SEPARATORS = _UnicodeSeparators()
+
+
+def tokenize(text):
+    """`text` casefolded, as UTF-8 bytes of words between single-byte spaces, padded on both sides."""
+    if not text.isascii():
+        # NFKC first: fullwidth and other compatibility forms ("ｓｕｉｃｉｄｅ") become plain letters
+        text = unicodedata.normalize("NFKC", text).casefold().translate(_UNICODE_SEPARATORS)
+    return b" " + text.encode("utf-8").translate(_TO_SPACE) + b" "
+
+
+Classification = namedtuple(
+    "Classification",
+    ["intent", "technical", "mental_health", "conversational", "academic", "personal"],
+)
+
+_Phrase = namedtuple("_Phrase", ["labels", "required", "pattern"])
+
+
+def expand_patterns(patterns):
+    """
+    Expand slot patterns such as (["feel", "feeling"], ["nervous", "anxious"])
+    into every phrase they describe ("feel nervous", "feel anxious", ...).
+    """
+    return [" ".join(choice) for slots in patterns for choice in product(*slots)]
+
+
+class MessageClassifier:
+    """
+    Precompiled keyword classifier answering both "which intent?" and
+    "is this mental health related?" from a single tokenising pass.
+
+    All keywords are matched on whole words. The message is split once; the
+    token set is intersected with the keyword vocabulary in C, and only the
+    few phrases whose words all occur are confirmed against the text.
+    """
+
+    def __init__(self, intents, mental_health, conversational, personal,
+                 technical_patterns=(), academic_patterns=()):
+        self.intent_order = list(intents)
+        labels = {}
+
+        def add(keyword, label):
+            labels.setdefault(keyword.lower().strip(), set()).add(label)
+
+        for priority, keywords in enumerate(intents.values()):
+            for keyword in keywords:
+                add(keyword, ("intent", priority))
+        for keyword in mental_health:
+            add(keyword, ("mental_health", None))
+        for keyword in conversational:
+            add(keyword, ("conversational", None))
+        for keyword in personal:
+            add(keyword, ("personal", None))
+        # Fixed regex-style patterns: whole words only, no inflections
+        exact = set()
+        for phrase in expand_patterns(technical_patterns):
+            add(phrase, ("technical", None))
+            exact.add(phrase.lower())
+        for phrase in expand_patterns(academic_patterns):
+            add(phrase, ("academic", None))
+            exact.add(phrase.lower())
+
+        self._phrases = {}
+        self._vocabulary = set()
+        for keyword, keyword_labels in labels.items():
+            self._compile(keyword, frozenset(keyword_labels), keyword in exact)
+        self._vocabulary = frozenset(self._vocabulary)
+        # Labels a word earns on its own, for every vocabulary word, so the
+        # common case is one lookup per found word
+        self._word_labels = {
+            word: frozenset().union(*(p.labels for p in self._phrases.get(word, ()) if p.pattern is None))
+            for word in self._vocabulary
+        }
+        self._phrases = {
+            word: [phrase for phrase in phrases if phrase.pattern is not None]
+            for word, phrases in self._phrases.items()
+        }
+        self._phrase_words = frozenset(word for word, phrases in self._phrases.items() if phrases)
+
+    def _compile(self, keyword, labels, exact):
+        words = tokenize(keyword).split()
+        last_forms = {words[-1]}
+        # No inflections on a contraction's tail: "i'm" must not become "i my"
+        if not exact and "'" not in keyword.split()[-1]:
+            last_forms.update(words[-1] + suffix.encode() for suffix in KEYWORD_SUFFIXES)
+        last_forms = frozenset(last_forms)
+        self._vocabulary.update(words)
+        self._vocabulary.update(last_forms)
+
+        pattern = None
+        if len(words) > 1:
+            last = b"(?:" + b"|".join(re.escape(form) for form in sorted(last_forms)) + b")"
+            pattern = re.compile(
+                b" " + b" +".join(re.escape(word) for word in words[:-1]) + b" +" + last + b"(?= )"
+            )
+        # Indexed by the last word: it is the most selective one ("anxious
+        # about exam" is only looked at when "exam" occurs at all).
+        phrase = _Phrase(labels, frozenset(words[:-1]), pattern)
+        for form in last_forms:
+            self._phrases.setdefault(form, []).append(phrase)
+
+    def classify(self, text):
+        padded = tokenize(text)
+        found = self._vocabulary.intersection(padded.split())
+
+        hits = set(chain.from_iterable(map(self._word_labels.__getitem__, found)))
+        for word in self._phrase_words.intersection(found):
+            for phrase in self._phrases[word]:
+                if phrase.required <= found and phrase.pattern.search(padded):
+                    hits |= phrase.labels
+
+        intents = [priority for kind, priority in hits if kind == "intent"]
+        kinds = {kind for kind, _ in hits}
+        return Classification(
+            intent=self.intent_order[min(intents)] if intents else None,
+            technical="technical" in kinds,
+            mental_health="mental_health" in kinds,
+            conversational="conversational" in kinds,
+            academic="academic" in kinds,
+            personal="personal" in kinds,
+        )
+
+    def detect_intent(self, text, default="general_support"):
+        return self.classify(text).intent or default
+
+    def is_mental_health_related(self, text, conversation_context=None):
+        result = self.classify(text)
+        if result.technical:
+            return False
+        if result.mental_health or result.academic:
+            return True
+        if conversation_context:
+            if result.conversational:
+                return True
+            if result.personal and len(text.split()) <= 3:
+                return True
+        return False
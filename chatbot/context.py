@@ -0,0 +1,157 @@
+import logging
+
+from django.conf import settings
+
+from chatbot.models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHAT_CONTEXT = {
+    # Budget for history sent with each request: rolling summary + recent turns
+    "MAX_TOKENS": 2000,
+    "SUMMARY_MAX_TOKENS": 300,
+    # Evicted turns are folded into the summary once this many tokens are waiting,
+    # so the summariser runs every few turns rather than on every reply
+    "SUMMARY_BATCH_TOKENS": 600,
+    # Upper bound on rows read per request, whatever the budget
+    "MAX_MESSAGES": 200,
+}
+
+# Role/name framing each chat message adds on top of its content
+MESSAGE_OVERHEAD = 4
+
+ROLES = {"user": "user", "bot": "assistant"}
+
+
+def estimate_tokens(text):
+    """
+    Cheap local token estimate: about four characters per token for English
+    BPE vocabularies, but never fewer than one per word.
+    """
+    return max(len(text) // 4, text.count(" ") + 1)
+
+
+def message_tokens(content):
+    return estimate_tokens(content) + MESSAGE_OVERHEAD
+
+
+class ContextBuilder:
+    """
+    Assembles the conversation history sent to the model.
+
+    Requests carry the conversation's rolling summary followed by as many of
+    the most recent turns as fit in `max_tokens`, oldest first. `compact()`
+    folds turns that have fallen out of that window into the summary, so the
+    prompt stays roughly the same size however long the conversation runs.
+    """
+
+    def __init__(self, max_tokens=2000, summary_max_tokens=300, summary_batch_tokens=600, max_messages=200):
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summary_batch_tokens = summary_batch_tokens
+        self.max_messages = max_messages
+
+    @classmethod
+    def from_settings(cls):
+        config = {**DEFAULT_CHAT_CONTEXT, **getattr(settings, "CHAT_CONTEXT", {})}
+        return cls(
+            max_tokens=config["MAX_TOKENS"],
+            summary_max_tokens=config["SUMMARY_MAX_TOKENS"],
+            summary_batch_tokens=config["SUMMARY_BATCH_TOKENS"],
+            max_messages=config["MAX_MESSAGES"],
+        )
+
+    def _unsummarized(self, conversation, before_id=None):
+        """(id, sender, content) rows not yet in the summary, newest first."""
+        rows = Message.objects.filter(conversation=conversation)
+        if conversation.summarized_until:
+            rows = rows.filter(id__gt=conversation.summarized_until)
+        if before_id is not None:
+            rows = rows.filter(id__lt=before_id)
+        # ids are monotonic per insert and indexed, unlike timestamp
+        return list(rows.order_by("-id").values_list("id", "sender", "content")[:self.max_messages])
+
+    def _split(self, rows, budget):
+        """Split newest-first rows into (window, evicted) by token budget."""
+        used = 0
+        for index, (_, _, content) in enumerate(rows):
+            used += message_tokens(content)
+            if used > budget:
+                return rows[:index], rows[index:]
+        return rows, []
+
+    def build(self, conversation, before_id=None):
+        """
+        Return role/content dicts for the history preceding message `before_id`
+        (normally the user message being answered), in chronological order.
+        """
+        history = []
+        budget = self.max_tokens
+        if conversation.summary:
+            summary = f"Summary of the earlier conversation:\n{conversation.summary}"
+            history.append({"role": "system", "content": summary})
+            budget -= message_tokens(summary)
+
+        window, _ = self._split(self._unsummarized(conversation, before_id), budget)
+        history.extend(
+            {"role": ROLES.get(sender, "user"), "content": content}
+            for _, sender, content in reversed(window)
+        )
+        return history
+
+    def _evicted(self, conversation):
+        """
+        The oldest page (up to `max_messages`) of rows that no longer fit
+        beside the summary, oldest first, once there are enough to summarise.
+        """
+        rows = self._unsummarized(conversation)
+        window, evicted = self._split(rows, self.max_tokens - self.summary_max_tokens - MESSAGE_OVERHEAD)
+        if len(rows) < self.max_messages:
+            # Every unsummarised row was read, so `evicted` is all of them
+            page = evicted[::-1]
+        else:
+            # Older rows lie beyond the cap; page forward from the summary instead
+            # of skipping them
+            boundary = window[-1][0] if window else rows[0][0] + 1
+            older = Message.objects.filter(conversation=conversation, id__lt=boundary)
+            if conversation.summarized_until:
+                older = older.filter(id__gt=conversation.summarized_until)
+            page = list(older.order_by("id").values_list("id", "sender", "content")[:self.max_messages])
+        if sum(message_tokens(content) for _, _, content in page) < self.summary_batch_tokens:
+            return []
+        return page
+
+    def needs_compaction(self, conversation):
+        """Whether compact() would summarise anything; no LLM call."""
+        return bool(self._evicted(conversation))
+
+    def compact(self, conversation):
+        """
+        Fold turns that no longer fit beside the summary into it, a page at a
+        time, oldest first. Returns True if the summary was updated. Safe to
+        call after every reply.
+        """
+        from chatbot.llm import summarize_conversation
+
+        compacted = False
+        while evicted := self._evicted(conversation):
+            turns = [{"role": ROLES.get(sender, "user"), "content": content} for _, sender, content in evicted]
+            try:
+                summary = summarize_conversation(conversation.summary, turns, self.summary_max_tokens)
+            except Exception as e:
+                # Turns just stay out of the window until the next attempt
+                logger.warning(f"Could not summarise conversation {conversation.id}: {e}")
+                break
+
+            # Only apply if nobody else compacted this conversation in the meantime
+            updated = Conversation.objects.filter(
+                pk=conversation.pk, summarized_until=conversation.summarized_until
+            ).update(summary=summary, summarized_until=evicted[-1][0])
+            if not updated:
+                break
+            conversation.summary = summary
+            conversation.summarized_until = evicted[-1][0]
+            compacted = True
+        return compacted
+
+CONTEXT_BUILDER = ContextBuilder.from_settings()
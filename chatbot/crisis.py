@@ -0,0 +1,92 @@
+"""
+Crisis fast path. A crisis_intervention message is answered at once with a
+safety message rendered from resources/contacts.json, without a model call,
+so the reply can't be slowed down or lost by upstream trouble. The job
+worker then asks the model for a personalised follow-up
+(chatbot.tasks.crisis_follow_up) and pushes it to the open chat.
+"""
+import logging
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.timezone import now
+
+from resources.contacts import load_contacts
+
+logger = logging.getLogger(__name__)
+
+CRISIS_INTENT = "crisis_intervention"
+
+DEFAULT_CRISIS_RESPONSE = {
+    "EMERGENCY_NUMBER": "112",
+    # Queue a model-written follow-up after the safety message
+    "FOLLOW_UP": True,
+    # A follow-up the worker gets to later than this is dropped rather than
+    # posted into a conversation that has moved on
+    "FOLLOW_UP_MAX_AGE": 120,
+}
+
+SAFETY_MESSAGE = (
+    "I'm really sorry you're going through this. What you're feeling matters, "
+    "and you don't have to face it alone.\n\n"
+    "If you are in immediate danger or might act on these thoughts, please call {emergency} "
+    "or go to the nearest hospital now.\n\n"
+    "{contacts}"
+    "Are you somewhere safe right now? I'm here, and I'll keep talking with you."
+)
+
+FOLLOW_UP_PROMPT = (
+    "URGENT: The student expressed suicidal thoughts. They have already been sent this safety "
+    "message with helpline numbers:\n\n{safety}\n\n"
+    "Write a short, warm follow-up that responds to what they actually said. Validate their "
+    "feelings, gently ask about their safety, and encourage them to contact one of the helplines "
+    "or someone they trust. Do not repeat the list of numbers.\n"
+    "--- User input: {message}"
+)
+
+
+def get_config():
+    return {**DEFAULT_CRISIS_RESPONSE, **getattr(settings, "CRISIS_RESPONSE", {})}
+
+
+def render_safety_message(contacts, emergency_number):
+    lines = []
+    for group, entries in contacts.items():
+        lines.append(f"{group}:")
+        for entry in entries:
+            details = " · ".join(entry[key] for key in ("phone", "email", "website") if entry.get(key))
+            lines.append(f"• {entry.get('name', '')}: {details}")
+    block = "You can reach someone right now:\n" + "\n".join(lines) + "\n\n" if lines else ""
+    return SAFETY_MESSAGE.format(emergency=emergency_number, contacts=block)
+
+
+@lru_cache(maxsize=None)
+def _rendered():
+    return render_safety_message(load_contacts(), get_config()["EMERGENCY_NUMBER"])
+
+
+def safety_message():
+    """The crisis reply, rendered once per process (chatbot.apps preloads it)."""
+    try:
+        return _rendered()
+    except (OSError, ValueError) as e:
+        # Not cached, so a fixed contacts.json is picked up on the next crisis
+        logger.error(f"Emergency contacts unavailable, sending the crisis reply without them: {e}")
+        return render_safety_message({}, get_config()["EMERGENCY_NUMBER"])
+
+
+@receiver(setting_changed)
+def reset_safety_message(*, setting, **kwargs):
+    if setting in ("CRISIS_RESPONSE", "EMERGENCY_CONTACTS_PATH"):
+        _rendered.cache_clear()
+
+
+def follow_up_prompt(user_input):
+    return FOLLOW_UP_PROMPT.format(safety=safety_message(), message=user_input)
+
+
+def follow_up_expired(user_msg):
+    return user_msg.timestamp < now() - timedelta(seconds=get_config()["FOLLOW_UP_MAX_AGE"])
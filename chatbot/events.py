@@ -0,0 +1,25 @@
+from django.utils.dateformat import format as format_date
+from django.utils.timezone import localtime
+
+from live.broker import publish_to_users
+
+
+def message_json(msg):
+    return {
+        "id": msg.id,
+        "sender": msg.sender,
+        "content": msg.content,
+        "timestamp": msg.timestamp.isoformat(),
+        "time": format_date(localtime(msg.timestamp), "g:i A"),
+    }
+
+
+def publish_chat_messages(user_id, convo_id, msgs, origin=""):
+    """
+    Push new messages to the user's open tabs of this chat. `origin` is the
+    sending tab's X-Live-Client id, so that tab can skip its own.
+    """
+    for msg in msgs:
+        publish_to_users([user_id], "chat.message", {
+            "conversation_id": convo_id, "origin": origin, "message": message_json(msg),
+        })
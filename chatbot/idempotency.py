@@ -0,0 +1,82 @@
+"""
+Idempotency keys for chat submissions. The client sends an
+"Idempotency-Key" header with each message; the user Message and the key
+are written in one transaction, so of several requests carrying the same
+key exactly one goes on to ask the model, and the rest replay its reply.
+"""
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import IdempotencyKey, Message
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field("key").max_length
+# Default seconds a duplicate waits for the original request's reply before
+# giving up with a 409; settings.CHAT_IDEMPOTENCY_WAIT overrides it
+REPLY_WAIT = 30.0
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+
+
+class InvalidKey(ValueError):
+    pass
+
+
+def key_from(request):
+    """The request's idempotency key, or "" if it didn't send one."""
+    key = request.headers.get(HEADER, "").strip()
+    if len(key) > MAX_KEY_LENGTH or not key.isprintable():
+        raise InvalidKey(f"{HEADER} must be at most {MAX_KEY_LENGTH} printable characters.")
+    return key
+
+
+def submit(convo, key, **message_fields):
+    """
+    Save the user's Message under `key`. Returns (user message, None) for
+    a new submission, or (the original user message, its IdempotencyKey)
+    when `key` was already used in this conversation.
+    """
+    try:
+        with transaction.atomic():
+            user_msg = Message.objects.create(conversation=convo, sender="user", **message_fields)
+            IdempotencyKey.objects.create(conversation=convo, key=key, user_message=user_msg)
+        return user_msg, None
+    except IntegrityError:
+        record = IdempotencyKey.objects.select_related("user_message", "reply").get(conversation=convo, key=key)
+        return record.user_message, record
+
+
+def record_reply(convo, key, reply):
+    IdempotencyKey.objects.filter(conversation=convo, key=key).update(reply=reply)
+
+
+def abandon(convo, key):
+    """
+    Delete the submission under `key` if no reply was recorded for it (its
+    request died mid-answer), so the key can be used afresh.
+    """
+    record = IdempotencyKey.objects.filter(conversation=convo, key=key, reply__isnull=True).first()
+    if record is not None:
+        # Takes the key with it
+        Message.objects.filter(pk=record.user_message_id).delete()
+
+
+def wait_for_reply(record, timeout=None):
+    """Block until the original request has saved its reply; None if it took longer than `timeout`."""
+    if timeout is None:
+        timeout = getattr(settings, "CHAT_IDEMPOTENCY_WAIT", REPLY_WAIT)
+    deadline = time.monotonic() + timeout
+    interval = POLL_INTERVAL
+    while record.reply is None:
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(interval)
+        interval = min(interval * 2, MAX_POLL_INTERVAL)
+        try:
+            record.refresh_from_db(fields=["reply"])
+        except IdempotencyKey.DoesNotExist:
+            # The original was shed by the LLM scheduler and took its key with it
+            return None
+    return record.reply
@@ -0,0 +1,190 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERACTION_LOG = {
+    "PATH": None,  # defaults to BASE_DIR / "interaction_log.jsonl"
+    "BATCH_SIZE": 200,
+    "FLUSH_INTERVAL": 1.0,
+    "MAX_BYTES": 10 * 1024 * 1024,
+    "BACKUP_COUNT": 10,
+    "QUEUE_SIZE": 10000,
+}
+
+_STOP = object()
+
+# Loggers with a worker to drain at shutdown; one atexit hook covers them all
+_LOGGERS = weakref.WeakSet()
+
+
+@atexit.register
+def _close_all():
+    for interaction_logger in list(_LOGGERS):
+        interaction_logger.close()
+
+
+class InteractionLogger:
+    """
+    Buffered JSONL interaction log written from a background thread.
+
+    `log()` only enqueues; the worker flushes when `batch_size` records are
+    waiting or `flush_interval` seconds have passed, whichever comes first.
+    Each batch is one append under an exclusive flock on `<path>.lock`, so
+    several gunicorn workers can share the file. Past `max_bytes` the file
+    is rotated to `<stem>.<timestamp>.jsonl.gz`, keeping `backup_count`.
+    If the queue is full, records are dropped and counted rather than
+    blocking the request.
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=1.0, max_bytes=10 * 1024 * 1024,
+                 backup_count=10, queue_size=10000):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.queue_size = queue_size
+        self.written = 0
+        self.dropped = 0
+        self._queue = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._dropped_lock = threading.Lock()
+        _LOGGERS.add(self)
+
+    @classmethod
+    def from_settings(cls):
+        config = {**DEFAULT_INTERACTION_LOG, **getattr(settings, "INTERACTION_LOG", {})}
+        return cls(
+            path=config["PATH"] or Path(settings.BASE_DIR) / "interaction_log.jsonl",
+            batch_size=config["BATCH_SIZE"],
+            flush_interval=config["FLUSH_INTERVAL"],
+            max_bytes=config["MAX_BYTES"],
+            backup_count=config["BACKUP_COUNT"],
+            queue_size=config["QUEUE_SIZE"],
+        )
+
+    def _ensure_worker(self):
+        # Started lazily, and again after a fork, so a preloaded gunicorn
+        # master never hands its children a dead thread
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.queue_size)
+                    threading.Thread(target=self._run, args=(self._queue,), daemon=True,
+                                     name="interaction-logger").start()
+                    self._pid = os.getpid()
+
+    def log(self, **record):
+        self._ensure_worker()
+        record.setdefault("ts", timezone.now().isoformat())
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        """Block until everything logged so far has been written."""
+        if self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._pid != os.getpid():
+            return
+        self.flush(timeout)
+        self._queue.put(_STOP)
+        self._pid = None
+
+    def _run(self, records):
+        batch = []
+        waiters = []
+        flush_at = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = records.get(timeout=max(0.0, flush_at - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                break
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None:
+                batch.append(item)
+
+            if waiters or len(batch) >= self.batch_size or time.monotonic() >= flush_at:
+                if batch:
+                    self._write(batch)
+                    batch = []
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
+                flush_at = time.monotonic() + self.flush_interval
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write(self, batch):
+        payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch).encode("utf-8")
+        rotated = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._file_lock():
+                if self.max_bytes and self.path.exists() \
+                        and self.path.stat().st_size + len(payload) > self.max_bytes:
+                    stamp = timezone.now().strftime("%Y%m%d-%H%M%S-%f")
+                    rotated = self.path.with_name(f"{self.path.stem}.{stamp}.jsonl")
+                    os.replace(self.path, rotated)
+                # Reopened per batch so every worker follows a rotation
+                with open(self.path, "ab") as f:
+                    f.write(payload)
+            self.written += len(batch)
+        except OSError as e:
+            logger.error(f"Failed to write {len(batch)} interaction log records: {e}")
+            return
+
+        if rotated:
+            self._compress(rotated)
+
+    def _compress(self, rotated):
+        try:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            rotated.unlink()
+            backups = sorted(self.path.parent.glob(f"{self.path.stem}.*.jsonl.gz"))
+            for old in backups[:max(0, len(backups) - self.backup_count)]:
+                old.unlink(missing_ok=True)
+        except OSError as e:
+            logger.error(f"Failed to compress rotated interaction log {rotated}: {e}")
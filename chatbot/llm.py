@@ -1,176 +1,174 @@
-import os
+import hashlib
 import json
-import datetime
+import time
+import logging
 from dotenv import load_dotenv
-from azure.ai.inference import ChatCompletionsClient
-from azure.ai.inference.models import SystemMessage, UserMessage
-from azure.core.credentials import AzureKeyCredential
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from chatbot.admission import Overloaded, get_scheduler, priority_for
+from chatbot.backends import get_backend
+from chatbot.classifier import MessageClassifier
+from chatbot.context import estimate_tokens
+from chatbot.crisis import CRISIS_INTENT, safety_message
+from chatbot.interaction_log import InteractionLogger
+from chatbot.response_cache import ResponseCache
+from chatbot.singleflight import SingleFlight
+from middleware.metrics import record_llm_call
 
 # Load environment variables
 load_dotenv()
 
-# Azure Inference credentials
-AZURE_API_TOKEN = os.getenv("AZURE_MENTALHEALTH_TOKEN") 
-AZURE_ENDPOINT = "https://models.github.ai/inference"
-AZURE_MODEL = "openai/gpt-4.1" 
-
-client = ChatCompletionsClient(
-    endpoint=AZURE_ENDPOINT,
-    credential=AzureKeyCredential(AZURE_API_TOKEN),
-)
+logger = logging.getLogger(__name__)
 
 # Load intent keywords from external JSON
 with open("intents.json", "r", encoding="utf-8") as f:
     INTENT_KEYWORDS = json.load(f)
 
+# Replies to repeated prompts, keyed on (intent, prompt); crisis is never cached
+RESPONSE_CACHE = ResponseCache.from_settings()
+
+# Identical prompts already on their way upstream; a concurrent duplicate waits for that reply
+IN_FLIGHT = SingleFlight()
+
 # Profanity blacklist (customizable)
 BLACKLIST_WORDS = ["damn", "shit", "fuck", "bastard"]
 
 # -------- Mental Health Topic Detection -------- #
-def is_mental_health_related(user_input, conversation_context=None):
-    """
-    Advanced mental health topic detection that considers context and intent.
-    Returns True if it's mental health related, False otherwise.
-    
-    Args:
-        user_input (str): The user's message
-        conversation_context (list, optional): Previous messages for context
-    """
-    user_input = user_input.lower().strip()
+# Immediate exclusions for clearly technical/educational queries.
+# Each pattern is a sequence of word slots, e.g. (['what is'], ['python']).
+TECHNICAL_PATTERNS = [
+    # Programming and technical queries
+    (['what is', 'define', 'explain', 'how to', 'tutorial', 'learn', 'teach me'],
+     ['python', 'javascript', 'java', 'html', 'css', 'sql', 'programming', 'coding', 'algorithm', 'function', 'variable', 'loop', 'array', 'object']),
+    (['install', 'setup', 'configure', 'debug', 'error', 'syntax', 'code', 'script', 'framework', 'library', 'api', 'database'],),
+    (['vs code', 'visual studio', 'ide', 'compiler', 'interpreter', 'git', 'github', 'stack overflow'],),
+
+    # Academic subjects (non-emotional context)
+    (['what is', 'define', 'explain', 'formula', 'equation', 'theorem', 'calculate'],
+     ['math', 'mathematics', 'physics', 'chemistry', 'biology', 'calculus', 'algebra', 'geometry']),
+    (['history of', 'who is', 'when did', 'where is', 'capital of', 'population of'],),
+
+    # General information queries
+    (['weather', 'time', 'date', 'calendar', 'schedule', 'news', 'sports', 'music', 'movie', 'book', 'recipe'],),
+    (['directions', 'location', 'address', 'map', 'gps', 'travel', 'flight', 'hotel'],)
+]
+
+# Core emotional and mental health indicators
+MENTAL_HEALTH_INDICATORS = {
+    # Direct emotional expressions
+    'emotions': [
+        'i feel', 'i\'m feeling', 'feeling', 'felt', 'emotions', 'emotional',
+        'sad', 'happy', 'angry', 'frustrated', 'depressed', 'anxious', 
+        'worried', 'scared', 'afraid', 'nervous', 'overwhelmed', 'lonely',
+        'isolated', 'hopeless', 'helpless', 'guilty', 'ashamed', 'stressed'
+    ],
     
-    # Immediate exclusions for clearly technical/educational queries
-    technical_patterns = [
-        # Programming and technical queries
-        r'\b(what is|define|explain|how to|tutorial|learn|teach me)\s+(python|javascript|java|html|css|sql|programming|coding|algorithm|function|variable|loop|array|object)\b',
-        r'\b(install|setup|configure|debug|error|syntax|code|script|framework|library|api|database)\b',
-        r'\b(vs code|visual studio|ide|compiler|interpreter|git|github|stack overflow)\b',
-        
-        # Academic subjects (non-emotional context)
-        r'\b(what is|define|explain|formula|equation|theorem|calculate)\s+(math|mathematics|physics|chemistry|biology|calculus|algebra|geometry)\b',
-        r'\b(history of|who is|when did|where is|capital of|population of)\b',
-        
-        # General information queries
-        r'\b(weather|time|date|calendar|schedule|news|sports|music|movie|book|recipe)\b',
-        r'\b(directions|location|address|map|gps|travel|flight|hotel)\b'
-    ]
+    # Mental health conditions and symptoms
+    'conditions': [
+        'depression', 'anxiety', 'panic attack', 'panic', 'trauma', 'ptsd',
+        'bipolar', 'adhd', 'ocd', 'eating disorder', 'self harm', 'suicide',
+        'suicidal', 'insomnia', 'nightmare', 'nightmares'
+    ],
     
-    import re
-    for pattern in technical_patterns:
-        if re.search(pattern, user_input):
-            return False
+    # Professional help and treatment
+    'treatment': [
+        'therapy', 'therapist', 'counseling', 'counselor', 'psychologist',
+        'psychiatrist', 'medication', 'antidepressant', 'mental health'
+    ],
     
-    # Core emotional and mental health indicators
-    mental_health_indicators = {
-        # Direct emotional expressions
-        'emotions': [
-            'i feel', 'i\'m feeling', 'feeling', 'felt', 'emotions', 'emotional',
-            'sad', 'happy', 'angry', 'frustrated', 'depressed', 'anxious', 
-            'worried', 'scared', 'afraid', 'nervous', 'overwhelmed', 'lonely',
-            'isolated', 'hopeless', 'helpless', 'guilty', 'ashamed', 'stressed'
-        ],
-        
-        # Mental health conditions and symptoms
-        'conditions': [
-            'depression', 'anxiety', 'panic attack', 'panic', 'trauma', 'ptsd',
-            'bipolar', 'adhd', 'ocd', 'eating disorder', 'self harm', 'suicide',
-            'suicidal', 'insomnia', 'nightmare', 'nightmares'
-        ],
-        
-        # Professional help and treatment
-        'treatment': [
-            'therapy', 'therapist', 'counseling', 'counselor', 'psychologist',
-            'psychiatrist', 'medication', 'antidepressant', 'mental health'
-        ],
-        
-        # Personal struggles and challenges (emotional context)
-        'struggles': [
-            'struggling with', 'having trouble', 'difficult time', 'hard time',
-            'tough time', 'going through', 'dealing with', 'coping with',
-            'can\'t handle', 'too much', 'breaking down', 'falling apart'
-        ],
-        
-        # Help-seeking behaviors
-        'help_seeking': [
-            'need help', 'need support', 'need advice', 'need someone to talk',
-            'don\'t know what to do', 'what should i do', 'how do i cope',
-            'how do i deal', 'how do i handle', 'tips for managing', 'advice on',
-            'give me tips', 'help me manage', 'how can i manage', 'manage it'
-        ],
-        
-        # Physical symptoms with emotional context
-        'physical_emotional': [
-            'can\'t sleep', 'trouble sleeping', 'exhausted', 'no energy',
-            'lost motivation', 'can\'t concentrate', 'can\'t focus', 'appetite',
-            'tired all the time', 'physically drained', 'very tired', 'so tired',
-            'really tired', 'extremely tired', 'actually tired'
-        ],
-        
-        # Relationship and social issues
-        'relationships': [
-            'relationship problems', 'relationship issues', 'breakup', 'broke up',
-            'fight with', 'argument with', 'family problems', 'friend problems',
-            'social anxiety', 'trust issues', 'communication problems'
-        ]
-    }
+    # Personal struggles and challenges (emotional context)
+    'struggles': [
+        'struggling with', 'having trouble', 'difficult time', 'hard time',
+        'tough time', 'going through', 'dealing with', 'coping with',
+        'can\'t handle', 'too much', 'breaking down', 'falling apart'
+    ],
     
-    # Check for direct mental health indicators
-    for category, keywords in mental_health_indicators.items():
-        for keyword in keywords:
-            if keyword in user_input:
-                return True
+    # Help-seeking behaviors
+    'help_seeking': [
+        'need help', 'need support', 'need advice', 'need someone to talk',
+        'don\'t know what to do', 'what should i do', 'how do i cope',
+        'how do i deal', 'how do i handle', 'tips for managing', 'advice on',
+        'give me tips', 'help me manage', 'how can i manage', 'manage it'
+    ],
     
-    # Context-aware detection for conversational responses
-    conversational_mental_health = [
-        # Gratitude and acknowledgment in therapy context
-        'thank you', 'thanks', 'that helps', 'that\'s helpful', 'i appreciate',
-        'that makes sense', 'i understand', 'good advice', 'feel better',
-        
-        # Progress and improvement expressions
-        'getting better', 'feeling better', 'making progress', 'improving',
-        'helpful', 'working on myself', 'trying to', 'want to change',
-        
-        # Clarification and engagement
-        'tell me more', 'how do i', 'what about', 'is it normal', 'am i',
-        'should i', 'can you help', 'any suggestions'
-    ]
+    # Physical symptoms with emotional context
+    'physical_emotional': [
+        'can\'t sleep', 'trouble sleeping', 'exhausted', 'no energy',
+        'lost motivation', 'can\'t concentrate', 'can\'t focus', 'appetite',
+        'tired all the time', 'physically drained', 'very tired', 'so tired',
+        'really tired', 'extremely tired', 'actually tired'
+    ],
     
-    # If we have conversation context, these phrases are likely mental health related
-    if conversation_context and len(conversation_context) > 0:
-        for phrase in conversational_mental_health:
-            if phrase in user_input:
-                return True
-    
-    # Academic stress with emotional indicators
-    academic_stress_patterns = [
-        r'\b(nervous|anxious|worried|stressed|scared|afraid|overwhelmed)\s+(about|for|before)\s+(exam|test|presentation|defense|interview|assignment|project|deadline)\b',
-        r'\b(feel|feeling)\s+(nervous|anxious|worried|stressed|overwhelmed|pressure)\b',
-        r'\b(too much|can\'t handle|struggling with|having trouble with)\s+(school|university|college|studies|work|workload|deadlines)\b',
-        r'\b(burnout|exhausted|tired)\s+(from|because of|due to)\s+(school|studies|work|assignments|projects)\b'
+    # Relationship and social issues
+    'relationships': [
+        'relationship problems', 'relationship issues', 'breakup', 'broke up',
+        'fight with', 'argument with', 'family problems', 'friend problems',
+        'social anxiety', 'trust issues', 'communication problems'
     ]
+}
+
+# Context-aware detection for conversational responses
+CONVERSATIONAL_MENTAL_HEALTH = [
+    # Gratitude and acknowledgment in therapy context
+    'thank you', 'thanks', 'that helps', 'that\'s helpful', 'i appreciate',
+    'that makes sense', 'i understand', 'good advice', 'feel better',
     
-    for pattern in academic_stress_patterns:
-        if re.search(pattern, user_input):
-            return True
+    # Progress and improvement expressions
+    'getting better', 'feeling better', 'making progress', 'improving',
+    'helpful', 'working on myself', 'trying to', 'want to change',
     
-    # Simple length and personal pronoun check for very short responses
-    if len(user_input.split()) <= 3:
-        personal_responses = ['i am', 'i\'m', 'me too', 'yes', 'no', 'okay', 'ok', 'sure']
-        if any(response in user_input for response in personal_responses) and conversation_context:
-            return True
+    # Clarification and engagement
+    'tell me more', 'how do i', 'what about', 'is it normal', 'am i',
+    'should i', 'can you help', 'any suggestions'
+]
+
+# Academic stress with emotional indicators
+ACADEMIC_STRESS_PATTERNS = [
+    (['nervous', 'anxious', 'worried', 'stressed', 'scared', 'afraid', 'overwhelmed'],
+     ['about', 'for', 'before'],
+     ['exam', 'test', 'presentation', 'defense', 'interview', 'assignment', 'project', 'deadline']),
+    (['feel', 'feeling'],
+     ['nervous', 'anxious', 'worried', 'stressed', 'overwhelmed', 'pressure']),
+    (['too much', 'can\'t handle', 'struggling with', 'having trouble with'],
+     ['school', 'university', 'college', 'studies', 'work', 'workload', 'deadlines']),
+    (['burnout', 'exhausted', 'tired'],
+     ['from', 'because of', 'due to'],
+     ['school', 'studies', 'work', 'assignments', 'projects'])
+]
+
+# Short replies that only count with an ongoing conversation
+PERSONAL_RESPONSES = ['i am', 'i\'m', 'me too', 'yes', 'no', 'okay', 'ok', 'sure']
+
+# Compiled once at import; answers both intent and topic questions in one pass
+CLASSIFIER = MessageClassifier(
+    intents=INTENT_KEYWORDS,
+    mental_health=[kw for keywords in MENTAL_HEALTH_INDICATORS.values() for kw in keywords],
+    conversational=CONVERSATIONAL_MENTAL_HEALTH,
+    personal=PERSONAL_RESPONSES,
+    technical_patterns=TECHNICAL_PATTERNS,
+    academic_patterns=ACADEMIC_STRESS_PATTERNS,
+)
+
+
+def is_mental_health_related(user_input, conversation_context=None):
+    """
+    Advanced mental health topic detection that considers context and intent.
+    Returns True if it's mental health related, False otherwise.
     
-    return False
+    Args:
+        user_input (str): The user's message
+        conversation_context (list, optional): Previous messages for context
+    """
+    return CLASSIFIER.is_mental_health_related(user_input.strip(), conversation_context)
 
 # -------- Intent Detection -------- #
 def detect_intent(user_input):
-    user_input = user_input.lower()
-    for intent, keywords in INTENT_KEYWORDS.items():
-        if any(keyword in user_input for keyword in keywords):
-            return intent
-    return "general_support"
+    return CLASSIFIER.detect_intent(user_input)
 
 # -------- Prompt Engineering -------- #
-def generate_prompt(user_input):
-    intent = detect_intent(user_input)
+def generate_prompt(user_input, intent=None):
+    if intent is None:
+        intent = detect_intent(user_input)
 
     if intent == "crisis_intervention":
         return (
@@ -209,38 +207,142 @@ def generate_prompt(user_input):
             "--- User input: " + user_input
         )
 
-# -------- Azure LLM Query -------- #
-def query_llm(prompt):
-    system_prompt = (
-        "You are **MindCare Companion** - an AI assistant that can help with various topics including mental health support, academic questions, programming, and general conversation.\n\n"
-        "Core Capabilities:\n"
-        "1. 🚨 CRISIS: Detect mental health urgency, provide resources, escalate if needed\n"
-        "2. 🧠 MENTAL HEALTH: Use therapeutic techniques when appropriate\n"
-        "3. 📚 EDUCATION: Answer academic and technical questions clearly\n"
-        "4. 💬 CONVERSATION: Engage naturally on various topics\n\n"
-        "Communication Rules:\n"
-        "- Be helpful and informative on all topics\n"
-        "- Use simple, clear language\n"
-        "- For mental health topics: validate before problem-solving\n"
-        "- For technical topics: provide accurate, practical information\n"
-        "- Never make clinical diagnoses\n"
-        "- Maintain a supportive, friendly tone\n"
-    )
+# -------- LLM Query -------- #
+SYSTEM_PROMPT = (
+    "You are **MindCare Companion** - an AI assistant that can help with various topics including mental health support, academic questions, programming, and general conversation.\n\n"
+    "Core Capabilities:\n"
+    "1. 🚨 CRISIS: Detect mental health urgency, provide resources, escalate if needed\n"
+    "2. 🧠 MENTAL HEALTH: Use therapeutic techniques when appropriate\n"
+    "3. 📚 EDUCATION: Answer academic and technical questions clearly\n"
+    "4. 💬 CONVERSATION: Engage naturally on various topics\n\n"
+    "Communication Rules:\n"
+    "- Be helpful and informative on all topics\n"
+    "- Use simple, clear language\n"
+    "- For mental health topics: validate before problem-solving\n"
+    "- For technical topics: provide accurate, practical information\n"
+    "- Never make clinical diagnoses\n"
+    "- Maintain a supportive, friendly tone\n"
+)
+
+FALLBACK_RESPONSE = "I'm having technical difficulties. Please try again later."
+
+GENERATION_OPTIONS = {"temperature": 0.7, "top_p": 0.9}
+
+
+def build_messages(prompt, history=None):
+    """`history` is prior turns as role/content dicts, oldest first (see chatbot.context)."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *(history or []),
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _record_call(kind, messages, started, completion, ok=True):
+    prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+    record_llm_call(kind, time.perf_counter() - started, prompt_tokens, estimate_tokens(completion), ok=ok)
+
+
+def flight_key(messages, options):
+    payload = json.dumps([messages, options], sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def query_llm(prompt, history=None, coalesce=True, user_id=None, priority=None):
+    """
+    Complete `prompt` after `history`. With `coalesce`, a call identical to
+    one already in flight in this process shares that call's reply instead
+    of making its own.
+
+    The upstream call waits for an admission slot (chatbot.admission) at
+    `priority`, charged to `user_id`'s fair share. Overloaded is raised if
+    it is refused one; other failures return FALLBACK_RESPONSE.
+    """
+    messages = build_messages(prompt, history)
+    started = time.perf_counter()
+
+    def complete():
+        with get_scheduler().admit(user_id, priority):
+            return get_backend().complete(messages, **GENERATION_OPTIONS)
 
     try:
-        response = client.complete(
-            messages=[
-                SystemMessage(system_prompt),
-                UserMessage(prompt),
-            ],
-            temperature=0.7,
-            top_p=0.9,
-            model=AZURE_MODEL,
-        )
-        content = response.choices[0].message.content
-        return apply_safety_filters(content)
+        if coalesce:
+            content, shared = IN_FLIGHT.do(flight_key(messages, GENERATION_OPTIONS), complete)
+        else:
+            content, shared = complete(), False
+    except Overloaded:
+        raise
+    except Exception as e:
+        # Retries and the circuit breaker live in the backend; by now we've given up
+        logger.error(f"LLM request failed: {e}")
+        _record_call("complete", messages, started, "", ok=False)
+        return FALLBACK_RESPONSE
+    _record_call("coalesced" if shared else "complete", messages, started, content)
+    return apply_safety_filters(content)
+
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a support conversation between a student and MindCare Companion. "
+    "Keep what matters for continuing the conversation: the student's concerns, feelings, "
+    "circumstances, any risk indicators, and advice already given. "
+    "Write plain third-person prose, at most {words} words.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New turns:\n{turns}"
+)
+
+
+def summarize_conversation(summary, turns, max_tokens):
+    """
+    Fold `turns` into `summary` and return the new summary. Unlike query_llm,
+    failures are raised so the caller can keep the previous summary.
+    """
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    prompt = SUMMARY_PROMPT.format(words=max_tokens * 3 // 4, summary=summary or "(none)", turns=transcript)
+    messages = [{"role": "user", "content": prompt}]
+    started = time.perf_counter()
+    try:
+        with get_scheduler().admit(priority=priority_for("summary")):
+            content = get_backend().complete(messages, temperature=0.2, max_tokens=max_tokens)
+    except Exception:
+        _record_call("summary", messages, started, "", ok=False)
+        raise
+    _record_call("summary", messages, started, content)
+    return content.strip()
+
+# -------- LLM Streaming -------- #
+def stream_llm(prompt, history=None, user_id=None, priority=None):
+    """
+    Yield the completion in chunks as the model produces them.
+
+    Tokens are held back until a whitespace boundary so the safety filter
+    never sees half a word. The admission slot is held until the stream
+    ends; Overloaded is raised before the first chunk if there is none.
+    """
+    messages = build_messages(prompt, history)
+    started = time.perf_counter()
+    streamed = []
+    pending = ""
+    try:
+        with get_scheduler().admit(user_id, priority):
+            for token in get_backend().stream(messages, **GENERATION_OPTIONS):
+                streamed.append(token)
+                pending += token
+                cut = max(pending.rfind(" "), pending.rfind("\n")) + 1
+                if cut:
+                    yield apply_safety_filters(pending[:cut])
+                    pending = pending[cut:]
+            if pending:
+                yield apply_safety_filters(pending)
+    except Overloaded:
+        raise
     except Exception as e:
-        return "I'm having technical difficulties. Please try again later."
+        logger.error(f"LLM stream failed: {e}")
+        _record_call("stream", messages, started, "".join(streamed), ok=False)
+        if pending:
+            yield apply_safety_filters(pending) + "\n\n"
+        yield FALLBACK_RESPONSE
+        return
+    _record_call("stream", messages, started, "".join(streamed))
 
 # -------- Safety Filter -------- #
 def apply_safety_filters(response):
@@ -249,26 +351,97 @@ def apply_safety_filters(response):
     return response
 
 # -------- Interaction Logger -------- #
+# Buffered JSONL log flushed in batches from a background thread
+INTERACTION_LOGGER = InteractionLogger.from_settings()
+
+
+@receiver(setting_changed)
+def reset_interaction_logger(*, setting, **kwargs):
+    global INTERACTION_LOGGER
+    if setting == "INTERACTION_LOG":
+        INTERACTION_LOGGER.close()
+        INTERACTION_LOGGER = InteractionLogger.from_settings()
+
+
 def log_interaction(user_input, intent, response):
-    with open("interaction_log.txt", "a", encoding="utf-8") as f:
-        f.write(
-            f"[{datetime.datetime.now()}] "
-            f"Intent: {intent} | Input: {user_input} | Response: {response[:100]}...\n"
-        )
+    INTERACTION_LOGGER.log(intent=intent, input=user_input, response=response[:100])
 
 # -------- Main Chatbot Function -------- #
-def chatbot_response(user_input, is_first_message=False, conversation_context=None):
+GREETING = (
+    "🌱 Welcome to MindCare Companion. I'm here to listen and support you.\n"
+    "This is a safe space to share what's on your mind.\n\n"
+    "Remember: I'm not a replacement for professional care.\n\n"
+)
+
+
+def crisis_response(user_input):
+    """
+    The precomputed safety message, with no model call, so a student in
+    crisis sees helplines at once whatever state the upstream is in. The
+    views queue the model's personalised follow-up (chatbot.crisis).
+    """
+    response = safety_message()
+    log_interaction(user_input, CRISIS_INTENT, response)
+    return response
+
+
+def chatbot_response(user_input, is_first_message=False, conversation_context=None, user_id=None):
+    """
+    `conversation_context` is the history built by chatbot.context, sent to
+    the model ahead of the new message. `user_id` is who the LLM call is
+    charged to for fair sharing; it raises Overloaded if the call is shed.
+    """
     # Process all user queries without mental health classification guard
     intent = detect_intent(user_input)
-    prompt = generate_prompt(user_input)
-    response = query_llm(prompt)
+    if intent == CRISIS_INTENT:
+        return crisis_response(user_input)
+    prompt = generate_prompt(user_input, intent)
+    # Replies that depend on earlier turns can't be shared between conversations,
+    # so context-free intents are answered (and cached) without them
+    if RESPONSE_CACHE.is_context_free(intent):
+        conversation_context = None
+    cacheable = not conversation_context
+    response = RESPONSE_CACHE.get(intent, prompt, text=user_input) if cacheable else None
+    if response is None:
+        started = time.perf_counter()
+        response = query_llm(prompt, conversation_context, user_id=user_id, priority=priority_for(intent))
+        if cacheable and response != FALLBACK_RESPONSE:
+            RESPONSE_CACHE.set(intent, prompt, response, time.perf_counter() - started, text=user_input)
 
     log_interaction(user_input, intent, response)
 
-    greeting = (
-        "🌱 Welcome to MindCare Companion. I'm here to listen and support you.\n"
-        "This is a safe space to share what's on your mind.\n\n"
-        "Remember: I'm not a replacement for professional care.\n\n"
-    ) if is_first_message else ""
+    greeting = GREETING if is_first_message else ""
 
     return greeting + response
+
+
+def chatbot_response_stream(user_input, is_first_message=False, conversation_context=None, user_id=None):
+    """Streaming counterpart of chatbot_response; yields the reply in chunks."""
+    intent = detect_intent(user_input)
+    if intent == CRISIS_INTENT:
+        yield crisis_response(user_input)
+        return
+    prompt = generate_prompt(user_input, intent)
+
+    if is_first_message:
+        yield GREETING
+
+    if RESPONSE_CACHE.is_context_free(intent):
+        conversation_context = None
+    cacheable = not conversation_context
+    cached = RESPONSE_CACHE.get(intent, prompt, text=user_input) if cacheable else None
+    if cached is not None:
+        yield cached
+        log_interaction(user_input, intent, cached)
+        return
+
+    chunks = []
+    started = time.perf_counter()
+    for chunk in stream_llm(prompt, conversation_context, user_id=user_id, priority=priority_for(intent)):
+        chunks.append(chunk)
+        yield chunk
+
+    response = "".join(chunks)
+    if cacheable and FALLBACK_RESPONSE not in response:
+        RESPONSE_CACHE.set(intent, prompt, response, time.perf_counter() - started, text=user_input)
+    log_interaction(user_input, intent, response)
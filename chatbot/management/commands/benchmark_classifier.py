@@ -0,0 +1,59 @@
+import timeit
+from django.core.management.base import BaseCommand
+from chatbot.forms import StartChatForm
+from chatbot import llm
+from chatbot.classifier import tokenize
+
+SAMPLE_MESSAGES = [
+    "I have been feeling really anxious about exams and I can't sleep at night. ",
+    "Could you explain the structure of the course outline for next semester please? ",
+    "Thanks, that helps a lot. I'm trying to work on myself and make some progress. ",
+]
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmarks the precompiled intent / topic classifier on maximum-length chat messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--budget-us', type=float, default=20.0,
+                            help='Per-message budget in microseconds')
+
+    def handle(self, *args, **options):
+        # StartChatForm caps messages at 2000 characters; benchmark the worst case
+        max_length = StartChatForm.base_fields['message'].max_length
+        iterations = options['iterations']
+        budget = options['budget_us']
+
+        self.stdout.write(f"Classifying {max_length}-char messages, {iterations} iterations\n")
+        worst = 0.0
+        for sample in SAMPLE_MESSAGES:
+            text = (sample * (max_length // len(sample) + 1))[:max_length]
+            timings = timeit.repeat(
+                lambda: (llm.detect_intent(text), llm.is_mental_health_related(text, [text])),
+                number=iterations,
+                repeat=options['repeat'],
+            )
+            # Both public helpers share one classify() pass each; report per call
+            per_call = min(timings) / iterations / 2 * 1e6
+            single_pass = min(timeit.repeat(
+                lambda: llm.CLASSIFIER.classify(text), number=iterations, repeat=options['repeat']
+            )) / iterations * 1e6
+            # What splitting the message and looking its words up costs on this
+            # host before any classification: no keyword matcher can beat it
+            vocabulary = llm.CLASSIFIER._vocabulary
+            floor = min(timeit.repeat(
+                lambda: vocabulary.intersection(tokenize(text).split()), number=iterations, repeat=options['repeat']
+            )) / iterations * 1e6
+            worst = max(worst, single_pass)
+            self.stdout.write(
+                f"{sample[:40]!r:45} classify: {single_pass:7.2f}µs  helper call: {per_call:7.2f}µs  "
+                f"floor: {floor:7.2f}µs"
+            )
+
+        self.stdout.write("\n" + "="*50)
+        if worst <= budget:
+            self.stdout.write(self.style.SUCCESS(f"Worst case {worst:.2f}µs is within the {budget:.0f}µs budget"))
+        else:
+            self.stdout.write(self.style.WARNING(f"Worst case {worst:.2f}µs exceeds the {budget:.0f}µs budget"))
@@ -0,0 +1,80 @@
+import datetime
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from chatbot.interaction_log import InteractionLogger
+
+USER_INPUT = "I feel anxious about my project defense next week and can't focus on anything"
+RESPONSE = "It's completely understandable to feel anxious before a defense. " * 3
+
+
+def legacy_log(path, user_input, intent, response):
+    # The previous llm.log_interaction: open, append one line, close, per reply
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(
+            f"[{datetime.datetime.now()}] "
+            f"Intent: {intent} | Input: {user_input} | Response: {response[:100]}...\n"
+        )
+
+
+class Command(BaseCommand):
+    help = 'Compares the batched interaction logger with the old per-reply file append'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=20000)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--queue-size', type=int, default=None,
+                            help='Logger queue bound (default: large enough to never drop)')
+
+    def run(self, write, records, threads):
+        """Return (records/s as seen by callers, mean caller-side latency in µs)."""
+        def work(count):
+            for _ in range(count):
+                write()
+
+        per_thread = records // threads
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(work, [per_thread] * threads))
+        elapsed = time.perf_counter() - started
+        total = per_thread * threads
+        return total / elapsed, elapsed / total * threads * 1e6
+
+    def handle(self, *args, **options):
+        records = options['records']
+
+        with tempfile.TemporaryDirectory() as scratch:
+            legacy_path = Path(scratch) / 'interaction_log.txt'
+            interaction_logger = InteractionLogger(
+                Path(scratch) / 'interaction_log.jsonl',
+                max_bytes=0,
+                queue_size=options['queue_size'] or records,
+            )
+
+            def legacy():
+                legacy_log(legacy_path, USER_INPUT, 'anxiety_support', RESPONSE)
+
+            def batched():
+                interaction_logger.log(intent='anxiety_support', input=USER_INPUT, response=RESPONSE[:100])
+
+            for threads in (1, options['threads']):
+                self.stdout.write(f"\n{records} records, {threads} thread(s)")
+                rate, latency = self.run(legacy, records, threads)
+                self.stdout.write(f"  per-call append : {rate:10.0f} records/s  {latency:7.1f}µs per call")
+
+                started = time.perf_counter()
+                rate, latency = self.run(batched, records, threads)
+                interaction_logger.flush(timeout=60)
+                drained = time.perf_counter() - started
+                self.stdout.write(
+                    f"  batched logger  : {rate:10.0f} records/s  {latency:7.1f}µs per call  "
+                    f"(on disk after {drained:.2f}s)"
+                )
+
+            interaction_logger.close()
+            self.stdout.write("\n" + "="*50)
+            self.stdout.write(self.style.SUCCESS(
+                f"Batched logger wrote {interaction_logger.written} records, dropped {interaction_logger.dropped}"
+            ))
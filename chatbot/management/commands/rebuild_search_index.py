@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from chatbot.search import is_available, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Repopulates the chat message search index from Message'
+
+    def handle(self, *args, **options):
+        if not is_available():
+            self.stdout.write(self.style.WARNING("The search index is only kept on SQLite; nothing to rebuild"))
+            return
+        indexed = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} messages"))
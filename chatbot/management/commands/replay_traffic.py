@@ -0,0 +1,171 @@
+import json
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, nullcontext
+from itertools import islice
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from chatbot.replay import (
+    CRISIS_INTENT, STAGES, Agreement, chunked, fingerprint, init_worker, percentile, read_corpus, replay_chunk,
+    stub_llm_settings,
+)
+
+LOGGED = 'logged'
+
+
+class Command(BaseCommand):
+    help = ('Replays recorded chat traffic through detect_intent, is_mental_health_related, generate_prompt '
+            'and optionally a stub LLM, reporting throughput, per-stage latency and label changes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help='JSONL (optionally .gz) or legacy .txt logs; defaults to the interaction logs')
+        parser.add_argument('--field', help='JSONL text field (default: the first of input/message/text/content/prompt)')
+        parser.add_argument('--limit', type=int, help='Stop after this many records')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes; 1 replays in this process')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--llm', action='store_true', help='Also send each prompt to the stub LLM backend')
+        parser.add_argument('--latency', type=float, default=0.0, help='Stub latency in seconds')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Stub latency jitter in seconds')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--save', help='Write the labels of this run as JSONL, to --compare a later run against')
+        parser.add_argument('--compare', help=f'Labels saved by --save, or "{LOGGED}" for the intents in the corpus')
+        parser.add_argument('--examples', type=int, default=10, help='Changed crisis messages to print')
+        parser.add_argument('--fail-on-crisis-change', action='store_true',
+                            help='Exit with an error if any message gains or loses the crisis intent')
+
+    def handle(self, *args, **options):
+        paths = [Path(path) for path in options['paths']] or [
+            path for path in (Path(settings.BASE_DIR) / 'interaction_log.jsonl',
+                              Path(settings.BASE_DIR) / 'interaction_log.txt')
+            if path.exists()
+        ]
+        missing = [str(path) for path in paths if not path.exists()]
+        if missing or not paths:
+            raise CommandError(f"No corpus to replay: {', '.join(missing) or 'no interaction logs found'}")
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--chunk-size and --workers must be at least 1")
+
+        records, corpus_stats = read_corpus(paths, options['field'])
+        if options['limit']:
+            records = islice(records, options['limit'])
+        llm_options = {'latency': options['latency'], 'jitter': options['jitter'], 'seed': options['seed']}
+
+        compare = options['compare']
+        agreement = Agreement(max_examples=options['examples']) if compare else None
+        intents = Counter()
+        mental_health = 0
+        timings = {stage: [] for stage in STAGES}
+
+        with ExitStack() as stack:
+            baseline = None
+            if compare and compare != LOGGED:
+                baseline = enumerate(map(json.loads, stack.enter_context(open(compare, encoding='utf-8'))))
+            saved = stack.enter_context(open(options['save'], 'w', encoding='utf-8')) if options['save'] else None
+
+            started = time.perf_counter()
+            chunks = chunked(records, options['chunk_size'])
+            for chunk, (labels, chunk_timings) in self.replay(chunks, options, llm_options):
+                for stage, values in chunk_timings.items():
+                    timings[stage].extend(values)
+                for (text, logged), (intent, topic) in zip(chunk, labels):
+                    intents[intent] += 1
+                    mental_health += topic
+                    if saved:
+                        record = {'fp': fingerprint(text), 'intent': intent, 'mental_health': topic}
+                        saved.write(json.dumps(record) + '\n')
+                    if baseline is not None:
+                        reference = self.next_baseline(baseline, text)
+                        agreement.add(text, reference['intent'], intent, reference['mental_health'], topic)
+                    elif compare and logged is not None:
+                        agreement.add(text, logged, intent)
+            wall = time.perf_counter() - started
+
+        self.report(sum(intents.values()), corpus_stats['skipped'], wall, options, timings, intents, mental_health)
+        if agreement is not None:
+            self.report_agreement(agreement, compare)
+            if agreement.crisis_changed and options['fail_on_crisis_change']:
+                raise CommandError("Crisis detection changed against the baseline")
+
+    def replay(self, chunks, options, llm_options):
+        """Yield (chunk, replay_chunk result) in corpus order, with a bounded number of chunks in flight."""
+        with_llm = options['llm']
+        if options['workers'] == 1:
+            stub = override_settings(LLM_BACKEND=stub_llm_settings(llm_options)) if with_llm else nullcontext()
+            with stub:
+                for chunk in chunks:
+                    yield chunk, replay_chunk([text for text, _ in chunk], with_llm)
+            return
+
+        # Forked workers must not share this process's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker,
+                                 initargs=(llm_options if with_llm else None,)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append((chunk, pool.submit(replay_chunk, [text for text, _ in chunk], with_llm)))
+                if len(pending) >= options['workers'] * 2:
+                    chunk, future = pending.popleft()
+                    yield chunk, future.result()
+            while pending:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+
+    def next_baseline(self, baseline, text):
+        try:
+            index, reference = next(baseline)
+        except StopIteration:
+            raise CommandError("The baseline has fewer records than the corpus")
+        if reference['fp'] != fingerprint(text):
+            raise CommandError(f"Record {index + 1} differs from the baseline; was it saved from another corpus?")
+        return reference
+
+    def report(self, total, skipped, wall, options, timings, intents, mental_health):
+        if not total:
+            raise CommandError(f"No records replayed ({skipped} lines skipped)")
+        self.stdout.write(
+            f"Replayed {total} records ({skipped} lines skipped) in {wall:.2f}s "
+            f"with {options['workers']} worker(s): {total / wall:,.0f} records/s"
+        )
+        self.stdout.write(f"\n{'Stage':26} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (µs)")
+        for stage, values in timings.items():
+            if values:
+                values.sort()
+                row = [percentile(values, fraction) * 1e6 for fraction in (0.5, 0.95, 0.99)] + [max(values) * 1e6]
+                self.stdout.write(f"{stage:26} " + " ".join(f"{value:9.1f}" for value in row))
+
+        self.stdout.write(f"\nMental health related: {mental_health} ({mental_health / total:.1%})")
+        for intent, count in intents.most_common():
+            self.stdout.write(f"  {intent:24} {count:8} ({count / total:.1%})")
+
+    def report_agreement(self, agreement, compare):
+        self.stdout.write("\n" + "="*50)
+        if not agreement.compared:
+            self.stdout.write(self.style.WARNING(f"No records carried a baseline label ({compare})"))
+            return
+        compared = agreement.compared
+        self.stdout.write(f"Against {compare}: {compared} records compared")
+        self.stdout.write(f"  intent agreement: {agreement.intent_matches / compared:.2%}")
+        if compare != LOGGED:
+            self.stdout.write(f"  mental health agreement: {agreement.topic_matches / compared:.2%}")
+        for (before, after), count in sorted(agreement.changes.items(), key=lambda item: -item[1])[:15]:
+            self.stdout.write(f"  {before} -> {after}: {count}")
+
+        for label, count, examples in (
+            ("no longer detected as crisis", agreement.crisis_lost_count, agreement.crisis_lost),
+            ("newly detected as crisis", agreement.crisis_gained_count, agreement.crisis_gained),
+        ):
+            if count:
+                self.stdout.write(self.style.WARNING(f"{count} messages {label}, e.g.:"))
+                for text in examples:
+                    self.stdout.write(f"    {text[:120]!r}")
+        if agreement.crisis_changed:
+            self.stdout.write(self.style.WARNING(f"{CRISIS_INTENT} labels changed"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"No {CRISIS_INTENT} labels changed"))
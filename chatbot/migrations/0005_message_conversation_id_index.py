@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='chatbot_msg_convo_id_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    # FTS5 mirror of Message.content for chatbot.search; other databases fall back to icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE chatbot_message_fts USING fts5("
+        "owner, content, tokenize = 'porter unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO chatbot_message_fts(rowid, owner, content) "
+        "SELECT m.id, 'u' || c.user_id, replace(replace(m.content, char(2), ''), char(3), '') "
+        "FROM chatbot_message m JOIN chatbot_conversation c ON c.id = m.conversation_id"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS chatbot_message_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_message_conversation_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
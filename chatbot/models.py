@@ -11,6 +11,9 @@ class Conversation(models.Model):
     ended_at = models.DateTimeField(null=True, blank=True)
     title = models.CharField(max_length=100, blank=True)
     is_active = models.BooleanField(default=True)
+    # Rolling summary of turns that no longer fit in the model's context window
+    summary = models.TextField(blank=True)
+    summarized_until = models.PositiveBigIntegerField(null=True, blank=True)  # last Message id folded in
 
     def __str__(self):
         return f"{self.user.username} - {self.started_at.strftime('%Y-%m-%d %H:%M')}"
@@ -22,9 +25,34 @@ class Message(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     intent_detected = models.CharField(max_length=50, blank=True)
 
+    class Meta:
+        # Backs newest-first paging within a conversation (id < cursor ORDER BY id DESC)
+        indexes = [models.Index(fields=["conversation", "id"], name="chatbot_msg_convo_id_idx")]
+
     def __str__(self):
         return f"{self.sender.upper()} @ {self.timestamp.strftime('%H:%M')} - {self.content[:30]}"
 
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied key for one chat submission, so a retried or
+    double-sent request gets the reply already computed instead of a second
+    user Message and LLM call. Keys live as long as their conversation.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=64)
+    user_message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='+')
+    # Set once the reply is saved; until then duplicates wait for it
+    reply = models.ForeignKey(Message, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["conversation", "key"], name="chatbot_idempotency_key_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.conversation_id})"
+
 class FlaggedMessage(models.Model):
     message = models.OneToOneField(Message, on_delete=models.CASCADE, related_name='flag')
     reason = models.CharField(max_length=100, default='crisis_intervention')
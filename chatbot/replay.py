@@ -0,0 +1,189 @@
+"""
+Offline replay of recorded chat traffic through the classification
+pipeline (see the replay_traffic command).
+
+Corpora are read as a stream: JSON Lines (interaction_log.jsonl and its
+gzipped rotations, or any file of objects with a text field) and the
+legacy interaction_log.txt format. Replay runs in chunks so a process pool
+can spread them across cores; each chunk comes back with the labels and
+per-stage timings of its records.
+"""
+import gzip
+import hashlib
+import json
+import re
+import time
+from array import array
+from pathlib import Path
+
+STAGES = ("detect_intent", "is_mental_health_related", "generate_prompt", "llm")
+CRISIS_INTENT = "crisis_intervention"
+
+# Tried in order when a JSONL record doesn't name its text field via --field
+TEXT_FIELDS = ("input", "message", "text", "content", "prompt")
+LABEL_FIELD = "intent"
+
+# [2025-07-04 17:11:03.577010] Intent: general_support | Input: ... | Response: ...
+LEGACY_LINE = re.compile(r"^\[[^\]]*\] Intent: (?P<intent>\S+) \| Input: (?P<input>.*?) \| Response: ")
+
+
+# -------- Corpus -------- #
+def _open(path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def read_corpus(paths, field=None):
+    """
+    Return (records, stats): `records` yields (text, logged intent or None)
+    for every usable line of `paths` in order, and stats["skipped"] counts
+    the lines that couldn't be parsed or carried no text.
+    """
+    stats = {"skipped": 0}
+
+    def records():
+        for path in map(Path, paths):
+            legacy = path.suffix == ".txt"
+            with _open(path) as lines:
+                for line in lines:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = _parse_legacy(line) if legacy else _parse_json(line, field)
+                    if record is None:
+                        stats["skipped"] += 1
+                    else:
+                        yield record
+
+    return records(), stats
+
+
+def _parse_legacy(line):
+    match = LEGACY_LINE.match(line)
+    return (match["input"], match["intent"]) if match else None
+
+
+def _parse_json(line, field):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict):
+        return None
+    fields = (field,) if field else TEXT_FIELDS
+    text = next((record[name] for name in fields if isinstance(record.get(name), str)), None)
+    if not text:
+        return None
+    label = record.get(LABEL_FIELD)
+    return text, label if isinstance(label, str) else None
+
+
+def chunked(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def fingerprint(text):
+    """Short digest used to check that a saved baseline was made from the same corpus."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+# -------- Workers -------- #
+def stub_llm_settings(options):
+    """LLM_BACKEND for the llm stage: the stub, without retries so its latency is what gets measured."""
+    return {"BACKEND": "chatbot.backends.StubBackend", "OPTIONS": options, "RESILIENCE": None}
+
+
+def init_worker(llm_options=None):
+    """
+    Process pool initializer. Spawned workers set Django up themselves;
+    forked ones already have it. With `llm_options`, the llm stage goes to
+    a StubBackend built from them.
+    """
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    if llm_options is not None:
+        from django.test.utils import override_settings
+
+        override_settings(LLM_BACKEND=stub_llm_settings(llm_options)).enable()
+
+
+def replay_chunk(texts, with_llm=False):
+    """
+    Run `texts` through the pipeline. Returns ([(intent, mental_health)],
+    {stage: array of seconds}); the llm stage is empty unless `with_llm`.
+    """
+    from chatbot import llm
+
+    labels = []
+    timings = {stage: array("d") for stage in STAGES}
+    clock = time.perf_counter
+    for text in texts:
+        started = clock()
+        intent = llm.detect_intent(text)
+        classified = clock()
+        mental_health = llm.is_mental_health_related(text)
+        checked = clock()
+        prompt = llm.generate_prompt(text, intent)
+        prompted = clock()
+        timings["detect_intent"].append(classified - started)
+        timings["is_mental_health_related"].append(checked - classified)
+        timings["generate_prompt"].append(prompted - checked)
+        if with_llm:
+            llm.query_llm(prompt)
+            timings["llm"].append(clock() - prompted)
+        labels.append((intent, mental_health))
+    return labels, timings
+
+
+# -------- Reporting -------- #
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Agreement:
+    """Label agreement between a baseline and the current classifier."""
+
+    def __init__(self, max_examples=20):
+        self.max_examples = max_examples
+        self.compared = 0
+        self.intent_matches = 0
+        self.topic_matches = 0
+        self.changes = {}  # (baseline intent, current intent) -> count
+        self.crisis_lost = []
+        self.crisis_gained = []
+        self.crisis_lost_count = 0
+        self.crisis_gained_count = 0
+
+    def add(self, text, baseline_intent, current_intent, baseline_topic=None, current_topic=None):
+        self.compared += 1
+        if baseline_intent == current_intent:
+            self.intent_matches += 1
+        else:
+            key = (baseline_intent, current_intent)
+            self.changes[key] = self.changes.get(key, 0) + 1
+            if baseline_intent == CRISIS_INTENT:
+                self.crisis_lost_count += 1
+                if len(self.crisis_lost) < self.max_examples:
+                    self.crisis_lost.append(text)
+            elif current_intent == CRISIS_INTENT:
+                self.crisis_gained_count += 1
+                if len(self.crisis_gained) < self.max_examples:
+                    self.crisis_gained.append(text)
+        if baseline_topic is None or baseline_topic == current_topic:
+            self.topic_matches += 1
+
+    @property
+    def crisis_changed(self):
+        return bool(self.crisis_lost_count or self.crisis_gained_count)
@@ -0,0 +1,254 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from chatbot.backends import BaseLLMBackend, LLMBackendError
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(LLMBackendError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+
+    After `failure_threshold` consecutive upstream failures the breaker opens
+    and every call fails fast for `reset_timeout` seconds. It then lets one
+    trial call through (half-open): success closes it, failure re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, on_change=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_change = on_change
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            if self.on_change:
+                self.on_change(state)
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError("LLM upstream circuit is open")
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    raise CircuitOpenError("LLM upstream circuit is half-open")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def release(self):
+        """End a call that neither succeeded nor failed upstream (e.g. a 400)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class UpstreamMetrics:
+    """
+    Counters and a latency reservoir for upstream LLM calls.
+
+    Listeners registered with `subscribe` are called as
+    ``listener(event, **fields)`` for "attempt", "retry", "failure",
+    "short_circuit" and "breaker" events.
+    """
+
+    def __init__(self, sample_size=2048):
+        self.latencies = deque(maxlen=sample_size)
+        self.counters = {"attempts": 0, "successes": 0, "failures": 0, "retries": 0, "short_circuits": 0}
+        self.breaker_state = CircuitBreaker.CLOSED
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def emit(self, event, **fields):
+        with self._lock:
+            if event == "attempt":
+                self.counters["attempts"] += 1
+                if fields.get("ok"):
+                    self.counters["successes"] += 1
+                    self.latencies.append(fields["latency"])
+            elif event == "retry":
+                self.counters["retries"] += 1
+            elif event == "failure":
+                self.counters["failures"] += 1
+            elif event == "short_circuit":
+                self.counters["short_circuits"] += 1
+            elif event == "breaker":
+                self.breaker_state = fields["state"]
+        for listener in self._listeners:
+            try:
+                listener(event, **fields)
+            except Exception:
+                logger.exception("LLM metrics listener failed")
+
+    def percentile(self, fraction):
+        with self._lock:
+            ordered = sorted(self.latencies)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def snapshot(self):
+        with self._lock:
+            data = dict(self.counters, breaker_state=self.breaker_state)
+        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            value = self.percentile(fraction)
+            data[f"latency_{name}_ms"] = round(value * 1000, 1) if value is not None else None
+        return data
+
+
+class ResilientBackend(BaseLLMBackend):
+    """
+    Wraps another backend with per-request deadlines, retries with jittered
+    exponential backoff on 429/5xx and transient errors, and a circuit breaker.
+
+    Each attempt gets `timeout=` set to what is left of the overall deadline,
+    so one request never holds a thread for longer than `deadline` seconds.
+    """
+
+    def __init__(self, backend, max_attempts=3, base_delay=0.5, max_delay=8.0, deadline=45.0,
+                 breaker_threshold=5, breaker_reset=30.0, metrics=None):
+        self.backend = backend
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.metrics = metrics or UpstreamMetrics()
+        self.breaker = CircuitBreaker(
+            breaker_threshold, breaker_reset,
+            on_change=lambda state: self.metrics.emit("breaker", state=state),
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def _backoff(self, attempt, error):
+        # Full jitter: uniform over [0, capped exponential]; honour Retry-After if sent
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if getattr(error, "retry_after", None):
+            delay = max(delay, error.retry_after)
+        return delay
+
+    def _attempts(self):
+        """Yield (attempt, remaining seconds) until attempts or the deadline run out."""
+        give_up_at = time.monotonic() + self.deadline
+        for attempt in range(self.max_attempts):
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                return
+            yield attempt, remaining
+
+    def _before(self):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.metrics.emit("short_circuit")
+            raise
+
+    def _failed(self, error, attempt, started, remaining):
+        """Record a failed attempt; return the backoff delay or re-raise."""
+        self.metrics.emit("attempt", ok=False, latency=time.monotonic() - started,
+                          status=getattr(error, "status_code", None))
+        if not isinstance(error, LLMBackendError) or not error.retryable:
+            self.breaker.release()
+            self.metrics.emit("failure", error=error)
+            raise error
+        self.breaker.record_failure()
+        delay = self._backoff(attempt, error)
+        remaining -= time.monotonic() - started
+        if attempt + 1 >= self.max_attempts or delay >= remaining or self.breaker.state == CircuitBreaker.OPEN:
+            self.metrics.emit("failure", error=error)
+            raise error
+        self.metrics.emit("retry", attempt=attempt + 1, delay=delay, status=error.status_code)
+        logger.warning(f"LLM upstream error ({error}); retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    def _succeeded(self, started):
+        self.breaker.record_success()
+        self.metrics.emit("attempt", ok=True, latency=time.monotonic() - started)
+
+    def complete(self, messages, **options):
+        error = LLMBackendError("LLM request deadline exceeded", transient=True)
+        for attempt, remaining in self._attempts():
+            self._before()
+            started = time.monotonic()
+            try:
+                result = self.backend.complete(messages, timeout=remaining, **options)
+            except Exception as exc:
+                error = exc
+                time.sleep(self._failed(exc, attempt, started, remaining))
+                continue
+            self._succeeded(started)
+            return result
+        self.metrics.emit("failure", error=error)
+        raise error
+
+    def stream(self, messages, **options):
+        # Retries are only possible until the first chunk has been delivered
+        error = LLMBackendError("LLM request deadline exceeded", transient=True)
+        for attempt, remaining in self._attempts():
+            self._before()
+            started = time.monotonic()
+            try:
+                chunks = self.backend.stream(messages, timeout=remaining, **options)
+                first = next(chunks, None)
+            except Exception as exc:
+                error = exc
+                time.sleep(self._failed(exc, attempt, started, remaining))
+                continue
+            break
+        else:
+            self.metrics.emit("failure", error=error)
+            raise error
+
+        recorded = False
+        try:
+            if first is not None:
+                yield first
+                yield from chunks
+            recorded = True
+            self._succeeded(started)
+        except LLMBackendError as exc:
+            recorded = True
+            self.breaker.record_failure()
+            self.metrics.emit("failure", error=exc)
+            raise
+        except Exception as exc:
+            self.metrics.emit("failure", error=exc)
+            raise
+        finally:
+            if not recorded:
+                # The client went away (GeneratorExit) or something other than the
+                # upstream failed: no verdict on the upstream, but a half-open
+                # trial must not stay claimed
+                self.breaker.release()
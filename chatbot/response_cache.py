@@ -0,0 +1,188 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+
+DEFAULT_RESPONSE_CACHE = {
+    "ENABLED": True,
+    "MAX_ENTRIES": 1024,
+    "TTL": 60 * 60,
+    # Cosine similarity (0-1) for the fuzzy tier; None keeps exact matches only
+    "SIMILARITY_THRESHOLD": None,
+    # How many recent entries per intent the fuzzy tier compares against
+    "SIMILARITY_CANDIDATES": 256,
+    "BYPASS_INTENTS": ["crisis_intervention"],
+    # Intents answered without the conversation history, so their replies are
+    # cached even mid-conversation; every other intent is cached only for a
+    # conversation's first message
+    "CONTEXT_FREE_INTENTS": ["gratitude"],
+}
+
+_NON_WORD = re.compile(r"[^\w\s']+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", text.lower())).strip()
+
+
+def ngram_vector(text, n=3):
+    """Character n-gram counts of `text`, L2-normalised, as a sparse dict."""
+    padded = f" {text} "
+    counts = Counter(padded[i:i + n] for i in range(len(padded) - n + 1))
+    norm = math.sqrt(sum(value * value for value in counts.values())) or 1.0
+    return {gram: value / norm for gram, value in counts.items()}
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(gram, 0.0) for gram, value in a.items())
+
+
+class _Entry:
+    __slots__ = ("response", "vector", "expires_at", "latency")
+
+    def __init__(self, response, vector, expires_at, latency):
+        self.response = response
+        self.vector = vector
+        self.expires_at = expires_at
+        self.latency = latency
+
+
+class ResponseCache:
+    """
+    In-process LRU + TTL cache of LLM replies keyed on (intent, prompt).
+
+    Exact lookups hit on the normalised prompt. When a similarity threshold
+    is configured, a miss falls back to the closest recent prompt with the
+    same intent by character-trigram cosine similarity. Intents in
+    `bypass_intents` are never read from or written to the cache. A reply
+    that saw earlier turns is only valid for that conversation, so the cache
+    is used mid-conversation just for `context_free_intents`.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, similarity_threshold=None,
+                 similarity_candidates=256, bypass_intents=("crisis_intervention",),
+                 context_free_intents=(), enabled=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.similarity_candidates = similarity_candidates
+        self.bypass_intents = frozenset(bypass_intents)
+        self.context_free_intents = frozenset(context_free_intents)
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @classmethod
+    def from_settings(cls):
+        config = {**DEFAULT_RESPONSE_CACHE, **getattr(settings, "CHATBOT_RESPONSE_CACHE", {})}
+        return cls(
+            max_entries=config["MAX_ENTRIES"],
+            ttl=config["TTL"],
+            similarity_threshold=config["SIMILARITY_THRESHOLD"],
+            similarity_candidates=config["SIMILARITY_CANDIDATES"],
+            bypass_intents=config["BYPASS_INTENTS"],
+            context_free_intents=config["CONTEXT_FREE_INTENTS"],
+            enabled=config["ENABLED"],
+        )
+
+    def reset_stats(self):
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_seconds = 0.0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _bypass(self, intent):
+        return not self.enabled or intent in self.bypass_intents
+
+    def is_context_free(self, intent):
+        return intent in self.context_free_intents
+
+    def get(self, intent, prompt, text=None):
+        """
+        Return the cached reply or None. `text` is what the similarity tier
+        compares (the raw user input); it defaults to the prompt itself.
+        """
+        if self._bypass(intent):
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        key = (intent, normalize(prompt))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                self.saved_seconds += entry.latency
+                return entry.response
+
+            if self.similarity_threshold is not None:
+                closest = self._closest(intent, ngram_vector(normalize(text or prompt)), now)
+                if closest is not None:
+                    entry = self._entries[closest]
+                    self._entries.move_to_end(closest)
+                    self.similar_hits += 1
+                    self.saved_seconds += entry.latency
+                    return entry.response
+
+            self.misses += 1
+            return None
+
+    def _closest(self, intent, vector, now):
+        best, best_score = None, self.similarity_threshold
+        checked = 0
+        # Most recently used first; the hot set is where repeats come from
+        for key, entry in reversed(self._entries.items()):
+            if key[0] != intent or entry.expires_at <= now:
+                continue
+            score = cosine(vector, entry.vector)
+            if score >= best_score:
+                best, best_score = key, score
+            checked += 1
+            if checked >= self.similarity_candidates:
+                break
+        return best
+
+    def set(self, intent, prompt, response, latency=0.0, text=None):
+        if self._bypass(intent):
+            return
+        key = (intent, normalize(prompt))
+        vector = None
+        if self.similarity_threshold is not None:
+            vector = ngram_vector(normalize(text or prompt))
+        with self._lock:
+            self._entries[key] = _Entry(response, vector, time.monotonic() + self.ttl, latency)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
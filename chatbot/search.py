@@ -0,0 +1,189 @@
+"""
+Full-text search over a user's own chatbot messages.
+
+On SQLite, Message content is mirrored into an FTS5 table keyed by message
+id (created by chatbot migration 0006). The owning user is stored as an
+indexed token ("u<id>") next to the content, so a query intersects the
+search terms with that user's postings instead of filtering every match
+in the table. chatbot.signals keeps the
+index in step with Message saves and deletes; writes that skip signals
+(bulk_create, raw SQL) need `python manage.py rebuild_search_index`.
+
+Other databases fall back to an icontains scan.
+"""
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Conversation, Message
+
+TABLE = "chatbot_message_fts"
+
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 50
+MAX_SEARCH_OFFSET = 200
+# Only this many of a user's newest matches are ranked, which bounds the cost
+# of a query by what one user has written rather than by the table size
+MAX_CANDIDATES = 500
+MAX_QUERY_TERMS = 8
+SNIPPET_WORDS = 24
+BM25_K1, BM25_B = 1.2, 0.75
+
+# highlight() wraps matches in these; they're swapped for <mark> after escaping
+_OPEN, _CLOSE = "\x02", "\x03"
+_QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+_WORD = re.compile(r"\w+")
+
+
+def is_available():
+    return connection.vendor == "sqlite"
+
+
+def owner_token(user_id):
+    return f"u{user_id}"
+
+
+# -------- Index maintenance -------- #
+def _fill():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {TABLE}(rowid, owner, content) "
+            f"SELECT m.id, 'u' || c.user_id, replace(replace(m.content, char(2), ''), char(3), '') "
+            f"FROM chatbot_message m JOIN chatbot_conversation c ON c.id = m.conversation_id"
+        )
+        return cursor.rowcount
+
+
+def rebuild():
+    """Repopulate the index from Message. Returns how many messages were indexed."""
+    if not is_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        indexed = _fill()
+        # Merge the b-tree segments left by the bulk insert
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def index_message(message):
+    if not is_available():
+        return
+    if Message.conversation.is_cached(message):
+        user_id = message.conversation.user_id
+    else:
+        user_id = Conversation.objects.values_list("user_id", flat=True).get(pk=message.conversation_id)
+    content = message.content.replace(_OPEN, "").replace(_CLOSE, "")
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [message.pk])
+        cursor.execute(
+            f"INSERT INTO {TABLE}(rowid, owner, content) VALUES (%s, %s, %s)",
+            [message.pk, owner_token(user_id), content],
+        )
+
+
+def unindex_message(message_id):
+    if is_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [message_id])
+
+
+# -------- Queries -------- #
+def parse_query(text):
+    """
+    Turn what the user typed into a safe FTS5 expression: words are ANDed,
+    "quoted text" is a phrase, and everything else (operators, column
+    filters, punctuation) is dropped. Returns None if nothing searchable is left.
+    """
+    parts = []
+    for phrase, word in _QUERY_PART.findall(text or ""):
+        words = _WORD.findall(phrase or word)
+        if words:
+            parts.append('"' + " ".join(words) + '"')
+        if len(parts) >= MAX_QUERY_TERMS:
+            break
+    return " ".join(parts) or None
+
+
+def _highlight(marked):
+    return mark_safe(escape(marked).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>"))
+
+
+def _score(marked, average_length):
+    """BM25 term-frequency saturation; every candidate contains every term, so IDF can't reorder them."""
+    matches = marked.count(_OPEN)
+    length = len(marked.split()) / average_length
+    return matches * (BM25_K1 + 1) / (matches + BM25_K1 * (1 - BM25_B + BM25_B * length))
+
+
+def _snippet(marked):
+    """About SNIPPET_WORDS words of `marked` starting shortly before its first match."""
+    words = marked.split()
+    first = next((i for i, word in enumerate(words) if _OPEN in word), 0)
+    start = max(0, min(first - SNIPPET_WORDS // 4, len(words) - SNIPPET_WORDS))
+    text = " ".join(words[start:start + SNIPPET_WORDS])
+    if text.count(_OPEN) > text.count(_CLOSE):
+        text += _CLOSE  # cut inside a matched phrase
+    return ("… " if start else "") + text + (" …" if start + SNIPPET_WORDS < len(words) else "")
+
+
+def _candidates(user, expression):
+    """(message id, content with matches wrapped in _OPEN/_CLOSE) for the user's newest matches."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, highlight({TABLE}, 1, char(2), char(3)) FROM {TABLE} "
+            f"WHERE {TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s",
+            [f'owner : "{owner_token(user.pk)}" AND content : ({expression})', MAX_CANDIDATES],
+        )
+        return cursor.fetchall()
+
+
+def _scan_candidates(user, text):
+    words = [phrase or word for phrase, word in _QUERY_PART.findall(text)][:MAX_QUERY_TERMS]
+    rows = Message.objects.filter(conversation__user=user)
+    for word in words:
+        rows = rows.filter(content__icontains=word)
+    pattern = re.compile("|".join(re.escape(word) for word in words), re.IGNORECASE)
+    return [
+        (message_id, pattern.sub(lambda match: f"{_OPEN}{match.group()}{_CLOSE}", content))
+        for message_id, content in rows.order_by("-id").values_list("id", "content")[:MAX_CANDIDATES]
+    ]
+
+
+def search(user, text, limit=SEARCH_PAGE_SIZE, offset=0):
+    """
+    Best matches first among `user`'s newest MAX_CANDIDATES matching
+    messages. Returns dicts with the message, its conversation and an
+    HTML-safe snippet with <mark>ed matches.
+    """
+    expression = parse_query(text)
+    if expression is None:
+        return []
+    candidates = _candidates(user, expression) if is_available() else _scan_candidates(user, text)
+    if not candidates:
+        return []
+
+    # Ranked here rather than with FTS5's bm25(), whose IDF lookup walks each
+    # term's postings across every user's messages on every query
+    average_length = sum(len(marked.split()) for _, marked in candidates) / len(candidates) or 1
+    # sorted() is stable, so ties stay newest first
+    page = sorted(candidates, key=lambda hit: _score(hit[1], average_length), reverse=True)[offset:offset + limit]
+
+    # Re-checks ownership, and drops rows whose message is already gone
+    found = Message.objects.select_related("conversation").filter(conversation__user=user).in_bulk(
+        [message_id for message_id, _ in page]
+    )
+    return [
+        {
+            "message_id": message_id,
+            "conversation_id": found[message_id].conversation_id,
+            "conversation_title": found[message_id].conversation.title,
+            "sender": found[message_id].sender,
+            "timestamp": found[message_id].timestamp,
+            "snippet": _highlight(_snippet(marked)),
+        }
+        for message_id, marked in page
+        if message_id in found
+    ]
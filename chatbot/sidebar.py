@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Value, When
+from django.utils.timezone import localtime, now
+
+from chatbot.models import Conversation
+
+# Sidebar and history page group conversations the same way, newest first
+BUCKETS = ("Today", "Yesterday", "Last 7 Days", "Last Month", "Older")
+
+# Upper bound on staleness if an invalidation is missed (e.g. a raw update)
+SIDEBAR_CACHE_TIMEOUT = getattr(settings, "CHAT_SIDEBAR_CACHE_TIMEOUT", 60 * 15)
+
+
+def _cache_key(user_id, today):
+    # Keyed by local date too, so buckets roll over at midnight without a purge
+    return f"chatbot:sidebar:{user_id}:{today.isoformat()}"
+
+
+def _bucket_expression(midnight):
+    return Case(
+        When(started_at__gte=midnight, then=Value("Today")),
+        When(started_at__gte=midnight - timedelta(days=1), then=Value("Yesterday")),
+        When(started_at__gte=midnight - timedelta(days=7), then=Value("Last 7 Days")),
+        When(started_at__gte=midnight - timedelta(days=30), then=Value("Last Month")),
+        default=Value("Older"),
+        output_field=CharField(),
+    )
+
+
+def grouped_sessions(user):
+    """
+    Return {bucket label: [{"id", "title", "started_at"}, ...]} for the
+    user's conversations, in BUCKETS order with empty buckets left out.
+
+    Built from one query with the bucket computed in SQL, and cached per
+    user until a conversation is created, renamed or deleted.
+    """
+    midnight = localtime(now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    key = _cache_key(user.pk, midnight.date())
+    grouped = cache.get(key)
+    if grouped is not None:
+        return grouped
+
+    rows = (
+        Conversation.objects.filter(user=user)
+        .annotate(bucket=_bucket_expression(midnight))
+        .order_by("-started_at")
+        .values("id", "title", "started_at", "bucket")
+    )
+    grouped = {label: [] for label in BUCKETS}
+    for row in rows:
+        grouped[row.pop("bucket")].append(row)
+    grouped = {label: sessions for label, sessions in grouped.items() if sessions}
+
+    cache.set(key, grouped, SIDEBAR_CACHE_TIMEOUT)
+    return grouped
+
+
+def invalidate_sidebar(user_id):
+    cache.delete(_cache_key(user_id, localtime(now()).date()))
@@ -1,19 +1,27 @@
-
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import FlaggedMessage
-from users.models import Notification
-from django.contrib.auth import get_user_model
+from .models import Conversation, Message
+from . import search
+from users.fragments import CONVERSATIONS, touch_fragments
+from .sidebar import invalidate_sidebar
+
+
+@receiver(post_save, sender=Conversation)
+@receiver(post_delete, sender=Conversation)
+def invalidate_sidebar_cache(sender, instance, **kwargs):
+    # Covers start_chat, rename_chat, delete_chat and admin edits alike,
+    # for the chat sidebar and the dashboard's recent conversations panel
+    invalidate_sidebar(instance.user_id)
+    touch_fragments(CONVERSATIONS, [instance.user_id])
+
+
+@receiver(post_save, sender=Message)
+def index_message(sender, instance, created, update_fields=None, **kwargs):
+    # Messages are written once; only a change to their content needs reindexing
+    if created or update_fields is None or "content" in update_fields:
+        search.index_message(instance)
 
-User = get_user_model()
 
-@receiver(post_save, sender=FlaggedMessage)
-def notify_admin_on_flag(sender, instance, created, **kwargs):
-    if created:
-        admins = User.objects.filter(is_staff=True)
-        for admin in admins:
-            Notification.objects.create(
-                recipient=admin,
-                message=f"A message was flagged: \"{instance.message.content[:50]}\"",
-                link=f"/admin/chat/with-user/{instance.message.sender.id}/"
-            )
+@receiver(post_delete, sender=Message)
+def unindex_message(sender, instance, **kwargs):
+    search.unindex_message(instance.pk)
@@ -0,0 +1,102 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import send_mail
+from django.db import transaction
+from django.urls import reverse
+
+from jobs.queue import enqueue, task
+from users.notifications import notify
+from . import crisis
+from .admission import priority_for
+from .context import CONTEXT_BUILDER
+from .events import publish_chat_messages
+from .models import Conversation, FlaggedMessage, Message
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+CRISIS_PRIORITY = 10
+
+
+@task("chatbot.escalate_crisis")
+def escalate_crisis(flag_id):
+    """Notify every staff member about a flagged message, then queue the admin email."""
+    try:
+        flag = FlaggedMessage.objects.select_related("message__conversation__user").get(id=flag_id)
+    except FlaggedMessage.DoesNotExist:
+        logger.warning(f"Flagged message {flag_id} was deleted before escalation")
+        return
+
+    link = reverse("admin:chatbot_flaggedmessage_change", args=[flag.id])
+    text = f"A message was flagged: \"{flag.message.content[:50]}\""
+    with transaction.atomic():
+        notify(User.objects.filter(is_staff=True, is_active=True).values_list("id", flat=True), text, link)
+        # Separate job so SMTP retries never repeat the fan-out
+        enqueue("chatbot.send_crisis_email", {"flag_id": flag.id}, priority=CRISIS_PRIORITY)
+
+
+@task("chatbot.send_crisis_email")
+def send_crisis_email(flag_id):
+    flag = FlaggedMessage.objects.select_related("message__conversation__user").filter(id=flag_id).first()
+    if flag is None:
+        return
+    admin_email = getattr(settings, 'ADMIN_EMAIL', 'admin@mindcare.ng')
+    # Raises on SMTP failure so the queue retries it
+    send_mail(
+        subject="🚨 Crisis Message Detected",
+        message=f"A user sent a message flagged for crisis:\n\n{flag.message.content}\n\n"
+                f"From user: {flag.message.conversation.user.username}",
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[admin_email],
+        fail_silently=False
+    )
+
+
+@task("chatbot.compact_conversation")
+def compact_conversation(conversation_id):
+    """Fold turns evicted from conversation `conversation_id`'s window into its summary, off the request path."""
+    convo = Conversation.objects.filter(id=conversation_id).first()
+    if convo is not None:
+        CONTEXT_BUILDER.compact(convo)
+
+
+@task("chatbot.crisis_follow_up")
+def crisis_follow_up(message_id):
+    """
+    Append a model-written follow-up to the safety message already sent for
+    crisis message `message_id`. The LLM call runs outside any transaction;
+    only the insert takes the write lock.
+    """
+    # Imported here: chatbot.llm loads intents.json, and tasks are imported at startup
+    from .llm import FALLBACK_RESPONSE, query_llm
+
+    user_msg = Message.objects.select_related("conversation").filter(id=message_id).first()
+    if user_msg is None:
+        return
+    if crisis.follow_up_expired(user_msg):
+        logger.warning(f"Dropping the crisis follow-up for message {message_id}: the worker got to it too late")
+        return
+
+    convo = user_msg.conversation
+    context = CONTEXT_BUILDER.build(convo, before_id=user_msg.id)
+    # Never shared: each crisis gets its own follow-up. If the call is shed the
+    # job fails and the queue retries it, until follow_up_expired.
+    reply = query_llm(crisis.follow_up_prompt(user_msg.content), context, coalesce=False,
+                      user_id=convo.user_id, priority=priority_for(crisis.CRISIS_INTENT))
+    if reply == FALLBACK_RESPONSE:
+        # The student already has the helplines; an error message after them helps nobody
+        logger.warning(f"No crisis follow-up for message {message_id}: the LLM request failed")
+        return
+
+    with transaction.atomic():
+        bot_msg = Message.objects.create(
+            conversation=convo, sender="bot", content=reply, intent_detected=crisis.CRISIS_INTENT,
+        )
+        publish_chat_messages(convo.user_id, convo.id, [bot_msg])
+    try:
+        CONTEXT_BUILDER.compact(convo)
+    except Exception as e:
+        logger.error(f"Context compaction failed for conversation {convo.id}: {e}")
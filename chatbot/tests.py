@@ -1,17 +1,1054 @@
-from django.test import TestCase
-from .models import YourModel  # Replace with your actual model
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-class YourModelTestCase(TestCase):
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import localtime, now
+
+from jobs.models import Job
+from jobs.queue import run_next
+from users.models import CustomUser
+from .admission import LocalScheduler, Overloaded, SQLiteScheduler, get_scheduler, priority_for
+from .backends import BaseLLMBackend, LLMBackendError, StubBackend, get_backend
+from .context import CONTEXT_BUILDER, ContextBuilder
+from .interaction_log import InteractionLogger, _close_all
+from .llm import (
+    INTENT_KEYWORDS, IN_FLIGHT, RESPONSE_CACHE, chatbot_response, detect_intent, is_mental_health_related, query_llm,
+)
+from .models import Conversation, IdempotencyKey, Message
+from .resilience import CircuitBreaker, ResilientBackend
+from . import search
+from .response_cache import ResponseCache
+from .sidebar import BUCKETS, grouped_sessions
+from .singleflight import SingleFlight
+from .tasks import crisis_follow_up
+
+# Test chats go to a scratch interaction log, not the real one and its lock file,
+# and test users aren't sent to fill in their profile first (see middleware.tests)
+LOG_DIR = tempfile.TemporaryDirectory()
+TEST_SETTINGS = override_settings(
+    INTERACTION_LOG={"PATH": Path(LOG_DIR.name) / "interaction_log.jsonl"},
+    PROFILE_GATE={"PROTECTED_PREFIXES": []},
+)
+
+
+def setUpModule():
+    TEST_SETTINGS.enable()
+
+
+def tearDownModule():
+    TEST_SETTINGS.disable()
+    LOG_DIR.cleanup()
+
+
+# Slow enough that every thread arrives while the first call is still upstream
+SLOW_STUB = {"BACKEND": "chatbot.backends.StubBackend", "OPTIONS": {"latency": 0.3}, "RESILIENCE": None}
+CONCURRENCY = 8
+
+
+def run_together(func, *args_list):
+    """Call func(*args) for every args in `args_list` at once; returns the results in order."""
+    barrier = threading.Barrier(len(args_list))
+
+    def call(args):
+        barrier.wait()
+        try:
+            return func(*args)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(len(args_list)) as pool:
+        return list(pool.map(call, args_list))
+
+
+def substring_intent(text):
+    """The matcher detect_intent replaced: first intent with a keyword anywhere in the text."""
+    text = text.lower()
+    for intent, keywords in INTENT_KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return intent
+    return "general_support"
+
+
+class CrisisDetectionTests(SimpleTestCase):
+    # Typed punctuation, typographic quotes, emoji and unusual spaces around a phrase
+    VARIANTS = [
+        "{}", "I {}", "{}.", "{}!!", "{}?", "{}’", "‘{}’", "“{}”", "{}…", "{}—please", "{} – now",
+        "{}😢", "😭{}", "{}\u00a0now", "now\u2003{}", "{}\n", "({})", "{},", "{}\u200b", "{}:(",
+        "{}_",
+    ]
+
+    def test_crisis_phrases_in_any_punctuation(self):
+        for keyword in INTENT_KEYWORDS["crisis_intervention"]:
+            for variant in self.VARIANTS:
+                for phrase in (keyword, keyword.upper(), keyword.title()):
+                    text = variant.format(phrase)
+                    with self.subTest(text=text):
+                        self.assertEqual(substring_intent(text), "crisis_intervention")
+                        self.assertEqual(detect_intent(text), "crisis_intervention")
+
+    def test_compatibility_forms_are_normalised(self):
+        for text in ("ｓｕｉｃｉｄｅ", "ＳＵＩＣＩＤＥ!", "I want to ｋｉｌｌ ｍｙｓｅｌｆ", "I want to ᵈⁱᵉ"):
+            with self.subTest(text=text):
+                self.assertEqual(detect_intent(text), "crisis_intervention")
+
+    def test_contractions_match_with_any_apostrophe(self):
+        self.assertFalse(is_mental_health_related("I can concentrate"))
+        for text in ("I can't concentrate", "I can’t concentrate", "I CAN‘T CONCENTRATE", "i canʼt concentrate"):
+            with self.subTest(text=text):
+                self.assertTrue(is_mental_health_related(text))
+
+
+class BackendSelectionTests(SimpleTestCase):
+    @override_settings(LLM_BACKEND={"BACKEND": "chatbot.backends.StubBackend", "OPTIONS": {"reply_words": 10},
+                                    "RESILIENCE": None})
+    def test_backend_comes_from_settings(self):
+        backend = get_backend()
+        self.assertIsInstance(backend, StubBackend)
+        self.assertEqual(backend.reply_words, 10)
+        # Built once, rebuilt when the setting changes
+        self.assertIs(get_backend(), backend)
+        with self.settings(LLM_BACKEND={"BACKEND": "chatbot.backends.StubBackend",
+                                        "RESILIENCE": {"max_attempts": 2}}):
+            wrapped = get_backend()
+            self.assertIsInstance(wrapped, ResilientBackend)
+            self.assertIsInstance(wrapped.backend, StubBackend)
+            self.assertEqual(wrapped.max_attempts, 2)
+
+    def test_stub_streams_its_completion_in_chunks(self):
+        backend = StubBackend(chunk_size=4, reply_words=10, seed=1)
+        messages = [{"role": "user", "content": "How do I manage exam stress?"}]
+        chunks = list(backend.stream(messages))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual("".join(chunks), backend.complete(messages))
+        self.assertEqual(backend.calls, 2)
+
+    def test_stub_injects_failures_mid_stream(self):
+        backend = StubBackend(failure_rate=1.0, chunk_size=4, reply_words=20)
+        chunks = backend.stream([{"role": "user", "content": "Hi"}])
+        next(chunks)
+        with self.assertRaises(LLMBackendError):
+            list(chunks)
+
+
+class BrokenStreamBackend(BaseLLMBackend):
+    """Streams one chunk, then raises `error` (if any)."""
+
+    def __init__(self, error=None):
+        self.error = error
+
+    def stream(self, messages, **options):
+        yield "Hello"
+        if self.error:
+            raise self.error
+        yield " there"
+
+
+class ResilientStreamTests(SimpleTestCase):
+    def half_open(self, backend):
+        resilient = ResilientBackend(backend, breaker_threshold=1, breaker_reset=0)
+        resilient.breaker.record_failure()
+        return resilient
+
+    def assertTrialFree(self, resilient):
+        # Another caller can take the half-open trial
+        resilient.breaker.before_call()
+        self.assertEqual(resilient.breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_abandoned_stream_releases_the_trial(self):
+        resilient = self.half_open(BrokenStreamBackend())
+        chunks = resilient.stream([])
+        self.assertEqual(next(chunks), "Hello")
+        chunks.close()
+        self.assertTrialFree(resilient)
+
+    def test_non_upstream_error_releases_the_trial(self):
+        resilient = self.half_open(BrokenStreamBackend(RuntimeError("bug")))
+        with self.assertRaises(RuntimeError):
+            list(resilient.stream([]))
+        self.assertTrialFree(resilient)
+        self.assertEqual(resilient.metrics.snapshot()["failures"], 1)
+
+    def test_upstream_error_mid_stream_reopens(self):
+        resilient = self.half_open(BrokenStreamBackend(LLMBackendError("reset", transient=True)))
+        with self.assertRaises(LLMBackendError):
+            list(resilient.stream([]))
+        self.assertEqual(resilient.breaker.state, CircuitBreaker.OPEN)
+
+    def test_finished_stream_closes(self):
+        resilient = self.half_open(BrokenStreamBackend())
+        self.assertEqual("".join(resilient.stream([])), "Hello there")
+        self.assertEqual(resilient.breaker.state, CircuitBreaker.CLOSED)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_one_run(self):
+        flight = SingleFlight()
+        runs = []
+        release = threading.Event()
+
+        def work():
+            runs.append(1)
+            release.wait(5)
+            return "reply"
+
+        def call():
+            return flight.do("key", work)
+
+        with ThreadPoolExecutor(CONCURRENCY) as pool:
+            futures = [pool.submit(call) for _ in range(CONCURRENCY)]
+            while flight.stats()["shared"] < CONCURRENCY - 1:
+                threading.Event().wait(0.01)
+            release.set()
+            results = [future.result(5) for future in futures]
+
+        self.assertEqual(len(runs), 1)
+        self.assertEqual({result for result, _ in results}, {"reply"})
+        self.assertEqual(sum(shared for _, shared in results), CONCURRENCY - 1)
+        self.assertEqual(flight.stats(), {"in_flight": 0, "executed": 1, "shared": CONCURRENCY - 1})
+
+    def test_followers_get_the_leaders_error(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise RuntimeError("upstream down")
+
+        with ThreadPoolExecutor(2) as pool:
+            leader = pool.submit(flight.do, "key", fail)
+            started.wait(5)
+            follower = pool.submit(flight.do, "key", fail)
+            while flight.stats()["shared"] < 1:
+                threading.Event().wait(0.01)
+            release.set()
+            for future in (leader, follower):
+                with self.assertRaisesMessage(RuntimeError, "upstream down"):
+                    future.result(5)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_later_calls_run_again(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("key", lambda: 1), (1, False))
+        self.assertEqual(flight.do("key", lambda: 2), (2, False))
+
+
+class InteractionLoggerTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "log.jsonl"
+
+    def read(self):
+        return [json.loads(line) for line in self.path.read_text(encoding="utf-8").splitlines()]
+
+    def test_records_are_written_by_the_worker_thread(self):
+        interaction_logger = InteractionLogger(self.path, flush_interval=60)
+        self.addCleanup(interaction_logger.close)
+        writers = []
+        write = interaction_logger._write
+
+        def record_thread(batch):
+            writers.append(threading.current_thread().name)
+            write(batch)
+
+        with mock.patch.object(interaction_logger, "_write", side_effect=record_thread):
+            for i in range(3):
+                interaction_logger.log(intent="general_support", input=f"message {i}", response="ok")
+            interaction_logger.flush()
+
+        self.assertEqual(writers, ["interaction-logger"])
+        self.assertEqual([record["input"] for record in self.read()], ["message 0", "message 1", "message 2"])
+        self.assertTrue(all("ts" in record for record in self.read()))
+        self.assertEqual(interaction_logger.written, 3)
+
+    def test_full_queue_drops_and_counts(self):
+        interaction_logger = InteractionLogger(self.path, batch_size=1, queue_size=1)
+        self.addCleanup(interaction_logger.close)
+        writing = threading.Event()
+        release = threading.Event()
+        write = interaction_logger._write
+
+        def blocked_write(batch):
+            writing.set()
+            release.wait(5)
+            write(batch)
+
+        with mock.patch.object(interaction_logger, "_write", side_effect=blocked_write):
+            interaction_logger.log(input="first")
+            writing.wait(5)
+            interaction_logger.log(input="queued")
+            interaction_logger.log(input="dropped")
+            release.set()
+            interaction_logger.flush()
+
+        self.assertEqual(interaction_logger.dropped, 1)
+        self.assertEqual([record["input"] for record in self.read()], ["first", "queued"])
+
+    def test_exit_hook_drains_every_logger(self):
+        interaction_logger = InteractionLogger(self.path, flush_interval=60)
+        interaction_logger.log(input="last words")
+        _close_all()
+        self.assertEqual([record["input"] for record in self.read()], ["last words"])
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def test_exact_hit_ignores_case_and_punctuation(self):
+        cache = ResponseCache()
+        cache.set("stress_management", "How do I cope with exams?", "Breathe")
+        self.assertEqual(cache.get("stress_management", "how do i cope with   exams"), "Breathe")
+        self.assertIsNone(cache.get("sleep_issues", "How do I cope with exams?"))
+        self.assertEqual(cache.stats()["exact_hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    @mock.patch("chatbot.response_cache.time.monotonic")
+    def test_entries_expire_after_ttl(self, monotonic):
+        cache = ResponseCache(ttl=60)
+        monotonic.return_value = 100.0
+        cache.set("stress_management", "prompt", "reply")
+
+        monotonic.return_value = 159.0
+        self.assertEqual(cache.get("stress_management", "prompt"), "reply")
+        monotonic.return_value = 160.0
+        self.assertIsNone(cache.get("stress_management", "prompt"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ResponseCache(max_entries=2)
+        cache.set("general_support", "first", "1")
+        cache.set("general_support", "second", "2")
+        cache.get("general_support", "first")
+        cache.set("general_support", "third", "3")
+
+        self.assertIsNone(cache.get("general_support", "second"))
+        self.assertEqual(cache.get("general_support", "first"), "1")
+        self.assertEqual(cache.get("general_support", "third"), "3")
+
+    def test_bypassed_intents_are_never_cached(self):
+        cache = ResponseCache()
+        cache.set("crisis_intervention", "prompt", "reply")
+        self.assertIsNone(cache.get("crisis_intervention", "prompt"))
+        self.assertEqual(cache.stats()["bypassed"], 1)
+
+
+@override_settings(LLM_BACKEND={**SLOW_STUB, "OPTIONS": {}})
+class CachedReplyTests(SimpleTestCase):
+    history = [{"role": "user", "content": "I failed a test"}, {"role": "assistant", "content": "I'm sorry"}]
+
+    def setUp(self):
+        get_backend.cache_clear()
+        RESPONSE_CACHE.clear()
+
+    def test_first_message_replies_are_shared(self):
+        first = chatbot_response("How do I manage stress before exams?")
+        self.assertEqual(chatbot_response("How do I manage stress before exams?"), first)
+        self.assertEqual(get_backend().calls, 1)
+
+    def test_context_free_intents_hit_the_cache_mid_conversation(self):
+        self.assertEqual(detect_intent("Thank you, I appreciate it"), "gratitude")
+        first = chatbot_response("Thank you, I appreciate it", conversation_context=self.history)
+        second = chatbot_response("Thank you, I appreciate it", conversation_context=[])
+        self.assertEqual(first, second)
+        self.assertEqual(get_backend().calls, 1)
+
+    def test_replies_that_saw_history_are_not_cached(self):
+        chatbot_response("How do I manage stress before exams?", conversation_context=self.history)
+        chatbot_response("How do I manage stress before exams?", conversation_context=self.history)
+        self.assertEqual(get_backend().calls, 2)
+
+
+@override_settings(LLM_BACKEND=SLOW_STUB)
+class QueryCoalescingTests(SimpleTestCase):
+    def setUp(self):
+        get_backend.cache_clear()
+        get_backend()  # built before the threads start, so they all count on one instance
+
+    def test_identical_concurrent_prompts_make_one_upstream_call(self):
+        replies = run_together(query_llm, *[("How do I cope with exam stress?",)] * CONCURRENCY)
+        self.assertEqual(get_backend().calls, 1)
+        self.assertEqual(len(set(replies)), 1)
+
+    def test_different_prompts_are_not_coalesced(self):
+        run_together(query_llm, *[(f"Question {i}",) for i in range(CONCURRENCY)])
+        self.assertEqual(get_backend().calls, CONCURRENCY)
+
+    def test_different_history_is_not_coalesced(self):
+        history = [{"role": "user", "content": "I failed a test"}]
+        run_together(query_llm, ("What now?",), ("What now?", history))
+        self.assertEqual(get_backend().calls, 2)
+
+    def test_coalescing_can_be_turned_off(self):
+        run_together(query_llm, *[("Same prompt", None, False)] * CONCURRENCY)
+        self.assertEqual(get_backend().calls, CONCURRENCY)
+        self.assertEqual(IN_FLIGHT.stats()["in_flight"], 0)
+
+
+class ChatSubmissionMixin:
+    def setUp(self):
+        get_backend.cache_clear()
+        get_backend()
+        RESPONSE_CACHE.clear()
+        self.user = CustomUser.objects.create_user("210591032", password="pw")
+        self.convo = Conversation.objects.create(user=self.user, title="Chat")
+        self.url = reverse("ajax_chat_reply", args=[self.convo.id])
+
+    def post(self, message, key=None, client=None):
+        client = client or self.client
+        headers = {"Idempotency-Key": key} if key is not None else {}
+        return client.post(self.url, {"message": message}, headers=headers)
+
+
+@override_settings(LLM_BACKEND=SLOW_STUB)
+class IdempotencyKeyTests(ChatSubmissionMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_resent_message_replays_the_original_reply(self):
+        first = self.post("I can't sleep before exams", key="k1").json()
+        second = self.post("I can't sleep before exams", key="k1").json()
+
+        self.assertEqual(second["bot_response"], first["bot_response"])
+        self.assertTrue(second["replayed"])
+        self.assertNotIn("replayed", first)
+        self.assertEqual(get_backend().calls, 1)
+        self.assertEqual(Message.objects.filter(conversation=self.convo, sender="user").count(), 1)
+        self.assertEqual(Message.objects.filter(conversation=self.convo, sender="bot").count(), 1)
+
+    def test_key_reused_for_another_message_is_rejected(self):
+        self.post("I can't sleep before exams", key="k1")
+        response = self.post("Something else", key="k1")
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Message.objects.filter(conversation=self.convo, sender="user").count(), 1)
+
+    def test_keys_are_per_conversation(self):
+        other = Conversation.objects.create(user=self.user, title="Other")
+        self.post("I can't sleep before exams", key="k1")
+        response = self.client.post(
+            reverse("ajax_chat_reply", args=[other.id]), {"message": "I can't sleep before exams"},
+            headers={"Idempotency-Key": "k1"},
+        )
+        self.assertNotIn("replayed", response.json())
+        self.assertEqual(IdempotencyKey.objects.count(), 2)
+
+    def test_reply_not_saved_yet_is_a_conflict(self):
+        user_msg = Message.objects.create(conversation=self.convo, sender="user", content="Hello")
+        IdempotencyKey.objects.create(conversation=self.convo, key="k1", user_message=user_msg)
+        with self.settings(CHAT_IDEMPOTENCY_WAIT=0):
+            response = self.post("Hello", key="k1")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Retry-After"], "1")
+
+    def test_invalid_key(self):
+        response = self.post("Hello", key="x" * 65)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Message.objects.exists())
+
+    def test_without_a_key_every_request_is_new(self):
+        self.post("Hello there")
+        self.post("Hello there")
+        self.assertEqual(Message.objects.filter(conversation=self.convo, sender="user").count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+@override_settings(LLM_BACKEND=SLOW_STUB)
+class ConcurrentSubmissionTests(ChatSubmissionMixin, TransactionTestCase):
+    def test_concurrent_identical_submissions_make_one_upstream_call(self):
+        clients = [self.client_class() for _ in range(CONCURRENCY)]
+        for client in clients:
+            client.force_login(self.user)
+
+        def submit(client):
+            return self.post("I feel overwhelmed by my course load", key="double-click", client=client)
+
+        responses = run_together(submit, *[(client,) for client in clients])
+
+        self.assertEqual([response.status_code for response in responses], [200] * CONCURRENCY)
+        bodies = [response.json() for response in responses]
+        self.assertEqual(len({body["bot_response"] for body in bodies}), 1)
+        self.assertEqual(sum(body.get("replayed", False) for body in bodies), CONCURRENCY - 1)
+        self.assertEqual(get_backend().calls, 1)
+        self.assertEqual(Message.objects.filter(conversation=self.convo, sender="user").count(), 1)
+        self.assertEqual(Message.objects.filter(conversation=self.convo, sender="bot").count(), 1)
+
+
+def hold_slot(scheduler, **admit):
+    """Take a slot on another thread until the returned event is set; returns (release event, thread)."""
+    admitted, release = threading.Event(), threading.Event()
+
+    def run():
+        with scheduler.admit(**admit):
+            admitted.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert admitted.wait(5), "no slot was granted"
+    return release, thread
+
+
+def queue_up(scheduler, order, name, **admit):
+    """
+    Queue a call that appends `name` to `order` once admitted, and wait
+    until it has joined the queue. Returns (thread, list of its Overloaded errors).
+    """
+    def arrivals():
+        stats = scheduler.stats()
+        return stats["waiting"] + stats["shed"]  # a displacing call leaves the queue length as it was
+
+    before = arrivals()
+    errors = []
+
+    def run():
+        try:
+            with scheduler.admit(**admit):
+                order.append(name)
+        except Overloaded as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    while arrivals() == before and thread.is_alive():
+        time.sleep(0.005)
+    return thread, errors
+
+
+class SchedulerTestsMixin:
+    """Run against each scheduler; `make` builds one with the given limits."""
+
+    def test_concurrency_is_bounded(self):
+        scheduler = self.make(max_concurrency=2)
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def call():
+            with scheduler.admit():
+                with lock:
+                    running[0] += 1
+                    peak[0] = max(peak[0], running[0])
+                time.sleep(0.05)
+                with lock:
+                    running[0] -= 1
+
+        run_together(call, *[()] * 6)
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(scheduler.stats()["admitted"], 6)
+
+    def test_crisis_goes_first(self):
+        scheduler = self.make(max_concurrency=1)
+        release, holder = hold_slot(scheduler)
+        order = []
+        threads = [
+            queue_up(scheduler, order, "tutorial", priority=priority_for("general_support"))[0],
+            queue_up(scheduler, order, "anxiety", priority=priority_for("anxiety_support"))[0],
+            queue_up(scheduler, order, "crisis", priority=priority_for("crisis_intervention"))[0],
+        ]
+        release.set()
+        for thread in [holder, *threads]:
+            thread.join(5)
+        self.assertEqual(order, ["crisis", "anxiety", "tutorial"])
+
+    def test_user_over_their_share_queues_behind_others(self):
+        scheduler = self.make(max_concurrency=1, user_burst=1, user_rate=0.001)
+        release, holder = hold_slot(scheduler, user_id=1)  # spends user 1's only token
+        order = []
+        threads = [
+            queue_up(scheduler, order, "chatty", user_id=1)[0],
+            queue_up(scheduler, order, "quiet", user_id=2)[0],
+        ]
+        release.set()
+        for thread in [holder, *threads]:
+            thread.join(5)
+        self.assertEqual(order, ["quiet", "chatty"])
+
+    def test_full_queue_sheds(self):
+        scheduler = self.make(max_concurrency=1, max_queue=1)
+        release, holder = hold_slot(scheduler)
+        order = []
+        queued, displaced = queue_up(scheduler, order, "tutorial", priority=priority_for("general_support"))
+
+        with self.assertRaises(Overloaded) as refused:
+            with scheduler.admit(priority=priority_for("general_support")):
+                pass
+        self.assertGreaterEqual(refused.exception.retry_after, 1)
+
+        # A more urgent call takes the place of the worst waiter instead
+        crisis_thread, _ = queue_up(scheduler, order, "crisis", priority=priority_for("crisis_intervention"))
+        queued.join(5)
+        self.assertEqual(len(displaced), 1)
+        release.set()
+        for thread in (holder, crisis_thread):
+            thread.join(5)
+        self.assertEqual(order, ["crisis"])
+        self.assertEqual(scheduler.stats()["shed"], 2)
+
+    def test_wait_is_bounded(self):
+        scheduler = self.make(max_concurrency=1, max_wait=0.05)
+        release, holder = hold_slot(scheduler)
+        with self.assertRaises(Overloaded) as timed_out:
+            with scheduler.admit():
+                pass
+        release.set()
+        holder.join(5)
+        self.assertEqual(timed_out.exception.reason, "timeout")
+        self.assertEqual(scheduler.stats(), {"running": 0, "waiting": 0, "admitted": 1, "shed": 0, "timed_out": 1})
+
+
+class LocalSchedulerTests(SchedulerTestsMixin, SimpleTestCase):
+    def make(self, **options):
+        return LocalScheduler(**options)
+
+
+class SQLiteSchedulerTests(SchedulerTestsMixin, SimpleTestCase):
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.path = Path(scratch.name) / "admission.sqlite3"
+
+    def make(self, **options):
+        return SQLiteScheduler(self.path, **options)
+
+    def test_limits_are_shared_through_the_file(self):
+        # Two schedulers on one file stand in for two worker processes
+        first, second = self.make(max_concurrency=1, max_queue=0), self.make(max_concurrency=1, max_queue=0)
+        release, holder = hold_slot(first)
+        with self.assertRaises(Overloaded):
+            with second.admit():
+                pass
+        release.set()
+        holder.join(5)
+        with second.admit():
+            self.assertEqual(first.stats()["running"], 1)
+
+    def test_slots_of_exited_processes_are_reclaimed(self):
+        scheduler = self.make(max_concurrency=1, max_queue=0)
+        scheduler.db.execute(
+            "INSERT INTO tickets (state, priority, over_budget, pid, updated) VALUES ('running', 3, 0, ?, ?)",
+            [2 ** 22 + 1, time.time()],  # above any pid the kernel hands out
+        )
+        with scheduler.admit():
+            self.assertEqual(scheduler.stats()["running"], 1)
+
+
+@override_settings(LLM_BACKEND=SLOW_STUB, LLM_ADMISSION={"OPTIONS": {"max_concurrency": 1, "max_queue": 0}})
+class OverloadedSubmissionTests(ChatSubmissionMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_shed_message_gets_503_and_is_not_kept(self):
+        release, holder = hold_slot(get_scheduler())
+        try:
+            response = self.post("Can you explain Python decorators?", key="k1")
+        finally:
+            release.set()
+            holder.join(5)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+        self.assertFalse(Message.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+        # The same key goes through once there is room
+        self.assertEqual(self.post("Can you explain Python decorators?", key="k1").status_code, 200)
+
+
+@override_settings(LLM_BACKEND={"BACKEND": "chatbot.backends.StubBackend", "RESILIENCE": None})
+class DeferredCompactionTests(ChatSubmissionMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        # Far more history than fits the window beside the summary
+        Message.objects.bulk_create(
+            Message(conversation=self.convo, sender=sender, content="I have been worried about exams. " * 40)
+            for sender in ["user", "bot"] * 20
+        )
+
+    def test_reply_queues_compaction_instead_of_running_it(self):
+        with mock.patch("chatbot.llm.summarize_conversation", return_value="Worried about exams.") as summarize:
+            response = self.post("What else can I do?")
+            self.assertEqual(response.status_code, 200)
+            summarize.assert_not_called()
+            self.assertEqual(Job.objects.get().name, "chatbot.compact_conversation")
+
+            run_next()
+        summarize.assert_called_once()
+        self.convo.refresh_from_db()
+        self.assertEqual(self.convo.summary, "Worried about exams.")
+        self.assertFalse(CONTEXT_BUILDER.needs_compaction(self.convo))
+
+
+class ContextCompactionTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user("210591032", password="pw")
+        self.convo = Conversation.objects.create(user=user, title="Chat")
+        # 54 tokens each: four fit the window, and a page holds five
+        self.messages = Message.objects.bulk_create(
+            Message(conversation=self.convo, sender="user", content=f"turn{i:02d} " + "word " * 39)
+            for i in range(20)
+        )
+        self.builder = ContextBuilder(max_tokens=300, summary_max_tokens=50, summary_batch_tokens=100, max_messages=5)
+
+    def test_history_beyond_the_read_cap_is_summarised_in_order(self):
+        pages = []
+
+        def summarize(summary, turns, max_tokens):
+            pages.append([turn["content"][:6] for turn in turns])
+            return f"summary {len(pages)}"
+
+        with mock.patch("chatbot.llm.summarize_conversation", side_effect=summarize):
+            self.assertTrue(self.builder.compact(self.convo))
+
+        self.assertEqual(pages, [[f"turn{i:02d}" for i in range(start, start + 5)] for start in (0, 5, 10)])
+        self.convo.refresh_from_db()
+        self.assertEqual(self.convo.summary, "summary 3")
+        self.assertEqual(self.convo.summarized_until, self.messages[14].id)
+        # The one evicted turn left is below the batch size and waits for more
+        self.assertFalse(self.builder.needs_compaction(self.convo))
+        history = self.builder.build(self.convo)
+        self.assertEqual(history[0]["content"], "Summary of the earlier conversation:\nsummary 3")
+        self.assertEqual([turn["content"][:6] for turn in history[1:]], [f"turn{i}" for i in range(15, 20)])
+
+    def test_failed_page_leaves_the_rest_unsummarised(self):
+        with mock.patch("chatbot.llm.summarize_conversation", side_effect=["first", LLMBackendError("down")]):
+            self.assertTrue(self.builder.compact(self.convo))
+        self.convo.refresh_from_db()
+        self.assertEqual((self.convo.summary, self.convo.summarized_until), ("first", self.messages[4].id))
+
+
+class SidebarTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user("210591032", password="pw")
+        midnight = localtime(now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        for title, started_at in [
+            ("Older", midnight - timedelta(days=60)),
+            ("Last month", midnight - timedelta(days=20)),
+            ("This week", midnight - timedelta(days=3)),
+            ("Last night", midnight - timedelta(hours=1)),
+            ("This morning", midnight),
+        ]:
+            convo = Conversation.objects.create(user=self.user, title=title)
+            Conversation.objects.filter(pk=convo.pk).update(started_at=started_at)
+        other = CustomUser.objects.create_user("210591033", password="pw")
+        Conversation.objects.create(user=other, title="Someone else's")
+
+    def titles(self):
+        return {label: [session["title"] for session in sessions] for label, sessions in grouped_sessions(self.user).items()}
+
+    def conversation_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            grouped_sessions(self.user)
+        return [query["sql"] for query in queries if "chatbot_conversation" in query["sql"]]
+
+    def test_conversations_are_grouped_by_age(self):
+        self.assertEqual(self.titles(), {
+            "Today": ["This morning"],
+            "Yesterday": ["Last night"],
+            "Last 7 Days": ["This week"],
+            "Last Month": ["Last month"],
+            "Older": ["Older"],
+        })
+        self.assertEqual(list(self.titles()), list(BUCKETS))
+
+    def test_empty_buckets_are_left_out(self):
+        Conversation.objects.filter(user=self.user).exclude(title="This morning").delete()
+        self.assertEqual(self.titles(), {"Today": ["This morning"]})
+
+    def test_grouping_is_cached_until_a_conversation_changes(self):
+        self.assertEqual(len(self.conversation_queries()), 1)
+        self.assertEqual(self.conversation_queries(), [])
+
+        convo = Conversation.objects.create(user=self.user, title="New chat")
+        self.assertEqual(self.titles()["Today"], ["New chat", "This morning"])
+        convo.title = "Renamed chat"
+        convo.save()
+        self.assertEqual(self.titles()["Today"], ["Renamed chat", "This morning"])
+        convo.delete()
+        self.assertEqual(self.titles()["Today"], ["This morning"])
+
+        # Updates that skip signals are served stale until the timeout
+        Conversation.objects.filter(title="This morning").update(title="Raw update")
+        self.assertEqual(self.titles()["Today"], ["This morning"])
+
+
+class MessagePageTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("210591032", password="pw")
+        self.convo = Conversation.objects.create(user=self.user, title="Chat")
+        self.messages = Message.objects.bulk_create(
+            Message(conversation=self.convo, sender=("user", "bot")[i % 2], content=f"Message {i}") for i in range(7)
+        )
+        self.url = reverse("chat_messages", args=[self.convo.id])
+        self.client.force_login(self.user)
+
+    def page(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_walks_back_to_the_first_message(self):
+        pages = []
+        params = {"limit": 3}
+        while True:
+            page = self.page(**params)
+            pages.append([message["content"] for message in page["messages"]])
+            if not page["has_more"]:
+                break
+            params["before"] = page["next_before"]
+
+        self.assertEqual(pages, [
+            ["Message 4", "Message 5", "Message 6"],
+            ["Message 1", "Message 2", "Message 3"],
+            ["Message 0"],
+        ])
+        self.assertEqual(page["next_before"], self.messages[0].id)
+
+    def test_page_ending_exactly_at_the_start_has_no_more(self):
+        page = self.page(before=self.messages[3].id, limit=3)
+        self.assertEqual([message["content"] for message in page["messages"]], ["Message 0", "Message 1", "Message 2"])
+        self.assertFalse(page["has_more"])
+        self.assertEqual(self.page(before=self.messages[0].id), {"messages": [], "has_more": False, "next_before": None})
+
+    def test_bad_cursors_and_other_users_chats_are_refused(self):
+        for params in ({"before": "abc"}, {"limit": "0"}, {"limit": "x"}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+        self.client.force_login(CustomUser.objects.create_user("210591033", password="pw"))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class SearchQueryTests(SimpleTestCase):
+    def test_words_are_anded_and_quotes_make_phrases(self):
+        self.assertEqual(search.parse_query("exam stress"), '"exam" "stress"')
+        self.assertEqual(search.parse_query('"panic attack" tonight'), '"panic attack" "tonight"')
+        self.assertEqual(search.parse_query('"unclosed phrase'), '"unclosed" "phrase"')
+
+    def test_fts5_syntax_is_searched_as_plain_words(self):
+        for text, expected in [
+            ("exam NEAR stress", '"exam" "NEAR" "stress"'),
+            ("NEAR(exam stress, 2)", '"NEAR exam" "stress" "2"'),
+            ("sleep*", '"sleep"'),
+            ("-sad happy", '"sad" "happy"'),
+            ("owner:u2", '"owner u2"'),
+            ("content:exam OR ^panic", '"content exam" "OR" "panic"'),
+        ]:
+            with self.subTest(text=text):
+                self.assertEqual(search.parse_query(text), expected)
+
+    def test_nothing_searchable(self):
+        for text in (None, "", "   ", "*** -- : ()", '""'):
+            with self.subTest(text=text):
+                self.assertIsNone(search.parse_query(text))
+
+    def test_terms_are_capped(self):
+        self.assertEqual(search.parse_query(" ".join(f"w{i}" for i in range(20))).count('"'), 2 * search.MAX_QUERY_TERMS)
+
+    def test_highlight_escapes_everything_but_the_marks(self):
+        self.assertEqual(
+            search._highlight('<b>a</b> & \x02exam\x03 "b"'),
+            '&lt;b&gt;a&lt;/b&gt; &amp; <mark>exam</mark> &quot;b&quot;',
+        )
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("210591032", password="pw")
+        self.other = CustomUser.objects.create_user("210591033", password="pw")
+        self.convo = Conversation.objects.create(user=self.user, title="Exams")
+        self.other_convo = Conversation.objects.create(user=self.other, title="Also exams")
+        self.mine = Message.objects.create(conversation=self.convo, sender="user", content="Exam stress is keeping me up")
+        Message.objects.create(conversation=self.other_convo, sender="user", content="Exam stress again")
+
+    def found(self, text, user=None):
+        return [result["message_id"] for result in search.search(user or self.user, text)]
+
+    def test_results_are_scoped_to_the_owner(self):
+        self.assertEqual(self.found("exam stress"), [self.mine.id])
+        # Nor can the owner column be named from the query
+        self.assertEqual(self.found(f"owner:{search.owner_token(self.other.pk)} exam"), [])
+
+        self.client.force_login(self.user)
+        results = self.client.get(reverse("search_messages"), {"q": "stress"}).json()["results"]
+        self.assertEqual([result["message_id"] for result in results], [self.mine.id])
+        self.assertEqual(results[0]["url"], reverse("chat_session", args=[self.convo.id]))
+
+    def test_fts5_syntax_does_not_reach_the_matcher(self):
+        for text in ('exam NEAR stress', 'NEAR(exam stress)', 'exam*', '-exam', 'content:exam', '"exam', 'exam OR x'):
+            with self.subTest(text=text):
+                # sqlite3.OperationalError if any of it were parsed as FTS5 syntax
+                self.assertIsInstance(search.search(self.user, text), list)
+
+    def test_messages_are_indexed_on_save_and_unindexed_on_delete(self):
+        reply = Message.objects.create(conversation=self.convo, sender="bot", content="Try a short walk")
+        self.assertEqual(self.found("walk"), [reply.id])
+
+        reply.content = "Try some breathing"
+        reply.save()
+        self.assertEqual(self.found("walk"), [])
+        self.assertEqual(self.found("breathing"), [reply.id])
+
+        reply.delete()
+        self.assertEqual(self.found("breathing"), [])
+        # Deleting the conversation takes its messages out of the index too
+        self.convo.delete()
+        self.assertEqual(self.found("stress"), [])
+
+    def test_bulk_created_messages_need_a_rebuild(self):
+        [bulk] = Message.objects.bulk_create([Message(conversation=self.convo, sender="bot", content="Journaling helps")])
+        self.assertEqual(self.found("journaling"), [])
+        self.assertEqual(search.rebuild(), 3)
+        self.assertEqual(self.found("journaling"), [bulk.id])
+
+    def test_snippets_are_escaped(self):
+        Message.objects.create(conversation=self.convo, sender="user",
+                               content="<script>alert(1)</script> \x02fake\x03 panic")
+        [result] = search.search(self.user, "panic")
+        self.assertEqual(result["snippet"], "&lt;script&gt;alert(1)&lt;/script&gt; fake <mark>panic</mark>")
+
+
+def parse_events(body):
+    """(event, data) pairs from a Server-Sent Events body."""
+    events = []
+    for frame in body.decode().strip().split("\n\n"):
+        event, data = "message", None
+        for line in frame.splitlines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+
+@override_settings(LLM_BACKEND={"BACKEND": "chatbot.backends.StubBackend", "RESILIENCE": None})
+class StreamChatReplyTests(ChatSubmissionMixin, TestCase):
     def setUp(self):
-        # Set up any initial data for your tests here
-        YourModel.objects.create(field1='value1', field2='value2')  # Replace with actual fields
+        super().setUp()
+        self.url = reverse("stream_chat_reply", args=[self.convo.id])
+
+    async def stream(self, message, key=None):
+        await self.async_client.aforce_login(self.user)
+        headers = {"Idempotency-Key": key} if key is not None else {}
+        response = await self.async_client.post(self.url, {"message": message}, headers=headers)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return parse_events(b"".join([chunk async for chunk in response.streaming_content]))
+
+    async def test_tokens_then_saved_reply_and_done(self):
+        events = await self.stream("Can you explain Python decorators?")
+
+        tokens = [data["token"] for event, data in events if event == "message"]
+        self.assertGreater(len(tokens), 1)
+        self.assertEqual(events[-1][0], "done")
+        done = events[-1][1]
+        bot_msg = await Message.objects.aget(conversation=self.convo, sender="bot")
+        self.assertEqual(bot_msg.content, "".join(tokens))
+        self.assertEqual(done, {"message_id": bot_msg.id, "is_crisis": False, "follow_up": False})
+
+    async def test_compaction_is_queued_not_run(self):
+        await Message.objects.abulk_create(
+            Message(conversation=self.convo, sender=sender, content="I have been worried about exams. " * 40)
+            for sender in ["user", "bot"] * 20
+        )
+        with mock.patch("chatbot.llm.summarize_conversation") as summarize:
+            events = await self.stream("What else can I do?")
+        self.assertEqual(events[-1][0], "done")
+        summarize.assert_not_called()
+        self.assertEqual((await Job.objects.aget()).name, "chatbot.compact_conversation")
+
+    async def test_disconnect_closes_the_reply_stream(self):
+        release, closed = threading.Event(), threading.Event()
+
+        def chunks():
+            try:
+                yield "Hello "
+                release.wait(5)
+                yield "there"
+            finally:
+                closed.set()
+
+        # Kept referenced, so only an explicit close() ends it, not garbage collection
+        reply = chunks()
+        await self.async_client.aforce_login(self.user)
+        with mock.patch("chatbot.views.chatbot_response_stream", return_value=reply):
+            response = await self.async_client.post(self.url, {"message": "Hi"})
+            first = asyncio.Event()
+
+            async def read():
+                async for _ in response.streaming_content:
+                    first.set()
+
+            reader = asyncio.ensure_future(read())
+            await asyncio.wait_for(first.wait(), 5)
+            # The client goes away while the next chunk is still being generated
+            reader.cancel()
+            release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await reader
+        self.assertTrue(closed.is_set())
+        self.assertFalse(await Message.objects.filter(sender="bot").aexists())
+
+    async def test_disconnect_frees_the_idempotency_key(self):
+        release = threading.Event()
+
+        def reply(*args, **kwargs):
+            yield "Hello "
+            release.wait(5)
+            yield "there"
+
+        await self.async_client.aforce_login(self.user)
+        with mock.patch("chatbot.views.chatbot_response_stream", side_effect=reply):
+            response = await self.async_client.post(self.url, {"message": "Hi"}, headers={"Idempotency-Key": "k1"})
+            chunks = aiter(response.streaming_content)
+            await anext(chunks)
+            # Cut off after the first token, before the reply is saved
+            reader = asyncio.ensure_future(anext(chunks))
+            await asyncio.sleep(0.05)
+            reader.cancel()
+            release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await reader
+        self.assertFalse(await IdempotencyKey.objects.aexists())
+        self.assertFalse(await Message.objects.aexists())
+
+        # The resend is answered afresh instead of waiting on a reply that never comes
+        events = await self.stream("Hi", key="k1")
+        self.assertEqual(events[-1][0], "done")
+        record = await IdempotencyKey.objects.aget(key="k1")
+        self.assertEqual(record.reply_id, events[-1][1]["message_id"])
+
+    async def test_answered_key_is_replayed(self):
+        first = await self.stream("Hi", key="k1")
+        again = await self.stream("Hi", key="k1")
+        self.assertEqual(again[-1][1]["message_id"], first[-1][1]["message_id"])
+        self.assertTrue(again[-1][1]["replayed"])
+        self.assertEqual(await Message.objects.acount(), 2)
+
+
+class CrisisFollowUpTests(TransactionTestCase):
+    def test_llm_call_runs_outside_a_transaction(self):
+        user = CustomUser.objects.create_user("210591032", password="pw")
+        convo = Conversation.objects.create(user=user, title="Chat")
+        user_msg = Message.objects.create(conversation=convo, sender="user", content="I want to die")
+        in_transaction = []
+
+        def reply(*args, **kwargs):
+            in_transaction.append(transaction.get_connection().in_atomic_block)
+            return "Are you somewhere safe right now?"
 
-    def test_model_creation(self):
-        """Test that the model is created correctly."""
-        obj = YourModel.objects.get(field1='value1')
-        self.assertEqual(obj.field2, 'value2')  # Replace with actual assertions
+        with mock.patch("chatbot.llm.query_llm", side_effect=reply):
+            crisis_follow_up(user_msg.id)
 
-    def test_some_functionality(self):
-        """Test some functionality of your chatbot."""
-        # Add your test logic here
-        pass  # Replace with actual test logic
\ No newline at end of file
+        # SQLite would block every web write for the whole LLM call otherwise
+        self.assertEqual(in_transaction, [False])
+        self.assertEqual(convo.messages.filter(sender="bot").get().content, "Are you somewhere safe right now?")
@@ -1,20 +1,65 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .models import *
 from .forms import StartChatForm
 from chatbot.llm import detect_intent, generate_prompt, query_llm
-from django.core.mail import send_mail
 from django.conf import settings
-from chatbot.llm import chatbot_response
-from django.utils.timezone import now, timedelta
-from collections import defaultdict
+from django.db import transaction
+from chatbot.llm import chatbot_response, chatbot_response_stream
+from chatbot.context import CONTEXT_BUILDER
+from chatbot.sidebar import grouped_sessions
+from chatbot import crisis, idempotency, search
+from chatbot.admission import Overloaded
+from chatbot.tasks import CRISIS_PRIORITY
+from jobs.queue import enqueue
+from live.broker import publish_to_users
+from chatbot.events import message_json, publish_chat_messages
 from django.db.models import F
+from django.urls import reverse
+from asgiref.sync import sync_to_async
+import json
 import logging
+import math
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Messages rendered with the page / returned per scroll-back request
+MESSAGE_PAGE_SIZE = getattr(settings, 'CHAT_MESSAGE_PAGE_SIZE', 50)
+MAX_MESSAGE_PAGE_SIZE = 200
+
+
+def message_page(convo, before=None, limit=MESSAGE_PAGE_SIZE):
+    """
+    Return (messages, has_more): up to `limit` messages older than id
+    `before` (or the latest ones), oldest first.
+    """
+    page = Message.objects.filter(conversation=convo)
+    if before is not None:
+        page = page.filter(id__lt=before)
+    page = list(page.order_by('-id')[:limit + 1])
+    has_more = len(page) > limit
+    return page[:limit][::-1], has_more
+
+
+def flag_crisis_message(user_msg):
+    """
+    Flag a crisis message for review and queue the model's follow-up to the
+    safety message. Staff notifications and the admin email are sent by the
+    job worker, so the student never waits on SMTP. Returns whether a
+    follow-up is coming.
+    """
+    follow_up = crisis.get_config()["FOLLOW_UP"]
+    with transaction.atomic():
+        flag = FlaggedMessage.objects.create(message=user_msg, reason=crisis.CRISIS_INTENT)
+        if follow_up:
+            enqueue("chatbot.crisis_follow_up", {"message_id": user_msg.id}, priority=CRISIS_PRIORITY)
+        enqueue("chatbot.escalate_crisis", {"flag_id": flag.id}, priority=CRISIS_PRIORITY)
+    return follow_up
+
+
 @login_required
 def start_chat(request):
     if request.method == "POST":
@@ -38,7 +83,7 @@ def start_chat(request):
 
                 # Get bot reply and save
                 try:
-                    reply = chatbot_response(message, is_first_message=True)
+                    reply = chatbot_response(message, is_first_message=True, user_id=request.user.pk)
                     Message.objects.create(
                         conversation=convo,
                         sender="bot",
@@ -56,19 +101,8 @@ def start_chat(request):
                     )
 
                 # Crisis check with proper admin email
-                if intent == "crisis_intervention":
-                    FlaggedMessage.objects.create(message=user_msg, reason=intent)
-                    admin_email = getattr(settings, 'ADMIN_EMAIL', 'admin@mindcare.ng')
-                    try:
-                        send_mail(
-                            subject="🚨 Crisis Message Detected",
-                            message=f"A user sent a message flagged for crisis:\n\n{message}\n\nFrom user: {request.user.username}",
-                            from_email=settings.DEFAULT_FROM_EMAIL,
-                            recipient_list=[admin_email],
-                            fail_silently=False
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to send crisis notification email: {e}")
+                if intent == crisis.CRISIS_INTENT:
+                    flag_crisis_message(user_msg)
 
                 return redirect("chat_session", convo_id=convo.id)
             
@@ -90,36 +124,83 @@ def chat_session(request, convo_id):
         messages.error(request, "Chat session not found.")
         return redirect("chat_history")
 
-    # Group chats by time (Yesterday, Last Week, Last Month, Older)
-    # Optimize: only select needed fields for sidebar
-    conversations = Conversation.objects.filter(user=request.user).only(
-        'id', 'title', 'started_at'
-    ).order_by('-started_at')
-
-    grouped_sessions = defaultdict(list)
-    today = now().date()
-    for chat in conversations:
-        delta = today - chat.started_at.date()
-        if delta.days == 0:
-            label = "Today"
-        elif delta.days == 1:
-            label = "Yesterday"
-        elif delta.days <= 7:
-            label = "Last Week"
-        elif delta.days <= 30:
-            label = "Last Month"
-        else:
-            label = "Older"
-        grouped_sessions[label].append(chat)
+    chat_messages, has_older = message_page(convo)
 
     return render(request, "chatbot/chat.html", {
         "conversation": convo,
+        "chat_messages": chat_messages,
+        "has_older": has_older,
         "sidebar_mode": "chat",
-        "grouped_sessions": dict(grouped_sessions),
+        "grouped_sessions": grouped_sessions(request.user),
         "current_session": str(convo.id)
     })
 
 
+@login_required
+def chat_messages(request, convo_id):
+    """Older messages for infinite scroll: ?before=<message id>&limit=<n>."""
+    try:
+        convo = Conversation.objects.get(id=convo_id, user=request.user)
+    except Conversation.DoesNotExist:
+        return JsonResponse({"error": "Chat session not found."}, status=404)
+
+    try:
+        before = int(request.GET["before"]) if request.GET.get("before") else None
+        limit = min(int(request.GET.get("limit", MESSAGE_PAGE_SIZE)), MAX_MESSAGE_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+    if limit < 1:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+
+    page, has_more = message_page(convo, before=before, limit=limit)
+    return JsonResponse({
+        "messages": [message_json(msg) for msg in page],
+        "has_more": has_more,
+        "next_before": page[0].id if page else None,
+    })
+
+
+def replay_conflict(record, user_input):
+    """
+    Response for a reused idempotency key that can't be replayed, or None:
+    the key was sent with a different message, or its reply isn't saved yet
+    (call after waiting).
+    """
+    if record.user_message.content != user_input:
+        return JsonResponse({"error": "This Idempotency-Key was already used for a different message."}, status=422)
+    if record.reply is None:
+        response = JsonResponse({"error": "This message is still being answered; retry shortly."}, status=409)
+        response["Retry-After"] = "1"
+        return response
+    return None
+
+
+def save_reply(convo, key, content, intent):
+    """Save the bot's reply, and record it against the submission's idempotency key in the same transaction."""
+    with transaction.atomic():
+        bot_msg = Message.objects.create(conversation=convo, sender="bot", content=content, intent_detected=intent)
+        if key:
+            idempotency.record_reply(convo, key, bot_msg)
+    return bot_msg
+
+
+def queue_compaction(convo):
+    """Summarising evicted turns is an LLM call of its own; the reply never waits for it."""
+    if CONTEXT_BUILDER.needs_compaction(convo):
+        enqueue("chatbot.compact_conversation", {"conversation_id": convo.id})
+
+
+BUSY_MESSAGE = "MindCare is very busy right now. Please send your message again in a moment."
+
+
+def overloaded_response(error):
+    """503 for a message whose LLM call was shed; nothing of it is kept, so it can simply be resent."""
+    retry_after = math.ceil(error.retry_after or 1)
+    response = JsonResponse({"error": BUSY_MESSAGE, "retry_after": retry_after}, status=503)
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
 @login_required
 def ajax_chat_reply(request, convo_id):
     if request.method == "POST":
@@ -131,62 +212,217 @@ def ajax_chat_reply(request, convo_id):
         user_input = request.POST.get("message")
         if not user_input or not user_input.strip():
             return JsonResponse({"error": "Message cannot be empty."}, status=400)
+        try:
+            key = idempotency.key_from(request)
+        except idempotency.InvalidKey as e:
+            return JsonResponse({"error": str(e)}, status=400)
             
         intent = detect_intent(user_input)
 
         try:
-            user_msg = Message.objects.create(
-                conversation=convo,
-                sender="user",
-                content=user_input,
-                intent_detected=intent
-            )
-
-            # Get recent conversation context for better responses
-            recent_messages = Message.objects.filter(
-                conversation=convo
-            ).order_by('-timestamp')[:10]  # Last 10 messages for context
-
-            conversation_context = [msg.content for msg in recent_messages]
+            if key:
+                user_msg, previous = idempotency.submit(convo, key, content=user_input, intent_detected=intent)
+            else:
+                user_msg, previous = Message.objects.create(
+                    conversation=convo,
+                    sender="user",
+                    content=user_input,
+                    intent_detected=intent
+                ), None
+            if previous is not None:
+                # A retry or double send: answer with the original request's reply
+                if previous.user_message.content == user_input:
+                    idempotency.wait_for_reply(previous)
+                conflict = replay_conflict(previous, user_input)
+                return conflict or JsonResponse({
+                    "user_message": user_msg.content,
+                    "bot_response": previous.reply.content,
+                    "is_crisis": user_msg.intent_detected == crisis.CRISIS_INTENT,
+                    "follow_up": False,
+                    "replayed": True,
+                })
+
+            # Rolling summary plus the recent turns that fit the token budget. Crisis
+            # replies don't use the model; their follow-up job builds its own.
+            is_crisis = intent == crisis.CRISIS_INTENT
+            conversation_context = None if is_crisis else CONTEXT_BUILDER.build(convo, before_id=user_msg.id)
 
             # Use the updated chatbot_response function
             try:
-                bot_reply = chatbot_response(user_input, is_first_message=False, conversation_context=conversation_context)
+                bot_reply = chatbot_response(
+                    user_input, is_first_message=False, conversation_context=conversation_context,
+                    user_id=request.user.pk,
+                )
+            except Overloaded as e:
+                # Also drops its idempotency key, so a retry with the same key starts afresh
+                user_msg.delete()
+                return overloaded_response(e)
             except Exception as e:
                 logger.error(f"LLM error for user {request.user.username}: {e}")
                 bot_reply = "I'm sorry, I'm experiencing some technical difficulties right now. Please try again in a moment."
 
-            bot_msg = Message.objects.create(
-                conversation=convo,
-                sender="bot",
-                content=bot_reply,
-                intent_detected=intent
-            )
+            bot_msg = save_reply(convo, key, bot_reply, intent)
+            publish_chat_messages(request.user.pk, convo.id, [user_msg, bot_msg], request.headers.get("X-Live-Client", ""))
+            if not is_crisis:
+                queue_compaction(convo)
         except Exception as e:
             logger.error(f"Database error in ajax_chat_reply for user {request.user.username}: {e}")
             return JsonResponse({"error": "Unable to process your message. Please try again."}, status=500)
 
         # Flag if crisis
-        if intent == "crisis_intervention":
-            FlaggedMessage.objects.create(message=user_msg, reason=intent)
-            # Notify admin with proper email
-            admin_email = getattr(settings, 'ADMIN_EMAIL', 'admin@mindcare.ng')
-            try:
-                send_mail(
-                    subject="🚨 Crisis Message Detected",
-                    message=f"A user sent a message flagged for crisis:\n\n{user_input}\n\nFrom user: {request.user.username}",
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[admin_email],
-                    fail_silently=False
-                )
-            except Exception as e:
-                logger.error(f"Failed to send crisis notification email: {e}")
+        follow_up = flag_crisis_message(user_msg) if is_crisis else False
 
         return JsonResponse({
             "user_message": user_msg.content,
             "bot_response": bot_msg.content,
-            "is_crisis": intent == "crisis_intervention"
+            "is_crisis": is_crisis,
+            "follow_up": follow_up,
         })
+
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Events frame."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+async def replay_stream(record, is_crisis):
+    """The stored reply of an already answered submission, as one token and a "done" event."""
+    yield sse_event({"token": record.reply.content})
+    yield sse_event({
+        "message_id": record.reply_id,
+        "is_crisis": is_crisis,
+        "follow_up": False,
+        "replayed": True,
+    }, event="done")
+
+
+@login_required
+async def stream_chat_reply(request, convo_id):
+    """
+    Streaming variant of ajax_chat_reply. Completion chunks are forwarded as
+    Server-Sent Events while they arrive; the bot Message is saved once the
+    stream finishes and announced in a final "done" event.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed."}, status=405)
+
+    user = await request.auser()
+    try:
+        convo = await Conversation.objects.aget(id=convo_id, user=user)
+    except Conversation.DoesNotExist:
+        return JsonResponse({"error": "Chat session not found."}, status=404)
+
+    user_input = request.POST.get("message")
+    if not user_input or not user_input.strip():
+        return JsonResponse({"error": "Message cannot be empty."}, status=400)
+
+    try:
+        key = idempotency.key_from(request)
+    except idempotency.InvalidKey as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    origin = request.headers.get("X-Live-Client", "")
+    intent = detect_intent(user_input)
+    is_crisis = intent == crisis.CRISIS_INTENT
+    try:
+        if key:
+            user_msg, previous = await sync_to_async(idempotency.submit)(
+                convo, key, content=user_input, intent_detected=intent
+            )
+        else:
+            user_msg, previous = await Message.objects.acreate(
+                conversation=convo,
+                sender="user",
+                content=user_input,
+                intent_detected=intent
+            ), None
+        if previous is not None:
+            if previous.user_message.content == user_input:
+                # Polls; kept off the thread that runs the ORM for every other request
+                await sync_to_async(idempotency.wait_for_reply, thread_sensitive=False)(previous)
+            conflict = replay_conflict(previous, user_input)
+            if conflict:
+                return conflict
+            return StreamingHttpResponse(replay_stream(previous, is_crisis), content_type="text/event-stream")
+        conversation_context = None
+        if not is_crisis:
+            conversation_context = await sync_to_async(CONTEXT_BUILDER.build)(convo, before_id=user_msg.id)
+        await sync_to_async(publish_chat_messages)(user.pk, convo.id, [user_msg], origin)
+    except Exception as e:
+        logger.error(f"Database error in stream_chat_reply for user {user.username}: {e}")
+        return JsonResponse({"error": "Unable to process your message. Please try again."}, status=500)
+
+    async def event_stream():
+        chunks = []
+        reply = chatbot_response_stream(
+            user_input, is_first_message=False, conversation_context=conversation_context, user_id=user.pk,
+        )
+        # The upstream client is blocking; pull each chunk on a worker thread
+        # so the event loop stays free while the model is generating. The lock
+        # makes close() wait for a pull still running when the client leaves.
+        reply_lock = threading.Lock()
+
+        def pull():
+            with reply_lock:
+                return next(reply, None)
+
+        def close():
+            with reply_lock:
+                reply.close()
+
+        next_chunk = sync_to_async(pull, thread_sensitive=False)
+        settled = False
+        try:
+            while True:
+                try:
+                    chunk = await next_chunk()
+                except Overloaded as e:
+                    # Refused before the first chunk: take the message back and let the page resend it
+                    await user_msg.adelete()
+                    settled = True
+                    yield sse_event({"error": BUSY_MESSAGE, "retry_after": math.ceil(e.retry_after or 1)}, event="busy")
+                    return
+                except Exception as e:
+                    logger.error(f"LLM error for user {user.username}: {e}")
+                    break
+                if chunk is None:
+                    break
+                chunks.append(chunk)
+                yield sse_event({"token": chunk})
+
+            if not chunks:
+                fallback = "I'm sorry, I'm experiencing some technical difficulties right now. Please try again in a moment."
+                chunks.append(fallback)
+                yield sse_event({"token": fallback})
+
+            bot_msg = await sync_to_async(save_reply)(convo, key, "".join(chunks), intent)
+            settled = True
+            await sync_to_async(publish_chat_messages)(user.pk, convo.id, [bot_msg], origin)
+            follow_up = False
+            if is_crisis:
+                follow_up = await sync_to_async(flag_crisis_message)(user_msg)
+            else:
+                await sync_to_async(queue_compaction)(convo)
+
+            yield sse_event({
+                "message_id": bot_msg.id,
+                "is_crisis": is_crisis,
+                "follow_up": follow_up,
+            }, event="done")
+        finally:
+            # Runs when the client disconnects too: release the upstream stream
+            # and admission slot now rather than at garbage collection
+            await sync_to_async(close, thread_sensitive=False)()
+            if key and not settled:
+                # Nothing was saved for the key; drop it with the message so a
+                # retry asks again instead of waiting on a reply that never comes
+                await sync_to_async(idempotency.abandon)(convo, key)
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # let nginx pass frames straight through
+    return response
     
 
 from django.http import JsonResponse
@@ -241,38 +477,41 @@ def delete_chat(request):
 
 @login_required
 def chat_history(request):
-    conversations = Conversation.objects.filter(user=request.user).order_by('-started_at')
-
-    grouped = {
-        "Today": [],
-        "Yesterday": [],
-        "Last 7 Days": [],
-        "Last Month": [],
-        "Older": [],
-    }
-
-    today = now().date()
-    for convo in conversations:
-        started = convo.started_at.date()
-        delta = (today - started).days
-
-        if delta == 0:
-            grouped["Today"].append(convo)
-        elif delta == 1:
-            grouped["Yesterday"].append(convo)
-        elif delta <= 7:
-            grouped["Last 7 Days"].append(convo)
-        elif delta <= 30:
-            grouped["Last Month"].append(convo)
-        else:
-            grouped["Older"].append(convo)
-
+    query = request.GET.get("q", "").strip()
     return render(request, "chatbot/chat_history.html", {
-        "grouped_sessions": grouped,
+        "grouped_sessions": grouped_sessions(request.user),
+        "query": query,
+        "search_results": search.search(request.user, query) if query else None,
         "sidebar_mode": "chat"  # so sidebar renders chat-specific layout
     })
 
 
+@login_required
+def search_messages(request):
+    """Ranked search over the user's own messages: ?q=<text>&limit=<n>&offset=<n>."""
+    try:
+        limit = min(int(request.GET.get("limit", search.SEARCH_PAGE_SIZE)), search.MAX_SEARCH_PAGE_SIZE)
+        offset = int(request.GET.get("offset", 0))
+    except ValueError:
+        return JsonResponse({"error": "Invalid page."}, status=400)
+    if limit < 1 or not 0 <= offset <= search.MAX_SEARCH_OFFSET:
+        return JsonResponse({"error": "Invalid page."}, status=400)
+
+    results = search.search(request.user, request.GET.get("q", ""), limit=limit, offset=offset)
+    next_offset = offset + limit
+    return JsonResponse({
+        "results": [
+            {
+                **result,
+                "timestamp": result["timestamp"].isoformat(),
+                "url": reverse("chat_session", args=[result["conversation_id"]]),
+            }
+            for result in results
+        ],
+        "next_offset": next_offset if len(results) == limit and next_offset <= search.MAX_SEARCH_OFFSET else None,
+    })
+
+
 @login_required
 def chat_with_user(request, user_id):
     from django.shortcuts import get_object_or_404, redirect
@@ -284,7 +523,19 @@ def chat_with_user(request, user_id):
     if request.method == 'POST':
         content = request.POST.get('message')
         if content:
-            ChatMessage.objects.create(thread=thread, sender=request.user, content=content)
+            chat_message = ChatMessage.objects.create(thread=thread, sender=request.user, content=content)
+            payload = {
+                "thread_id": thread.id,
+                "id": chat_message.id,
+                "sender": request.user.username,
+                "content": chat_message.content,
+                "sent_at": chat_message.sent_at.isoformat(),
+            }
+            publish_to_users([thread.user1_id, thread.user2_id], "peer.message", payload)
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                # The live stream delivers it to the other side (and this user's
+                # other tabs); the sender's page appends it from this reply
+                return JsonResponse(payload)
             return redirect('chat_with_user', user_id=other_user.id)
 
     messages = thread.messages.order_by('sent_at')
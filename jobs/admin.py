@@ -0,0 +1,19 @@
+from django.contrib import admin
+from .models import Job, DeadJob
+from .queue import requeue
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("name", "status", "priority", "attempts", "run_at", "locked_until")
+    list_filter = ("status", "name")
+
+@admin.register(DeadJob)
+class DeadJobAdmin(admin.ModelAdmin):
+    list_display = ("name", "attempts", "created_at", "failed_at")
+    list_filter = ("name",)
+    actions = ["requeue_jobs"]
+
+    @admin.action(description="Requeue selected jobs")
+    def requeue_jobs(self, request, queryset):
+        for dead_job in queryset:
+            requeue(dead_job)
@@ -0,0 +1,39 @@
+import signal
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from jobs.queue import get_config, run_next
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (crisis escalation, emails, ...) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run everything currently due, then exit')
+        parser.add_argument('--batch', type=int, default=10)
+        parser.add_argument('--sleep', type=float, default=None, help='Idle poll interval in seconds')
+
+    def handle(self, *args, **options):
+        poll = options['sleep'] if options['sleep'] is not None else get_config()['POLL_INTERVAL']
+        stopping = False
+
+        def stop(signum, frame):
+            # Let the job in hand finish; its lease would otherwise have to expire
+            nonlocal stopping
+            stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        total = 0
+        self.stdout.write(self.style.SUCCESS("Job worker started"))
+        while not stopping:
+            close_old_connections()
+            ran = run_next(batch_size=options['batch'])
+            total += ran
+            if not ran:
+                if options['once']:
+                    break
+                time.sleep(poll)
+
+        self.stdout.write(self.style.SUCCESS(f"Job worker stopped after {total} jobs"))
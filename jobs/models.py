@@ -0,0 +1,39 @@
+from django.db import models
+from django.utils.timezone import now
+
+
+class Job(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running")]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0)  # higher runs first
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=now)
+    # A running job whose lease has expired belongs to a crashed worker and is picked up again
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_at"], name="jobs_job_status_run_at_idx")]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+class DeadJob(models.Model):
+    """A job that used up its attempts, kept for inspection and manual requeue."""
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    failed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} (failed {self.failed_at:%Y-%m-%d %H:%M})"
@@ -0,0 +1,156 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from jobs.models import DeadJob, Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_QUEUE = {
+    # Seconds a worker may hold a job before another worker assumes it crashed
+    "LEASE": 300,
+    "POLL_INTERVAL": 1.0,
+    "MAX_ATTEMPTS": 5,
+    # Retry backoff: BASE_DELAY * 2**(attempt - 1), jittered, capped at MAX_DELAY
+    "BASE_DELAY": 10.0,
+    "MAX_DELAY": 60 * 60.0,
+    # Run jobs right after the enqueuing transaction commits instead of in a worker (tests only)
+    "EAGER": False,
+}
+
+_handlers = {}
+
+
+def get_config():
+    return {**DEFAULT_JOB_QUEUE, **getattr(settings, "JOB_QUEUE", {})}
+
+
+def task(name):
+    """Register the decorated function as the handler for jobs called `name`."""
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, *, priority=0, delay=0, max_attempts=None):
+    """
+    Queue job `name` with JSON-serialisable keyword arguments `payload`.
+
+    Call it inside the transaction that writes the data the job needs, so
+    the job exists if and only if that data was committed. Delivery is
+    at-least-once: handlers run outside any transaction and must tolerate
+    being repeated. They open their own `transaction.atomic()` around their
+    writes only, never around slow I/O such as SMTP or LLM calls, so no
+    database lock is held while they wait.
+    """
+    if name not in _handlers:
+        raise LookupError(f"No job handler registered for {name!r}")
+    config = get_config()
+    job = Job.objects.create(
+        name=name,
+        payload=payload or {},
+        priority=priority,
+        run_at=now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or config["MAX_ATTEMPTS"],
+    )
+    if config["EAGER"]:
+        transaction.on_commit(lambda: run_next(job_ids=[job.id]))
+    return job
+
+
+def _due():
+    current = now()
+    return Q(status=Job.QUEUED, run_at__lte=current) | Q(status=Job.RUNNING, locked_until__lt=current)
+
+
+def claim(job_id, lease=None):
+    """Atomically take job `job_id` if it is still due; return it or None."""
+    lease = lease or get_config()["LEASE"]
+    claimed = Job.objects.filter(_due(), pk=job_id).update(
+        status=Job.RUNNING,
+        locked_until=now() + timedelta(seconds=lease),
+        attempts=F("attempts") + 1,
+    )
+    # The conditional UPDATE is the lock: of several workers racing, one wins
+    return Job.objects.filter(pk=job_id).first() if claimed else None
+
+
+def run_next(batch_size=10, job_ids=None):
+    """Claim and run up to `batch_size` due jobs. Returns how many ran."""
+    candidates = Job.objects.filter(_due())
+    if job_ids is not None:
+        candidates = candidates.filter(pk__in=job_ids)
+    candidates = list(candidates.order_by("-priority", "run_at").values_list("id", flat=True)[:batch_size])
+
+    ran = 0
+    for job_id in candidates:
+        # Claimed one at a time so the lease covers only the job being run
+        job = claim(job_id)
+        if job is not None:
+            execute(job)
+            ran += 1
+    return ran
+
+
+def execute(job):
+    if job.attempts > job.max_attempts:
+        # Its last attempt never finished: the worker died while running it
+        _bury(job, job.last_error or "Lease expired on the final attempt")
+        return
+
+    handler = _handlers.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f"No job handler registered for {job.name!r}")
+        handler(**job.payload)
+    except Exception as e:
+        _failed(job, e)
+        return
+    # Matching attempts: if the lease ran out and another worker reclaimed
+    # the job meanwhile, the row is theirs now
+    Job.objects.filter(pk=job.pk, attempts=job.attempts).delete()
+
+
+def _failed(job, error):
+    detail = "".join(traceback.format_exception(error))[-4000:]
+    if job.attempts >= job.max_attempts:
+        _bury(job, detail)
+        return
+
+    config = get_config()
+    delay = min(config["MAX_DELAY"], config["BASE_DELAY"] * 2 ** (job.attempts - 1)) * random.uniform(0.5, 1.0)
+    Job.objects.filter(pk=job.pk, attempts=job.attempts).update(
+        status=Job.QUEUED,
+        run_at=now() + timedelta(seconds=delay),
+        locked_until=None,
+        last_error=detail,
+    )
+    logger.warning(f"Job {job} failed (attempt {job.attempts}/{job.max_attempts}), retrying in {delay:.0f}s: {error}")
+
+
+def _bury(job, detail):
+    with transaction.atomic():
+        DeadJob.objects.create(
+            name=job.name,
+            payload=job.payload,
+            attempts=job.attempts,
+            last_error=detail,
+            created_at=job.created_at,
+        )
+        Job.objects.filter(pk=job.pk).delete()
+    logger.error(f"Job {job} moved to the dead-letter table after {job.attempts} attempts")
+
+
+def requeue(dead_job):
+    """Put a dead-lettered job back on the queue with a fresh set of attempts."""
+    with transaction.atomic():
+        job = Job.objects.create(name=dead_job.name, payload=dead_job.payload, max_attempts=get_config()["MAX_ATTEMPTS"])
+        dead_job.delete()
+    return job
@@ -0,0 +1,131 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import now
+
+from .models import DeadJob, Job
+from .queue import claim, enqueue, execute, requeue, run_next, task
+
+calls = []
+
+
+@task("jobs.tests.record")
+def record(value):
+    calls.append((value, transaction.get_connection().in_atomic_block))
+
+
+@task("jobs.tests.fail")
+def fail():
+    raise RuntimeError("boom")
+
+
+JOB_QUEUE = {"LEASE": 60, "MAX_ATTEMPTS": 3, "BASE_DELAY": 10.0, "MAX_DELAY": 25.0}
+
+
+@override_settings(JOB_QUEUE=JOB_QUEUE)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_unknown_job_is_rejected(self):
+        with self.assertRaises(LookupError):
+            enqueue("jobs.tests.missing")
+
+    def test_claim_takes_a_due_job_once(self):
+        job = enqueue("jobs.tests.record", {"value": 1})
+
+        claimed = claim(job.id)
+        self.assertEqual(claimed.status, Job.RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertGreater(claimed.locked_until, now() + timedelta(seconds=50))
+        # Leased to the first claimant
+        self.assertIsNone(claim(job.id))
+
+    def test_claim_skips_jobs_not_yet_due(self):
+        job = enqueue("jobs.tests.record", {"value": 1}, delay=60)
+        self.assertIsNone(claim(job.id))
+        self.assertEqual(run_next(), 0)
+
+    def test_run_next_runs_by_priority_and_deletes(self):
+        enqueue("jobs.tests.record", {"value": "low"})
+        enqueue("jobs.tests.record", {"value": "high"}, priority=5)
+
+        self.assertEqual(run_next(), 2)
+        self.assertEqual([value for value, _ in calls], ["high", "low"])
+        self.assertFalse(Job.objects.exists())
+
+    @mock.patch("jobs.queue.random.uniform", return_value=1.0)
+    def test_failure_backs_off_exponentially_up_to_max_delay(self, uniform):
+        job = enqueue("jobs.tests.fail", max_attempts=5)
+
+        for attempt, delay in enumerate([10, 20, 25, 25], start=1):
+            before = now()
+            self.assertEqual(run_next(job_ids=[job.id]), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, attempt))
+            self.assertIsNone(job.locked_until)
+            self.assertIn("RuntimeError: boom", job.last_error)
+            self.assertAlmostEqual((job.run_at - before).total_seconds(), delay, delta=1)
+            # Not due again until the backoff has passed
+            self.assertEqual(run_next(job_ids=[job.id]), 0)
+            Job.objects.filter(pk=job.pk).update(run_at=now())
+
+    def test_dead_letter_after_max_attempts(self):
+        job = enqueue("jobs.tests.fail")
+
+        for _ in range(JOB_QUEUE["MAX_ATTEMPTS"]):
+            Job.objects.filter(pk=job.pk).update(run_at=now())
+            run_next()
+
+        self.assertFalse(Job.objects.exists())
+        dead = DeadJob.objects.get()
+        self.assertEqual((dead.name, dead.attempts), ("jobs.tests.fail", JOB_QUEUE["MAX_ATTEMPTS"]))
+        self.assertIn("RuntimeError: boom", dead.last_error)
+
+        job = requeue(dead)
+        self.assertEqual((job.attempts, job.max_attempts), (0, JOB_QUEUE["MAX_ATTEMPTS"]))
+        self.assertFalse(DeadJob.objects.exists())
+
+    def test_stale_lock_is_reclaimed(self):
+        job = enqueue("jobs.tests.record", {"value": 1})
+        claim(job.id)
+        self.assertEqual(run_next(), 0)
+
+        # The worker holding the lease died
+        Job.objects.filter(pk=job.pk).update(locked_until=now() - timedelta(seconds=1))
+        self.assertEqual(run_next(), 1)
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(Job.objects.exists())
+
+    def test_expired_final_attempt_is_buried_without_running(self):
+        job = enqueue("jobs.tests.record", {"value": 1}, max_attempts=1)
+        claim(job.id)
+        Job.objects.filter(pk=job.pk).update(locked_until=now() - timedelta(seconds=1))
+
+        run_next()
+        self.assertEqual(calls, [])
+        self.assertEqual(DeadJob.objects.get().last_error, "Lease expired on the final attempt")
+
+    def test_reclaimed_job_is_left_to_its_new_owner(self):
+        job = claim(enqueue("jobs.tests.record", {"value": 1}).id)
+        # Lease expired mid-run and another worker took the job over
+        Job.objects.filter(pk=job.pk).update(locked_until=now() - timedelta(seconds=1))
+        claim(job.id)
+
+        execute(job)
+        self.assertEqual(Job.objects.get().attempts, 2)
+
+
+@override_settings(JOB_QUEUE=JOB_QUEUE)
+class JobTransactionTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_handler_runs_outside_a_transaction(self):
+        enqueue("jobs.tests.record", {"value": 1})
+        run_next()
+        # Handlers wrap only their own writes, so slow I/O never holds the database lock
+        self.assertEqual(calls, [(1, False)])
+        self.assertFalse(Job.objects.exists())
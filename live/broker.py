@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIVE_UPDATES = {
+    # InProcessBroker only reaches clients of the process that published;
+    # DatabaseBroker also carries events from other processes (run_jobs, admin)
+    "BROKER": "live.broker.InProcessBroker",
+    "OPTIONS": {},
+    # Seconds between keep-alive comments, and before the server ends a
+    # stream so the browser reconnects (and picks up a fresh login session)
+    "HEARTBEAT": 15,
+    "MAX_DURATION": 5 * 60,
+    # Events buffered per connection before it is told to resync
+    "QUEUE_SIZE": 100,
+}
+
+# Put on a subscription's queue when it overflowed
+OVERFLOW = object()
+
+
+def get_config():
+    return {**DEFAULT_LIVE_UPDATES, **getattr(settings, "LIVE_UPDATES", {})}
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+class Subscription:
+    """One connected client: events are handed over to its event loop from any thread."""
+
+    def __init__(self, queue_size):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def deliver(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:
+            pass  # its loop has already closed; the subscription is on its way out
+
+    def _put(self, item):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # A client this far behind resyncs instead of replaying everything
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self, timeout):
+        """Next (id, event, data), OVERFLOW, or None after `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessBroker:
+    """
+    Pub/sub between the code that changes something and the SSE streams of
+    the users it concerns. publish() is synchronous, callable from any thread,
+    and delivers once the surrounding transaction commits.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def publish(self, channel, event, data):
+        transaction.on_commit(lambda: self._send(channel, event, data))
+
+    def _send(self, channel, event, data):
+        self._dispatch(channel, next(self._ids), event, data)
+
+    def _dispatch(self, channel, event_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver((event_id, event, data))
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    @contextmanager
+    def subscribe(self, channel):
+        """Register the calling event loop for `channel` for the duration of the block."""
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(channel, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self._subscribers.pop(channel, None)
+
+
+class DatabaseBroker(InProcessBroker):
+    """
+    Stand-in for an external broker using the LiveEvent table: publishers
+    insert a row (and prune expired ones), and one thread per web process
+    polls for new rows while it has subscribers. Polling cost is per
+    process, not per open tab.
+    """
+
+    def __init__(self, queue_size=100, poll_interval=1.0, retention=60):
+        super().__init__(queue_size)
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._pruned_at = 0.0
+
+    def _send(self, channel, event, data):
+        from live.models import LiveEvent
+
+        LiveEvent.objects.create(channel=channel, event=event, data=data)
+        # Pruned by whoever writes, at most once per `retention` per process, so
+        # the table stays small even where nothing is subscribed (run_jobs, admin)
+        if time.monotonic() - self._pruned_at > self.retention:
+            self._pruned_at = time.monotonic()
+            self.prune()
+
+    def prune(self):
+        from live.models import LiveEvent
+
+        return LiveEvent.objects.filter(created_at__lt=now() - timedelta(seconds=self.retention)).delete()[0]
+
+    @contextmanager
+    def subscribe(self, channel):
+        self._ensure_poller()
+        with super().subscribe(channel) as subscription:
+            yield subscription
+
+    def _ensure_poller(self):
+        # Started lazily, and again after a fork
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    threading.Thread(target=self._run, daemon=True, name="live-event-poller").start()
+                    self._pid = os.getpid()
+
+    def _run(self):
+        from live.models import LiveEvent
+
+        cursor = None
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                if not self.has_subscribers():
+                    cursor = None  # nobody missed anything; start from the tip next time
+                    continue
+                if cursor is None:
+                    cursor = LiveEvent.objects.order_by("-id").values_list("id", flat=True).first() or 0
+                    continue
+                rows = LiveEvent.objects.filter(id__gt=cursor).order_by("id").values_list(
+                    "id", "channel", "event", "data",
+                )[:1000]
+                for event_id, channel, event, data in rows:
+                    self._dispatch(channel, event_id, event, data)
+                    cursor = event_id
+            except Exception as e:
+                logger.error(f"Live event poller failed: {e}")
+                connection.close()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    config = get_config()
+    return import_string(config["BROKER"])(queue_size=config["QUEUE_SIZE"], **config["OPTIONS"])
+
+
+@receiver(setting_changed)
+def reset_broker(*, setting, **kwargs):
+    if setting == "LIVE_UPDATES":
+        get_broker.cache_clear()
+
+
+def publish_to_users(user_ids, event, data):
+    """Send `event` to every open page of each user in `user_ids`."""
+    broker = get_broker()
+    for user_id in set(user_ids):
+        broker.publish(user_channel(user_id), event, data)
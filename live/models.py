@@ -0,0 +1,16 @@
+from django.db import models
+
+
+class LiveEvent(models.Model):
+    """
+    Outbox for live.broker.DatabaseBroker: every web process tails this
+    table (one query per poll, however many clients it serves) and fans
+    new rows out to its own subscribers. Rows only live for a minute or so.
+    """
+    channel = models.CharField(max_length=100)
+    event = models.CharField(max_length=50)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.event} -> {self.channel}"
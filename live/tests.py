@@ -0,0 +1,145 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+
+from users.models import CustomUser
+from .broker import OVERFLOW, DatabaseBroker, InProcessBroker, get_broker, publish_to_users, user_channel
+from .models import LiveEvent
+
+IN_PROCESS = {"BROKER": "live.broker.InProcessBroker", "OPTIONS": {}, "HEARTBEAT": 0.2, "MAX_DURATION": 1}
+
+
+class InProcessBrokerTests(SimpleTestCase):
+    async def test_events_fan_out_to_every_subscriber_of_the_channel(self):
+        broker = InProcessBroker()
+        with broker.subscribe("user:1") as first, broker.subscribe("user:1") as second, \
+                broker.subscribe("user:2") as other:
+            broker._send("user:1", "notification", {"message": "Hello"})
+
+            for subscription in (first, second):
+                event_id, event, data = await subscription.get(timeout=1)
+                self.assertEqual((event, data), ("notification", {"message": "Hello"}))
+            self.assertIsNone(await other.get(timeout=0.05))
+        self.assertFalse(broker.has_subscribers())
+
+    async def test_event_ids_increase(self):
+        broker = InProcessBroker()
+        with broker.subscribe("user:1") as subscription:
+            for i in range(3):
+                broker._send("user:1", "notification", {"n": i})
+            ids = [(await subscription.get(timeout=1))[0] for _ in range(3)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 3)
+
+    async def test_slow_subscriber_is_told_to_resync(self):
+        broker = InProcessBroker(queue_size=2)
+        with broker.subscribe("user:1") as subscription:
+            for i in range(5):
+                broker._send("user:1", "notification", {"n": i})
+            # The oldest event makes room for the marker
+            self.assertEqual((await subscription.get(timeout=1))[2], {"n": 1})
+            self.assertIs(await subscription.get(timeout=1), OVERFLOW)
+            self.assertIsNone(await subscription.get(timeout=0.05))
+
+
+@override_settings(LIVE_UPDATES=IN_PROCESS)
+class LiveTestCase(TestCase):
+    def publish(self, user_ids, event, data, execute=False):
+        # Sync, so async tests run it in the thread holding the test's transaction
+        with self.captureOnCommitCallbacks(execute=execute) as callbacks:
+            publish_to_users(user_ids, event, data)
+        return callbacks
+
+
+class PublishTests(LiveTestCase):
+    async def test_published_on_commit_once_per_user(self):
+        broker = get_broker()
+        with broker.subscribe(user_channel(1)) as subscription:
+            callbacks = await sync_to_async(self.publish)([1, 1, 2], "notification", {"message": "Hi"})
+            # Nothing is sent before the transaction commits
+            self.assertIsNone(await subscription.get(timeout=0.05))
+            self.assertEqual(len(callbacks), 2)
+            for callback in callbacks:
+                callback()
+            self.assertEqual((await subscription.get(timeout=1))[1:], ("notification", {"message": "Hi"}))
+            self.assertIsNone(await subscription.get(timeout=0.05))
+
+
+class DatabaseBrokerTests(TransactionTestCase):
+    async def test_rows_written_elsewhere_reach_local_subscribers(self):
+        listener = DatabaseBroker(poll_interval=0.05)
+        # Another process, e.g. run_jobs
+        publisher = DatabaseBroker()
+        with listener.subscribe("user:1") as subscription:
+            # The poller starts from the newest row once it sees a subscriber
+            await asyncio.sleep(0.2)
+            await sync_to_async(publisher._send)("user:2", "notification", {"message": "Not yours"})
+            await sync_to_async(publisher._send)("user:1", "notification", {"message": "Hello"})
+
+            event_id, event, data = await subscription.get(timeout=2)
+            self.assertEqual((event, data), ("notification", {"message": "Hello"}))
+            self.assertEqual(event_id, await LiveEvent.objects.filter(channel="user:1").values_list("id", flat=True).aget())
+            self.assertIsNone(await subscription.get(timeout=0.2))
+
+    def test_writers_prune_expired_rows(self):
+        broker = DatabaseBroker(retention=60)
+        broker._send("user:1", "notification", {"n": 1})
+        LiveEvent.objects.update(created_at=now() - timedelta(seconds=61))
+
+        # At most once per retention period
+        broker._send("user:1", "notification", {"n": 2})
+        self.assertEqual(LiveEvent.objects.count(), 2)
+        broker._pruned_at = time.monotonic() - 61
+        broker._send("user:1", "notification", {"n": 3})
+        self.assertEqual(list(LiveEvent.objects.values_list("data", flat=True)), [{"n": 2}, {"n": 3}])
+
+
+def parse_frame(chunk):
+    fields = {}
+    for line in chunk.decode().strip().splitlines():
+        name, _, value = line.partition(": ")
+        fields[name] = value
+    return fields
+
+
+class EventStreamTests(LiveTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("210591032", password="pw")
+        self.url = reverse("live_events")
+
+    async def test_stream_carries_the_users_events(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+
+        # Subscribed once the stream has started
+        self.assertEqual(await anext(chunks), b"retry: 3000\n\n")
+        await sync_to_async(self.publish)([self.user.pk], "peer.message", {"content": "Hi"}, execute=True)
+        await sync_to_async(self.publish)([self.user.pk + 1], "peer.message", {"content": "Not yours"}, execute=True)
+
+        frame = parse_frame(await anext(chunks))
+        self.assertEqual((frame["event"], json.loads(frame["data"])), ("peer.message", {"content": "Hi"}))
+        self.assertTrue(frame["id"].isdigit())
+        self.assertEqual(await anext(chunks), b": keep-alive\n\n")
+
+        # Ended after MAX_DURATION so the browser reconnects
+        rest = [chunk async for chunk in chunks]
+        self.assertTrue(all(chunk == b": keep-alive\n\n" for chunk in rest))
+        self.assertFalse(get_broker().has_subscribers())
+
+    async def test_anonymous_users_are_sent_to_log_in(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_wsgi_requests_are_refused(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
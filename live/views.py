@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+
+from .broker import OVERFLOW, get_broker, get_config, user_channel
+
+
+def sse_frame(data, event=None, event_id=None):
+    frame = f"id: {event_id}\n" if event_id is not None else ""
+    frame += f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+@login_required
+async def events(request):
+    """
+    Server-Sent Events stream of everything published to the current user:
+    new chat messages from their other tabs, peer messages and notifications.
+    Only served under ASGI (see mental_health_chatbot/asgi.py).
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Method not allowed."}, status=405)
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI every open page would hold a worker thread for the whole
+        # stream. 204 tells EventSource to stop reconnecting; pages then work
+        # as before, just without live updates.
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    config = get_config()
+    broker = get_broker()
+
+    async def event_stream():
+        with broker.subscribe(user_channel(user.pk)) as subscription:
+            # Browsers reconnect on their own after a stream ends
+            yield "retry: 3000\n\n"
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + config["MAX_DURATION"]
+            while (remaining := deadline - loop.time()) > 0:
+                item = await subscription.get(timeout=min(config["HEARTBEAT"], remaining))
+                if item is None:
+                    yield ": keep-alive\n\n"
+                elif item is OVERFLOW:
+                    yield sse_frame({}, event="resync")
+                    return
+                else:
+                    event_id, event, data = item
+                    yield sse_frame(data, event=event, event_id=event_id)
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
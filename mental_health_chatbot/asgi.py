@@ -1,17 +1,9 @@
 import os
-import django
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from chatbot import urls as chatbot_urls
+
+from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mental_health_chatbot.settings')
-django.setup()
 
-application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
-        URLRouter(
-            chatbot_urls.websocket_urlpatterns
-        )
-    ),
-})
\ No newline at end of file
+# Run under an ASGI server (e.g. `uvicorn mental_health_chatbot.asgi:application`)
+# so streamed chat replies don't pin a worker while the model is generating.
+application = get_asgi_application()
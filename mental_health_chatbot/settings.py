@@ -30,16 +30,20 @@ INSTALLED_APPS = [
     'mood.apps.MoodConfig',
     'resources.apps.ResourcesConfig',
     'adminpanel.apps.AdminpanelConfig',
+    'jobs.apps.JobsConfig',
+    'live.apps.LiveConfig',
     'widget_tweaks',
 ]
 
 MIDDLEWARE = [
+    'middleware.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'middleware.profile_cache.ProfileGateMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -47,7 +51,8 @@ ROOT_URLCONF = 'mental_health_chatbot.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also times renders for RequestMetricsMiddleware
+        'BACKEND': 'middleware.metrics.InstrumentedDjangoTemplates',
         'DIRS': [ BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -56,12 +61,14 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'users.context_processors.notifications',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'mental_health_chatbot.wsgi.application'
+ASGI_APPLICATION = 'mental_health_chatbot.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/stable/ref/settings/#databases
@@ -70,16 +77,157 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the in-memory default: in-memory SQLite fails
+        # concurrent writers at once instead of letting them wait, which breaks
+        # the tests that send overlapping requests from several threads
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+# Shared by every worker process on the host: login throttle counters, the
+# profile gate's completeness flags, sidebar groupings and dashboard fragment
+# versions must agree across workers, which the per-process default doesn't.
+# Files rather than the database so a cache hit costs no query.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('DJANGO_CACHE_DIR', BASE_DIR / 'django_cache'),
+        # Culled past this; the default 300 would drop throttle counters under load
+        'OPTIONS': {'MAX_ENTRIES': 100000},
     }
 }
 
 AUTH_USER_MODEL = 'users.CustomUser'
 DEFAULT_FROM_EMAIL = 'support@mindcare.ng'
 ADMIN_EMAIL = 'admin@mindcare.ng'  # Email for crisis notifications
+AUTHENTICATION_BACKENDS = ['users.backends.EmailOrUsernameModelBackend']
+
+# Failed logins allowed per sliding WINDOW (seconds) before attempts are
+# refused without checking the password
+LOGIN_THROTTLE = {
+    'WINDOW': 15 * 60,
+    'MAX_FAILURES_PER_USERNAME': 5,
+    'MAX_FAILURES_PER_IP': 50,
+}
+
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'home'
 LOGIN_URL = 'login'
 
+# LLM backend used by chatbot.llm. Set LLM_BACKEND=chatbot.backends.StubBackend
+# to run tests and load benchmarks offline against the in-process stub.
+LLM_BACKEND = {
+    'BACKEND': os.getenv('LLM_BACKEND', 'chatbot.backends.AzureInferenceBackend'),
+    # e.g. {'model': 'openai/gpt-4.1', 'pool_maxsize': 10, 'connection_timeout': 5, 'read_timeout': 60}
+    # or, for the stub, {'latency': 0.8, 'jitter': 0.3, 'failure_rate': 0.05}
+    'OPTIONS': {},
+    # Retry / circuit breaker policy (chatbot.resilience.ResilientBackend); None disables it
+    'RESILIENCE': {
+        'max_attempts': 3,
+        'base_delay': 0.5,
+        'max_delay': 8.0,
+        'deadline': 45.0,
+        'breaker_threshold': 5,
+        'breaker_reset': 30.0,
+        # Called as hook(event, **fields) for every upstream attempt, retry and failure
+        'metrics_hook': 'middleware.metrics.record_upstream_event',
+    },
+}
+
+# Admission control in front of the LLM backend (see chatbot/admission.py):
+# bounded concurrency, a queue ordered by intent priority and per-user fair
+# share, and 503 + Retry-After once it is full. LocalScheduler limits one
+# process; with several workers on a host, use
+# 'chatbot.admission.SQLiteScheduler' and OPTIONS {'path': BASE_DIR / 'llm_admission.sqlite3'}.
+LLM_ADMISSION = {
+    'BACKEND': 'chatbot.admission.LocalScheduler',
+    'OPTIONS': {
+        'max_concurrency': 8,
+        'max_queue': 32,
+        'max_wait': 20.0,
+        # Per-user token bucket: calls per second and burst before a user queues behind others
+        'user_rate': 0.2,
+        'user_burst': 4,
+    },
+}
+
+# Chat interaction log: JSONL written in batches from a background thread,
+# rotated and gzipped past MAX_BYTES (see chatbot/interaction_log.py)
+INTERACTION_LOG = {
+    'PATH': BASE_DIR / 'interaction_log.jsonl',
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_BYTES': 10 * 1024 * 1024,
+    'BACKUP_COUNT': 10,
+}
+
+# In-process cache of LLM replies to repeated prompts (see chatbot/response_cache.py).
+# Crisis messages always bypass it.
+CHATBOT_RESPONSE_CACHE = {
+    'MAX_ENTRIES': 1024,
+    'TTL': 60 * 60,
+    'SIMILARITY_THRESHOLD': None,  # e.g. 0.9 to also reuse replies to near-identical questions
+    # Answered without history and so cached mid-conversation too; other
+    # intents only hit the cache on a conversation's first message
+    'CONTEXT_FREE_INTENTS': ['gratitude'],
+}
+
+# History sent to the model: rolling summary + latest turns within MAX_TOKENS
+# (estimated locally, see chatbot/context.py)
+CHAT_CONTEXT = {
+    'MAX_TOKENS': 2000,
+    'SUMMARY_MAX_TOKENS': 300,
+    'SUMMARY_BATCH_TOKENS': 600,
+}
+
+# Database-backed background jobs, run by `python manage.py run_jobs` (see jobs/queue.py)
+JOB_QUEUE = {
+    'LEASE': 300,
+    'MAX_ATTEMPTS': 5,
+    'BASE_DELAY': 10.0,
+}
+
+# Server push (live.views.events). DatabaseBroker lets notifications raised by
+# run_jobs reach the web processes; InProcessBroker suits a single process.
+LIVE_UPDATES = {
+    'BROKER': 'live.broker.DatabaseBroker',
+    'OPTIONS': {'poll_interval': 1.0, 'retention': 60},
+    'HEARTBEAT': 15,
+    'MAX_DURATION': 5 * 60,
+}
+
+# Crisis messages get an immediate safety message built from
+# resources/contacts.json; the model's personalised follow-up is sent by
+# the job worker (see chatbot/crisis.py)
+CRISIS_RESPONSE = {
+    'EMERGENCY_NUMBER': '112',
+    'FOLLOW_UP': True,
+    'FOLLOW_UP_MAX_AGE': 120,
+}
+
+# Inbox paging and retention (see the prune_notifications command)
+NOTIFICATIONS = {
+    'PAGE_SIZE': 20,
+    'RETENTION_DAYS': 90,
+    'ARCHIVE': True,
+}
+
+# Pages under these prefixes (the chat, its history and search, and the
+# dashboard) redirect to the profile page until the REQUIRED_FIELDS are filled in
+PROFILE_GATE = {
+    'PROTECTED_PREFIXES': ['/c/', '/u/dashboard/'],
+    'REQUIRED_FIELDS': ['user__emergency_contact'],
+    'CACHE_TIMEOUT': 60 * 60,
+}
+
+# Request timing, DB/template/LLM time per view and slow-request sampling,
+# served at /admin-tools/metrics/ (Prometheus) and /admin-tools/slow-requests/
+REQUEST_METRICS = {
+    'SLOW_REQUEST_SECONDS': 1.0,
+    'PROFILE_SAMPLE_RATE': 0.02,
+    'TOKEN': os.getenv('METRICS_TOKEN'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/stable/ref/settings/#auth-password-validators
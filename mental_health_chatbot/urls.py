@@ -11,6 +11,7 @@ urlpatterns = [
     path('mood/', include('mood.urls')),
     path('resources/', include('resources.urls')),
     path('admin-tools/', include('adminpanel.urls')),
+    path('live/', include('live.urls')),
 
     path('privacy-policy/', privacy_policy, name='privacy'),
     path('cookie-policy/', cookie_policy, name='cookies'),
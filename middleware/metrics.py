@@ -0,0 +1,333 @@
+import cProfile
+import contextvars
+import heapq
+import io
+import itertools
+import logging
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from django.utils.timezone import now
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REQUEST_METRICS = {
+    "ENABLED": True,
+    # Requests at least this slow are logged and kept for /admin-tools/slow-requests/
+    "SLOW_REQUEST_SECONDS": 1.0,
+    "SLOW_REQUESTS_KEPT": 20,
+    # Fraction of requests run under cProfile (one at a time per process);
+    # the profile is kept only if the request turns out to be slow
+    "PROFILE_SAMPLE_RATE": 0.02,
+    "PROFILE_LINES": 30,
+    # Lets a Prometheus scraper read /admin-tools/metrics/ with "Authorization: Bearer <token>"
+    "TOKEN": None,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+PREFIX = "mindcare_"
+
+
+def get_config():
+    return {**DEFAULT_REQUEST_METRICS, **getattr(settings, "REQUEST_METRICS", {})}
+
+
+# -------- Registry -------- #
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    pairs = {**dict(labels), **extra}
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs.items()) + "}"
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms, rendered in the Prometheus text
+    format. Like the other stats in adminpanel they are per process, so
+    scrape every worker (or run one).
+    """
+
+    def __init__(self, slow_kept=20):
+        self.slow_kept = slow_kept
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._slow = []  # min-heap of (seconds, seq, record): the slowest requests seen
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, buckets, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+                self._help.setdefault(name, help_text)
+            histogram.observe(value)
+
+    def inc(self, name, value=1, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._help.setdefault(name, help_text)
+
+    def record_slow(self, seconds, record):
+        with self._lock:
+            entry = (seconds, next(self._seq), record)
+            if len(self._slow) < self.slow_kept:
+                heapq.heappush(self._slow, entry)
+            elif seconds > self._slow[0][0]:
+                heapq.heapreplace(self._slow, entry)
+
+    def slow_requests(self):
+        with self._lock:
+            return [record for _, _, record in sorted(self._slow, key=lambda entry: -entry[0])]
+
+    def render(self, gauges=()):
+        """Prometheus text exposition; `gauges` are extra (name, help, labels, value) read at scrape time."""
+        with self._lock:
+            histograms = {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+            help_texts = dict(self._help)
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# HELP {PREFIX}{name} {help_texts.get(name, '')}")
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# HELP {PREFIX}{name} {help_texts.get(name, '')}")
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (metric, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, "+Inf"), counts):
+                    cumulative += bucket_count
+                    lines.append(f"{PREFIX}{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total}")
+                lines.append(f"{PREFIX}{name}_count{_labels(labels)} {count}")
+
+        seen = set()
+        for name, help_text, labels, value in gauges:
+            if value is None:
+                continue
+            if name not in seen:
+                lines.append(f"# HELP {PREFIX}{name} {help_text}")
+                lines.append(f"# TYPE {PREFIX}{name} gauge")
+                seen.add(name)
+            lines.append(f"{PREFIX}{name}{_labels(sorted(labels.items()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry(slow_kept=get_config()["SLOW_REQUESTS_KEPT"])
+
+
+# -------- Per-request accounting -------- #
+class RequestStats:
+    __slots__ = ("db_queries", "db_seconds", "llm_calls", "llm_seconds", "template_seconds")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.template_seconds = 0.0
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def record_llm_call(kind, seconds, prompt_tokens, completion_tokens, ok=True):
+    """
+    Called by chatbot.llm around every upstream call, retries included.
+    Token counts are chatbot.context.estimate_tokens estimates: the backends
+    only return text.
+    """
+    REGISTRY.observe("llm_call_seconds", seconds, LATENCY_BUCKETS,
+                     "Wall time of chatbot LLM calls, retries included", kind=kind, ok=str(ok).lower())
+    REGISTRY.observe("llm_prompt_tokens", prompt_tokens, TOKEN_BUCKETS,
+                     "Estimated prompt tokens per LLM call", kind=kind)
+    REGISTRY.observe("llm_completion_tokens", completion_tokens, TOKEN_BUCKETS,
+                     "Estimated completion tokens per LLM call", kind=kind)
+    stats = _current.get()
+    if stats is not None:
+        stats.llm_calls += 1
+        stats.llm_seconds += seconds
+
+
+def record_admission(priority, seconds, outcome):
+    """Called by chatbot.admission for every LLM call once it is admitted, shed or timed out."""
+    REGISTRY.observe("llm_queue_wait_seconds", seconds, LATENCY_BUCKETS,
+                     "Time LLM calls waited for an admission slot", priority=priority, outcome=outcome)
+
+
+def record_upstream_event(event, **fields):
+    """UpstreamMetrics listener (LLM_BACKEND["RESILIENCE"]["metrics_hook"]): one observation per attempt."""
+    if event == "attempt":
+        REGISTRY.observe("llm_upstream_attempt_seconds", fields["latency"], LATENCY_BUCKETS,
+                         "Latency of single upstream LLM attempts", ok=str(fields.get("ok", False)).lower())
+    elif event in ("retry", "failure", "short_circuit"):
+        REGISTRY.inc("llm_upstream_events_total", help_text="Upstream retries, failures and short circuits",
+                     event=event)
+
+
+def _db_timer(stats):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats.db_queries += 1
+            stats.db_seconds += time.perf_counter() - started
+    return wrapper
+
+
+class TimedTemplate:
+    """Wraps a backend template so top-level renders count towards the request's template time."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.template_seconds += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend that times renders for RequestMetricsMiddleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+# -------- Middleware -------- #
+_profile_lock = threading.Lock()
+
+
+class RequestMetricsMiddleware:
+    """
+    Records per-view latency, DB query count and time, template render time
+    and LLM time for every request, and keeps the slowest requests (with a
+    cProfile listing when the request was sampled). Put it first in
+    MIDDLEWARE so the other middleware is timed too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_config()
+
+    def __call__(self, request):
+        if not self.config["ENABLED"]:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        # cProfile can't profile two requests at once
+        profiler = None
+        if random.random() < self.config["PROFILE_SAMPLE_RATE"] and _profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_db_timer(stats)))
+                if profiler:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler:
+                        profiler.disable()
+            elapsed = time.perf_counter() - started
+            self.record(request, response, stats, elapsed, profiler)
+            return response
+        finally:
+            _current.reset(token)
+            if profiler:
+                _profile_lock.release()
+
+    def record(self, request, response, stats, elapsed, profiler):
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        method = request.method if request.method in ("GET", "POST", "HEAD", "PUT", "PATCH", "DELETE") else "other"
+
+        REGISTRY.inc("http_requests_total", help_text="Requests by view and status",
+                     view=view, method=method, status=response.status_code)
+        REGISTRY.observe("http_request_seconds", elapsed, LATENCY_BUCKETS,
+                         "Time until the response (or the first byte of a stream) was ready", view=view, method=method)
+        REGISTRY.observe("db_queries_per_request", stats.db_queries, QUERY_COUNT_BUCKETS,
+                         "Database queries per request", view=view)
+        REGISTRY.inc("db_seconds_total", stats.db_seconds, "Time spent in database queries", view=view)
+        REGISTRY.inc("template_seconds_total", stats.template_seconds, "Time spent rendering templates", view=view)
+        REGISTRY.inc("llm_seconds_total", stats.llm_seconds, "Time spent waiting on the LLM", view=view)
+
+        if elapsed < self.config["SLOW_REQUEST_SECONDS"]:
+            return
+        record = {
+            "at": now().isoformat(),
+            "view": view,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "seconds": round(elapsed, 3),
+            "db_queries": stats.db_queries,
+            "db_seconds": round(stats.db_seconds, 3),
+            "template_seconds": round(stats.template_seconds, 3),
+            "llm_calls": stats.llm_calls,
+            "llm_seconds": round(stats.llm_seconds, 3),
+            "profile": self.format_profile(profiler) if profiler else None,
+        }
+        logger.warning(
+            f"Slow request {request.method} {request.path} ({view}): {elapsed:.2f}s, "
+            f"{stats.db_queries} queries in {stats.db_seconds:.2f}s, "
+            f"templates {stats.template_seconds:.2f}s, LLM {stats.llm_seconds:.2f}s"
+        )
+        REGISTRY.record_slow(elapsed, record)
+
+    def format_profile(self, profiler):
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(self.config["PROFILE_LINES"])
+        return out.getvalue()
@@ -1,69 +1,282 @@
-from users.models import CareerProfile, IncompleteProfileAccessLog
-from django.urls import reverse
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import connection
 from django.shortcuts import redirect
+from django.urls import NoReverseMatch, reverse
+from django.utils.functional import SimpleLazyObject
+
+from users.models import IncompleteProfileAccessLog, UserProfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_GATE = {
+    # Path prefixes that need a complete profile, matched on whole segments
+    # ("/c/" covers "/c/chat/3/" but "/chat" would not cover "/chatter/").
+    # The chat (with history and search) and the dashboard, as gated before
+    "PROTECTED_PREFIXES": ["/c/", "/u/dashboard/"],
+    # Never gated: exact URL names, and path prefixes
+    "SAFE_URL_NAMES": ["home", "login", "logout", "register", "register_credentials", "profile"],
+    "EXEMPT_PREFIXES": ["/admin/"],
+    # UserProfile lookups that must all be non-empty for the profile to count as complete
+    "REQUIRED_FIELDS": ["user__emergency_contact"],
+    "REDIRECT_URL_NAME": "profile",
+    "EXEMPT_STAFF": True,
+    "CACHE_TIMEOUT": 60 * 60,
+    # Access log rows are written in bulk from a background thread
+    "LOG_BATCH_SIZE": 100,
+    "LOG_FLUSH_INTERVAL": 5.0,
+    "LOG_QUEUE_SIZE": 10000,
+}
+
+
+def get_config():
+    return {**DEFAULT_PROFILE_GATE, **getattr(settings, "PROFILE_GATE", {})}
+
+
+# -------- Route table -------- #
+def _normalise_prefix(prefix):
+    return "/" + prefix.strip("/") + "/" if prefix.strip("/") else "/"
+
+
+def _prefixes(path):
+    """'/c/chat/3/' -> '/', '/c/', '/c/chat/', '/c/chat/3/' (segment boundaries only)."""
+    end = path.find("/")
+    while end != -1:
+        yield path[:end + 1]
+        end = path.find("/", end + 1)
+
+
+class RouteTable:
+    """
+    Safe paths and gated/exempt prefixes, resolved once. `is_gated(path)` is
+    a set lookup per path segment rather than a scan of every prefix.
+    """
+
+    def __init__(self, safe_paths, protected_prefixes, exempt_prefixes):
+        self.safe_paths = frozenset(safe_paths)
+        self.protected = frozenset(_normalise_prefix(prefix) for prefix in protected_prefixes)
+        self.exempt = frozenset(_normalise_prefix(prefix) for prefix in exempt_prefixes)
+
+    @classmethod
+    def from_settings(cls, config):
+        safe_paths = []
+        for name in config["SAFE_URL_NAMES"]:
+            try:
+                safe_paths.append(reverse(name))
+            except NoReverseMatch:
+                logger.warning(f"Profile gate: safe URL name {name!r} doesn't resolve; ignoring it")
+        static_prefixes = [prefix for prefix in (settings.STATIC_URL, settings.MEDIA_URL) if prefix]
+        return cls(safe_paths, config["PROTECTED_PREFIXES"], [*config["EXEMPT_PREFIXES"], *static_prefixes])
+
+    def is_gated(self, path):
+        if not self.protected or path in self.safe_paths:
+            return False
+        for prefix in _prefixes(path if path.endswith("/") else path + "/"):
+            # The shortest matching prefix decides, so "/admin/" beats anything under it
+            if prefix in self.exempt:
+                return False
+            if prefix in self.protected:
+                return True
+        return False
+
+
+# -------- Cached completeness -------- #
+def _status_key(user_id):
+    return f"profile_complete:{user_id}"
+
+
+def invalidate_profile_status(user_id):
+    cache.delete(_status_key(user_id))
+
+
+def profile_is_complete(user_id, config=None):
+    """Whether the user's profile has every REQUIRED_FIELDS value; cached until the profile or user is saved."""
+    config = config or get_config()
+    key = _status_key(user_id)
+    complete = cache.get(key)
+    if complete is None:
+        values = UserProfile.objects.filter(user_id=user_id).values_list(*config["REQUIRED_FIELDS"]).first()
+        complete = values is not None and all(value not in (None, "") for value in values)
+        cache.set(key, complete, config["CACHE_TIMEOUT"])
+    return complete
+
+
+def gate_fields(config=None):
+    """(UserProfile field names, CustomUser field names) that completeness depends on."""
+    profile_fields, user_fields = set(), set()
+    for lookup in (config or get_config())["REQUIRED_FIELDS"]:
+        parts = lookup.split("__")
+        if parts[0] == "user" and len(parts) > 1:
+            user_fields.add(parts[1])
+        else:
+            profile_fields.add(parts[0])
+    return profile_fields, user_fields
 
 
-class AttachCareerProfileMiddleware:
+# -------- Access log -------- #
+_STOP = object()
+
+
+class AccessLogBuffer:
+    """
+    Collects IncompleteProfileAccessLog rows and writes them with
+    bulk_create from a background thread, every `batch_size` rows or
+    `flush_interval` seconds. Rows are dropped (and counted) rather than
+    blocking a request when the queue is full.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=5.0, queue_size=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.written = 0
+        self.dropped = 0
+        self._queue = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_settings(cls):
+        config = get_config()
+        return cls(
+            batch_size=config["LOG_BATCH_SIZE"],
+            flush_interval=config["LOG_FLUSH_INTERVAL"],
+            queue_size=config["LOG_QUEUE_SIZE"],
+        )
+
+    def _ensure_worker(self):
+        # Restarted after a fork, like chatbot.interaction_log.InteractionLogger
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.queue_size)
+                    threading.Thread(target=self._run, args=(self._queue,), daemon=True,
+                                     name="profile-access-log").start()
+                    self._pid = os.getpid()
+
+    def add(self, **row):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(IncompleteProfileAccessLog(**row))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        """Block until everything added so far has been written."""
+        if self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._pid != os.getpid():
+            return
+        self.flush(timeout)
+        self._queue.put(_STOP)
+        self._pid = None
+
+    def _run(self, rows):
+        batch = []
+        waiters = []
+        flush_at = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = rows.get(timeout=max(0.0, flush_at - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                break
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None:
+                batch.append(item)
+
+            if waiters or len(batch) >= self.batch_size or time.monotonic() >= flush_at:
+                if batch:
+                    self._write(batch)
+                    batch = []
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
+                flush_at = time.monotonic() + self.flush_interval
+
+    def _write(self, batch):
+        try:
+            IncompleteProfileAccessLog.objects.bulk_create(batch)
+            self.written += len(batch)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} profile access log rows: {e}")
+        finally:
+            # This thread's own connection; don't hold it open between batches
+            connection.close()
+
+
+ACCESS_LOG = AccessLogBuffer.from_settings()
+
+
+# -------- Middleware -------- #
+def _get_profile(request):
+    if not request.user.is_authenticated:
+        return None
+    return UserProfile.objects.filter(user=request.user).select_related("student_record").first()
+
+
+class ProfileGateMiddleware:
+    """
+    Redirects users with an incomplete profile away from PROTECTED_PREFIXES
+    (see PROFILE_GATE in settings) and attaches `request.user_profile`.
+
+    The profile is attached lazily, so only views that use it query it;
+    the gate itself reads the cached completeness flag, which users.signals
+    clears whenever the profile or user is saved.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.config = get_config()
+        self._routes = None
+
+    @property
+    def routes(self):
+        # Resolved on the first request, once the URLconf can be imported
+        if self._routes is None:
+            self._routes = RouteTable.from_settings(self.config)
+        return self._routes
 
     def __call__(self, request):
-        path = request.path
+        request.user_profile = SimpleLazyObject(lambda: _get_profile(request))
 
-        if not request.user.is_authenticated:
+        if not self.routes.is_gated(request.path):
             return self.get_response(request)
 
-        if not hasattr(request, 'career_profile'):
-            try:
-                request.career_profile = CareerProfile.objects.get(user=request.user)
-            except CareerProfile.DoesNotExist:
-                request.career_profile = None
-
-        safe_paths = [
-            reverse('edit_profile'),
-            reverse('logout'),
-            reverse('login'),
-            reverse('register'),
-            '/',
-        ]
-
-        protected_paths = [
-            '/chat',
-            '/dashboard',
-            '/search',
-            '/recommendations',
-            '/courses',
-            '/career-advice',
-        ]
-
-        if path.startswith('/admin/') or path in safe_paths:
+        user = request.user
+        if not user.is_authenticated or (self.config["EXEMPT_STAFF"] and user.is_staff):
+            return self.get_response(request)
+        if profile_is_complete(user.pk, self.config):
             return self.get_response(request)
 
-        for protected in protected_paths:
-            if path.startswith(protected):
-                profile = request.career_profile
-                if not profile or not (
-                    profile.highest_education and profile.skills and profile.interests
-                ):
-                    # ✅ LOG THE ATTEMPT
-                    ip = self.get_client_ip(request)
-                    agent = request.META.get('HTTP_USER_AGENT', '')
-
-                    IncompleteProfileAccessLog.objects.create(
-                        user=request.user,
-                        attempted_path=path,
-                        ip_address=ip,
-                        user_agent=agent
-                    )
-
-                    from django.contrib import messages
-                    messages.warning(request, "Complete your career profile to access this page.")
-                    return redirect('edit_profile')
-
-        return self.get_response(request)
+        ACCESS_LOG.add(
+            user_id=user.pk,
+            attempted_path=request.path[:500],
+            ip_address=self.get_client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        )
+        messages.warning(request, "Please complete your profile to access this page.")
+        return redirect(self.config["REDIRECT_URL_NAME"])
 
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
-            return x_forwarded_for.split(',')[0]
+            return x_forwarded_for.split(',')[0].strip()
         return request.META.get('REMOTE_ADDR')
@@ -0,0 +1,137 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from users.models import CustomUser, IncompleteProfileAccessLog, UserProfile
+from .metrics import MetricsRegistry
+from .profile_cache import ACCESS_LOG, AccessLogBuffer, RouteTable, _status_key
+
+
+class RouteTableTests(SimpleTestCase):
+    def setUp(self):
+        self.routes = RouteTable(
+            safe_paths=["/c/welcome/"],
+            protected_prefixes=["/c/", "mood", "/chat"],
+            exempt_prefixes=["/admin/", "/chat/public/"],
+        )
+
+    def test_prefixes_match_whole_segments(self):
+        for path in ["/c/", "/c", "/c/chat/3/", "/mood/history/", "/chat/", "/chat"]:
+            with self.subTest(path=path):
+                self.assertTrue(self.routes.is_gated(path))
+        for path in ["/", "/chatter/", "/moods/", "/u/dashboard/", "/cc/"]:
+            with self.subTest(path=path):
+                self.assertFalse(self.routes.is_gated(path))
+
+    def test_safe_paths_and_shorter_exempt_prefixes_win(self):
+        self.assertFalse(self.routes.is_gated("/c/welcome/"))
+        self.assertTrue(self.routes.is_gated("/c/welcome/more/"))
+        # The shortest matching prefix decides
+        self.assertTrue(self.routes.is_gated("/chat/public/page/"))
+        self.assertFalse(RouteTable([], ["/admin/users/"], ["/admin/"]).is_gated("/admin/users/1/"))
+
+    def test_nothing_is_gated_without_protected_prefixes(self):
+        self.assertFalse(RouteTable([], [], []).is_gated("/c/chat/3/"))
+
+
+class ProfileGateTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user("210591032", password="pw")
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.url = reverse("chat_history")
+        # Written before the tables are flushed, so no row outlives its user
+        self.addCleanup(ACCESS_LOG.flush)
+
+    def test_incomplete_profile_is_sent_to_the_profile_page(self):
+        response = self.client.get(self.url, HTTP_USER_AGENT="tests")
+        self.assertRedirects(response, reverse("profile"), fetch_redirect_response=False)
+        # Pages outside the protected prefixes stay open
+        self.assertEqual(self.client.get(reverse("resources")).status_code, 200)
+
+        ACCESS_LOG.flush()
+        log = IncompleteProfileAccessLog.objects.get()
+        self.assertEqual((log.user_id, log.attempted_path, log.user_agent), (self.user.pk, self.url, "tests"))
+
+    def test_completing_the_profile_opens_the_gate(self):
+        self.client.get(self.url)
+        self.assertFalse(cache.get(_status_key(self.user.pk)))
+
+        self.user.emergency_contact = "08012345678"
+        self.user.save()
+        self.assertIsNone(cache.get(_status_key(self.user.pk)))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertTrue(cache.get(_status_key(self.user.pk)))
+
+    def test_unrelated_saves_keep_the_cached_status(self):
+        self.client.get(self.url)
+        self.profile.mood_count = 1
+        self.profile.save(update_fields=["mood_count"])
+        self.user.save(update_fields=["last_login"])
+        self.assertIs(cache.get(_status_key(self.user.pk)), False)
+
+    def test_staff_are_not_gated(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+class AccessLogBufferTests(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("210591032", password="pw")
+
+    def test_rows_are_written_in_batches(self):
+        buffer = AccessLogBuffer(batch_size=2, flush_interval=60)
+        self.addCleanup(buffer.close)
+        bulk_create = IncompleteProfileAccessLog.objects.bulk_create
+        batches = []
+
+        def record_batch(rows):
+            batches.append(len(rows))
+            return bulk_create(rows)
+
+        with mock.patch.object(IncompleteProfileAccessLog.objects, "bulk_create", side_effect=record_batch):
+            for i in range(3):
+                buffer.add(user_id=self.user.pk, attempted_path=f"/c/chat/{i}/", ip_address="127.0.0.1")
+            buffer.flush()
+
+        self.assertEqual(batches, [2, 1])
+        self.assertEqual(buffer.written, 3)
+        self.assertEqual(
+            sorted(IncompleteProfileAccessLog.objects.values_list("attempted_path", flat=True)),
+            ["/c/chat/0/", "/c/chat/1/", "/c/chat/2/"],
+        )
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        patcher = mock.patch("middleware.metrics.REGISTRY", self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requests_are_counted_per_view_and_status(self):
+        self.client.get(reverse("resources"))
+        self.client.get(reverse("resources"))
+        self.client.get("/no-such-page/")
+
+        text = self.registry.render()
+        self.assertIn('mindcare_http_requests_total{method="GET",status="200",view="resources"} 2', text)
+        self.assertIn('mindcare_http_requests_total{method="GET",status="404",view="unresolved"} 1', text)
+        self.assertIn('mindcare_http_request_seconds_count{method="GET",view="resources"} 2', text)
+        self.assertIn('mindcare_db_queries_per_request_count{view="resources"} 2', text)
+
+    @override_settings(REQUEST_METRICS={"SLOW_REQUEST_SECONDS": 0, "PROFILE_SAMPLE_RATE": 0})
+    def test_slow_requests_are_kept(self):
+        self.client.get(reverse("resources"))
+        [record] = self.registry.slow_requests()
+        self.assertEqual((record["view"], record["path"], record["status"]), ("resources", "/resources/", 200))
+        self.assertIsNone(record["profile"])
+
+    @override_settings(REQUEST_METRICS={"ENABLED": False})
+    def test_disabled(self):
+        self.client.get(reverse("resources"))
+        self.assertEqual(self.registry.render(), "\n")
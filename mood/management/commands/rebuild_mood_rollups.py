@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from mood import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily/weekly mood rollups (per user and per cohort) from MoodEntry'
+
+    def handle(self, *args, **options):
+        written = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} mood rollup buckets"))
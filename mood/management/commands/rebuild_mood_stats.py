@@ -0,0 +1,55 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Max, Sum
+from django.utils.timezone import localdate, now
+from mood.models import MoodEntry
+from users.models import UserProfile
+
+FIELDS = ['mood_count', 'mood_score_sum', 'mood_score_sum_squares', 'mood_recent_days',
+          'last_mood_check', 'average_mood_score']
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the running mood statistics on every UserProfile from MoodEntry in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        # Two grouped queries cover every user, however many entries there are
+        totals = {
+            row['user']: row for row in MoodEntry.objects.values('user').annotate(
+                count=Count('id'), total=Sum('score'), squares=Sum(F('score') * F('score')), latest=Max('timestamp'),
+            )
+        }
+        window = UserProfile.MOOD_WINDOW_DAYS
+        start = (localdate() - timedelta(days=window - 1)).isoformat()
+        recent = defaultdict(dict)
+        entries = MoodEntry.objects.filter(timestamp__gte=now() - timedelta(days=window + 1))
+        for user_id, timestamp, score in entries.values_list('user', 'timestamp', 'score').iterator():
+            day = localdate(timestamp).isoformat()
+            if day >= start:
+                count, total = recent[user_id].get(day, [0, 0])
+                recent[user_id][day] = [count + 1, total + score]
+
+        profiles = []
+        updated = 0
+        for profile in UserProfile.objects.only('id', 'user_id').iterator():
+            row = totals.get(profile.user_id, {})
+            profile.mood_count = row.get('count', 0)
+            profile.mood_score_sum = row.get('total') or 0
+            profile.mood_score_sum_squares = row.get('squares') or 0
+            profile.mood_recent_days = recent.get(profile.user_id, {})
+            profile.last_mood_check = row.get('latest')
+            profile.average_mood_score = (
+                profile.mood_score_sum / profile.mood_count if profile.mood_count else None
+            )
+            profiles.append(profile)
+            if len(profiles) >= options['batch_size']:
+                updated += UserProfile.objects.bulk_update(profiles, FIELDS)
+                profiles = []
+        if profiles:
+            updated += UserProfile.objects.bulk_update(profiles, FIELDS)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt mood statistics for {updated} profiles"))
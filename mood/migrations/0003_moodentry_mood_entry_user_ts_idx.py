@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mood', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='moodentry',
+            index=models.Index(fields=['user', 'timestamp'], name='mood_entry_user_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mood', '0003_moodentry_mood_entry_user_ts_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoodRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('user', 'User'), ('faculty', 'Faculty'), ('department', 'Department'), ('all', 'All students')], max_length=10)),
+                ('key', models.CharField(blank=True, max_length=201)),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week')], max_length=4)),
+                ('bucket_start', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('score_sum', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'key', 'period', 'bucket_start'), name='mood_rollup_bucket_uniq')],
+            },
+        ),
+    ]
@@ -7,5 +7,43 @@ class MoodEntry(models.Model):
     note = models.TextField(blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "timestamp"], name="mood_entry_user_ts_idx")]
+
+    def __str__(self):
+        return f"{self.user.username} - Mood {self.score} @ {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+
+class MoodRollup(models.Model):
+    """
+    Mood entry count and score sum per day or week, for one user or a cohort.
+
+    Kept current by mood.signals as entries are saved and deleted, so charts
+    read a handful of rows per bucket instead of scanning MoodEntry. Cohort
+    rows (faculty, department, all) only count users who allow data collection;
+    a user's entries are re-bucketed when their consent or faculty changes.
+    """
+    USER, FACULTY, DEPARTMENT, ALL = "user", "faculty", "department", "all"
+    SCOPE_CHOICES = [(USER, "User"), (FACULTY, "Faculty"), (DEPARTMENT, "Department"), (ALL, "All students")]
+    DAY, WEEK = "day", "week"
+    PERIOD_CHOICES = [(DAY, "Day"), (WEEK, "Week")]
+
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    key = models.CharField(max_length=201, blank=True)  # user id, faculty, "faculty/department" or ""
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket_start = models.DateField()
+    count = models.IntegerField(default=0)
+    score_sum = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key", "period", "bucket_start"], name="mood_rollup_bucket_uniq"),
+        ]
+
+    @property
+    def average(self):
+        return self.score_sum / self.count if self.count else None
+
     def __str__(self):
-        return f"{self.user.username} - Mood {self.score} @ {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"{self.scope}:{self.key} {self.period} {self.bucket_start} ({self.count})"
+
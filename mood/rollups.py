@@ -0,0 +1,152 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import localdate
+
+from users.models import UserProfile
+from .models import MoodEntry, MoodRollup
+
+# Charts never get more points than this, whatever range is asked for
+MAX_POINTS = 120
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+PROFILE_FIELDS = ("user_id", "user__allow_data_collection", "student_record__faculty", "student_record__department")
+
+
+def _targets(user_id, profile):
+    targets = [(MoodRollup.USER, str(user_id))]
+    if profile and profile["user__allow_data_collection"]:
+        targets.append((MoodRollup.ALL, ""))
+        if profile["student_record__faculty"]:
+            faculty = profile["student_record__faculty"]
+            targets.append((MoodRollup.FACULTY, faculty))
+            targets.append((MoodRollup.DEPARTMENT, f"{faculty}/{profile['student_record__department']}"))
+    return targets
+
+
+def rollup_targets(user_id):
+    """(scope, key) pairs an entry by `user_id` counts towards."""
+    return _targets(user_id, UserProfile.objects.filter(user_id=user_id).values(*PROFILE_FIELDS).first())
+
+
+def _bump(scope, key, period, bucket_start, count, score):
+    bucket = MoodRollup.objects.filter(scope=scope, key=key, period=period, bucket_start=bucket_start)
+    if bucket.update(count=F("count") + count, score_sum=F("score_sum") + score):
+        return
+    if count < 0:
+        return  # nothing recorded for that bucket (e.g. entry predates the rollups)
+    try:
+        with transaction.atomic():
+            MoodRollup.objects.create(
+                scope=scope, key=key, period=period, bucket_start=bucket_start, count=count, score_sum=score,
+            )
+    except IntegrityError:
+        # Another check-in created the bucket first
+        bucket.update(count=F("count") + count, score_sum=F("score_sum") + score)
+
+
+def apply_entry(user_id, score, timestamp, delta):
+    """Add (delta=1) or remove (delta=-1) one entry from every rollup it belongs to."""
+    day = localdate(timestamp)
+    with transaction.atomic():
+        for scope, key in rollup_targets(user_id):
+            _bump(scope, key, MoodRollup.DAY, day, delta, delta * score)
+            _bump(scope, key, MoodRollup.WEEK, week_start(day), delta, delta * score)
+
+
+def move_user(user_id, previous_targets):
+    """
+    Re-bucket every entry by `user_id` after their consent or faculty
+    changed: take them out of the cohorts in `previous_targets` they no
+    longer count towards and add them to the ones they count towards now.
+    """
+    current = rollup_targets(user_id)
+    changes = [(target, -1) for target in previous_targets if target not in current]
+    changes += [(target, 1) for target in current if target not in previous_targets]
+    if not changes:
+        return
+
+    totals = defaultdict(lambda: [0, 0])
+    daily = (
+        MoodEntry.objects.filter(user_id=user_id).annotate(day=TruncDate("timestamp"))
+        .values("day")
+        .annotate(count=Count("id"), score_sum=Sum("score"))
+    )
+    for row in daily:
+        for bucket in ((MoodRollup.DAY, row["day"]), (MoodRollup.WEEK, week_start(row["day"]))):
+            totals[bucket][0] += row["count"]
+            totals[bucket][1] += row["score_sum"]
+
+    with transaction.atomic():
+        for (scope, key), sign in changes:
+            for (period, bucket_start), (count, score_sum) in totals.items():
+                _bump(scope, key, period, bucket_start, sign * count, sign * score_sum)
+
+
+def series(scope, key, start, end, max_points=MAX_POINTS):
+    """
+    Return (period, points) for `start`..`end` inclusive, where points are
+    {"start", "count", "average"} dicts. Daily buckets are used when they
+    fit in `max_points`, weekly otherwise; weekly buckets are merged further
+    if even those are too many. Empty buckets are omitted.
+    """
+    period = MoodRollup.DAY if (end - start).days + 1 <= max_points else MoodRollup.WEEK
+    first = start if period == MoodRollup.DAY else week_start(start)
+    rows = (
+        MoodRollup.objects.filter(scope=scope, key=key, period=period, bucket_start__range=(first, end), count__gt=0)
+        .order_by("bucket_start")
+        .values_list("bucket_start", "count", "score_sum")
+    )
+
+    step = 1 if period == MoodRollup.DAY else 7
+    buckets = (end - first).days // step + 1
+    group = -(-buckets // max_points)  # ceil: buckets merged into one point
+    merged = {}
+    for bucket_start, count, score_sum in rows:
+        index = (bucket_start - first).days // step // group
+        point_start, total_count, total_score = merged.get(index, (bucket_start, 0, 0))
+        merged[index] = (point_start, total_count + count, total_score + score_sum)
+
+    return period, [
+        {"start": point_start.isoformat(), "count": count, "average": round(score_sum / count, 2)}
+        for point_start, count, score_sum in merged.values()
+    ]
+
+
+def rebuild():
+    """Recompute every rollup from MoodEntry in bulk. Returns the number of rows written."""
+    profiles = {row["user_id"]: row for row in UserProfile.objects.values(*PROFILE_FIELDS)}
+    targets = {}
+    totals = defaultdict(lambda: [0, 0])
+    daily = (
+        MoodEntry.objects.annotate(day=TruncDate("timestamp"))
+        .values("user", "day")
+        .annotate(count=Count("id"), score_sum=Sum("score"))
+    )
+    for row in daily.iterator():
+        if row["user"] not in targets:
+            targets[row["user"]] = _targets(row["user"], profiles.get(row["user"]))
+        for scope, key in targets[row["user"]]:
+            for period, bucket_start in ((MoodRollup.DAY, row["day"]), (MoodRollup.WEEK, week_start(row["day"]))):
+                total = totals[(scope, key, period, bucket_start)]
+                total[0] += row["count"]
+                total[1] += row["score_sum"]
+
+    with transaction.atomic():
+        MoodRollup.objects.all().delete()
+        MoodRollup.objects.bulk_create(
+            [
+                MoodRollup(scope=scope, key=key, period=period, bucket_start=bucket_start,
+                           count=count, score_sum=score_sum)
+                for (scope, key, period, bucket_start), (count, score_sum) in totals.items()
+            ],
+            batch_size=1000,
+        )
+    return len(totals)
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from users.models import UniversityStudent, UserProfile
+from .models import MoodEntry, MoodRollup
+from . import rollups
+
+
+def apply_mood_change(user_id, score, timestamp, delta):
+    UserProfile.apply_mood_change(user_id, score, timestamp, delta)
+    rollups.apply_entry(user_id, score, timestamp, delta)
+
+
+@receiver(pre_save, sender=MoodEntry)
+def remember_previous_mood(sender, instance, raw=False, **kwargs):
+    # Edits (admin only) are applied as remove-old + add-new
+    if instance.pk and not raw:
+        instance._previous_mood = MoodEntry.objects.filter(pk=instance.pk).values_list('score', 'timestamp').first()
+
+
+@receiver(post_save, sender=MoodEntry)
+def add_to_mood_stats(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return  # loaddata; run rebuild_mood_stats and rebuild_mood_rollups afterwards
+    previous = getattr(instance, '_previous_mood', None)
+    if previous:
+        apply_mood_change(instance.user_id, previous[0], previous[1], -1)
+    apply_mood_change(instance.user_id, instance.score, instance.timestamp, 1)
+
+
+@receiver(post_delete, sender=MoodEntry)
+def remove_from_mood_stats(sender, instance, **kwargs):
+    apply_mood_change(instance.user_id, instance.score, instance.timestamp, -1)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def drop_user_rollups(sender, instance, **kwargs):
+    MoodRollup.objects.filter(scope=MoodRollup.USER, key=str(instance.pk)).delete()
+
+
+# Cohort membership comes from these fields; rollups follow them when they change
+def remember_rollup_targets(instance, user_id, fields, update_fields):
+    if user_id is not None and (update_fields is None or fields & set(update_fields)):
+        instance._previous_rollup_targets = (user_id, rollups.rollup_targets(user_id))
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def remember_user_rollup_targets(sender, instance, raw=False, update_fields=None, **kwargs):
+    if instance.pk and not raw:
+        remember_rollup_targets(instance, instance.pk, {'allow_data_collection'}, update_fields)
+
+
+@receiver(pre_save, sender=UserProfile)
+def remember_profile_rollup_targets(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Not on create: apply_mood_change creates missing profiles mid check-in
+    if instance.pk and not raw:
+        remember_rollup_targets(instance, instance.user_id, {'student_record', 'student_record_id'}, update_fields)
+
+
+@receiver(pre_save, sender=UniversityStudent)
+def remember_student_rollup_targets(sender, instance, raw=False, update_fields=None, **kwargs):
+    if instance.pk and not raw:
+        user_id = UserProfile.objects.filter(student_record_id=instance.pk).values_list('user_id', flat=True).first()
+        remember_rollup_targets(instance, user_id, {'faculty', 'department'}, update_fields)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=UniversityStudent)
+def rebucket_moods(sender, instance, **kwargs):
+    previous = instance.__dict__.pop('_previous_rollup_targets', None)
+    if previous is not None:
+        rollups.move_user(*previous)
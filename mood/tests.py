@@ -1,3 +1,143 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+
+from users.models import CustomUser, UniversityStudent, UserProfile
+from . import rollups
+from .models import MoodEntry, MoodRollup
+
+
+def student(matric, faculty, department):
+    return UniversityStudent.objects.create(
+        matric_number=matric, first_name="Ada", last_name="Obi", faculty=faculty,
+        department=department, year_admitted=2021, email=f"{matric}@student.lasu.edu.ng",
+    )
+
+
+def buckets():
+    return set(MoodRollup.objects.filter(count__gt=0).values_list("scope", "key", "period", "bucket_start", "count", "score_sum"))
+
+
+class MoodRollupTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("210591032", password="pw")
+        self.profile = UserProfile.objects.create(user=self.user, student_record=student("210591032", "Science", "Physics"))
+        self.entries = [MoodEntry.objects.create(user=self.user, score=score) for score in (4, 8)]
+
+    def assertMatchesRebuild(self):
+        # Incremental updates must leave exactly what a full rebuild computes
+        incremental = buckets()
+        rollups.rebuild()
+        self.assertEqual(incremental, buckets())
+
+    def cohort_count(self, scope, key):
+        return sum(MoodRollup.objects.filter(scope=scope, key=key, period=MoodRollup.DAY).values_list("count", flat=True))
+
+    def test_withdrawn_consent_takes_entries_out_of_cohorts(self):
+        self.assertEqual(self.cohort_count(MoodRollup.ALL, ""), 2)
+
+        self.user.allow_data_collection = False
+        self.user.save()
+        self.assertEqual(self.cohort_count(MoodRollup.ALL, ""), 0)
+        self.assertEqual(self.cohort_count(MoodRollup.FACULTY, "Science"), 0)
+
+        # Deleting afterwards must not subtract from cohorts it already left
+        self.entries[0].delete()
+        self.assertEqual(self.cohort_count(MoodRollup.USER, str(self.user.pk)), 1)
+        self.assertMatchesRebuild()
+
+        self.user.allow_data_collection = True
+        self.user.save(update_fields=["allow_data_collection"])
+        self.assertEqual(self.cohort_count(MoodRollup.ALL, ""), 1)
+        self.assertMatchesRebuild()
+
+    def test_faculty_change_moves_entries(self):
+        self.profile.student_record = student("210591033", "Arts", "History")
+        self.profile.save()
+        self.assertEqual(self.cohort_count(MoodRollup.FACULTY, "Science"), 0)
+        self.assertEqual(self.cohort_count(MoodRollup.FACULTY, "Arts"), 2)
+        self.assertEqual(self.cohort_count(MoodRollup.ALL, ""), 2)
+
+        record = self.profile.student_record
+        record.department = "Philosophy"
+        record.save()
+        self.assertEqual(self.cohort_count(MoodRollup.DEPARTMENT, "Arts/History"), 0)
+        self.assertEqual(self.cohort_count(MoodRollup.DEPARTMENT, "Arts/Philosophy"), 2)
+
+        self.entries[1].delete()
+        self.assertMatchesRebuild()
+
+    def test_unrelated_saves_leave_rollups_alone(self):
+        before = buckets()
+        self.user.save(update_fields=["last_login"])
+        self.profile.bio = "Hello"
+        self.profile.save()
+        self.assertEqual(before, buckets())
+
+
+class MoodStatsTests(TestCase):
+    FIELDS = ("mood_count", "mood_score_sum", "mood_score_sum_squares", "mood_recent_days",
+              "last_mood_check", "average_mood_score")
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("210591032", password="pw")
+        self.entries = [MoodEntry.objects.create(user=self.user, score=score) for score in (3, 6, 9)]
+        # One check-in from a few days ago, and one from before the recent-days window
+        for entry, days in ((self.entries[0], 40), (self.entries[1], 3)):
+            entry.timestamp -= timedelta(days=days)
+            entry.save()
+
+    def stats(self):
+        return UserProfile.objects.filter(user=self.user).values(*self.FIELDS).get()
+
+    def assertMatchesRebuild(self):
+        incremental = self.stats()
+        call_command("rebuild_mood_stats", stdout=StringIO())
+        self.assertEqual(incremental, self.stats())
+
+    def test_new_entries_are_counted(self):
+        stats = self.stats()
+        self.assertEqual((stats["mood_count"], stats["mood_score_sum"], stats["mood_score_sum_squares"]), (3, 18, 126))
+        self.assertEqual(stats["average_mood_score"], 6)
+        self.assertEqual(stats["last_mood_check"], self.entries[2].timestamp)
+        self.assertEqual(len(stats["mood_recent_days"]), 2)
+        self.assertMatchesRebuild()
+
+    def test_edited_score_and_timestamp_move_the_aggregates(self):
+        self.entries[1].score = 2
+        self.entries[1].save()
+        self.assertEqual(self.stats()["mood_score_sum"], 14)
+        self.assertMatchesRebuild()
+
+        # Moved out of the recent-days window
+        self.entries[1].timestamp -= timedelta(days=60)
+        self.entries[1].save()
+        self.assertEqual(len(self.stats()["mood_recent_days"]), 1)
+        self.assertMatchesRebuild()
+
+    def test_deleting_the_latest_entry_falls_back_to_the_previous_one(self):
+        self.entries[2].delete()
+        self.assertEqual(self.stats()["last_mood_check"], self.entries[1].timestamp)
+        self.assertMatchesRebuild()
+
+        self.entries[1].delete()
+        self.entries[0].delete()
+        stats = self.stats()
+        self.assertEqual((stats["mood_count"], stats["last_mood_check"], stats["average_mood_score"]), (0, None, None))
+        self.assertEqual(stats["mood_recent_days"], {})
+        self.assertMatchesRebuild()
+
+
+class MoodSeriesTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("210591032", password="pw")
+        self.client.force_login(self.user)
 
-# Create your tests here.
+    def test_out_of_range_days_is_rejected(self):
+        response = self.client.get(reverse("mood_series"), {"days": 1000000})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("mood_series"), {"days": 10 ** 12})
+        self.assertEqual(response.status_code, 400)
@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path('check/', views.mood_check, name='mood_check'),
     path('history/', views.mood_history, name='mood_history'),
+    path('series/', views.mood_series, name='mood_series'),
+    path('series/cohort/', views.cohort_mood_series, name='cohort_mood_series'),
 ]
\ No newline at end of file
@@ -10,9 +10,8 @@ def mood_check(request):
         if form.is_valid():
             mood = form.save(commit=False)
             mood.user = request.user
+            # Running stats on the profile are updated by mood.signals
             mood.save()
-
-            request.user.userprofile.update_mood_stats()
             return redirect('mood_history')
     else:
         form = MoodEntryForm()
@@ -20,26 +19,84 @@ def mood_check(request):
     return render(request, 'mood/mood_check.html', {'form': form})
 
 
-from django.db.models import Avg
-from django.utils.timezone import now, timedelta
+from datetime import date, timedelta
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.utils.timezone import localdate
+from users.models import UserProfile
+from .models import MoodRollup
+from . import rollups
 
 @login_required
 def mood_history(request):
-    moods = MoodEntry.objects.filter(user=request.user).order_by('timestamp')
+    moods = MoodEntry.objects.filter(user=request.user)
 
-    average_mood = moods.aggregate(avg_score=Avg('score'))['avg_score'] or 0
+    # Average comes from the running stats on the profile; the chart loads from mood_series
+    profile = UserProfile.objects.filter(user=request.user).only('average_mood_score').first()
+    average_mood = profile.average_mood_score if profile and profile.average_mood_score else 0
     highest_mood = moods.order_by('-score', '-timestamp').first()
     lowest_mood = moods.order_by('score', 'timestamp').first()
     recent_moods = moods.order_by('-timestamp')[:10]  # Last 10 moods
-    all_moods = list(moods)
 
     context = {
-        'moods': moods,
         'average_mood': average_mood,
         'highest_mood': highest_mood,
         'lowest_mood': lowest_mood,
         'recent_moods': recent_moods,
-        'all_moods': all_moods,
     }
     return render(request, 'mood/mood_history.html', context)
 
+
+def _series_response(scope, key, request, default_start):
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else localdate()
+        if request.GET.get('days'):
+            start = end - timedelta(days=int(request.GET['days']) - 1)
+        elif request.GET.get('start'):
+            start = date.fromisoformat(request.GET['start'])
+        else:
+            start = default_start()
+        points = min(int(request.GET.get('points', rollups.MAX_POINTS)), rollups.MAX_POINTS)
+    except (ValueError, OverflowError):  # OverflowError: ?days= reaching past year 1
+        return JsonResponse({"error": "Invalid range."}, status=400)
+    if start > end or points < 1:
+        return JsonResponse({"error": "Invalid range."}, status=400)
+
+    period, series = rollups.series(scope, key, start, end, max_points=points)
+    return JsonResponse({
+        "scope": scope,
+        "key": key,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "period": period,
+        "points": series,
+    })
+
+
+def _first_bucket(scope, key):
+    first = (
+        MoodRollup.objects.filter(scope=scope, key=key, period=MoodRollup.DAY, count__gt=0)
+        .order_by('bucket_start').values_list('bucket_start', flat=True).first()
+    )
+    return first or localdate()
+
+
+@login_required
+def mood_series(request):
+    """Downsampled daily/weekly average mood for the current user: ?days=30 or ?start=&end=."""
+    key = str(request.user.pk)
+    return _series_response(MoodRollup.USER, key, request, lambda: _first_bucket(MoodRollup.USER, key))
+
+
+@staff_member_required
+def cohort_mood_series(request):
+    """
+    Same as mood_series for consenting students as a whole (?scope=all), a
+    faculty (?scope=faculty&key=Science) or a department
+    (?scope=department&key=Science/Physics).
+    """
+    scope = request.GET.get('scope', MoodRollup.ALL)
+    if scope not in (MoodRollup.ALL, MoodRollup.FACULTY, MoodRollup.DEPARTMENT):
+        return JsonResponse({"error": "Unknown scope."}, status=400)
+    key = '' if scope == MoodRollup.ALL else request.GET.get('key', '')
+    return _series_response(scope, key, request, lambda: _first_bucket(scope, key))
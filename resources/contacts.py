@@ -0,0 +1,32 @@
+import json
+import logging
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+
+def contacts_path():
+    return getattr(settings, "EMERGENCY_CONTACTS_PATH", None) or os.path.join(
+        settings.BASE_DIR, "resources", "contacts.json"
+    )
+
+
+@lru_cache(maxsize=None)
+def load_contacts():
+    """
+    Emergency contacts grouped by heading, read once per process. Edits to
+    contacts.json take effect on restart.
+    """
+    with open(contacts_path(), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@receiver(setting_changed)
+def reset_contacts(*, setting, **kwargs):
+    if setting == "EMERGENCY_CONTACTS_PATH":
+        load_contacts.cache_clear()
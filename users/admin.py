@@ -1,7 +1,8 @@
 # users/admin.py
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, UniversityStudent, UserProfile, Notification
+from .models import CustomUser, UniversityStudent, UserProfile, Notification, IncompleteProfileAccessLog
+from .notifications import recount_unread
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -31,7 +32,7 @@ class UniversityStudentAdmin(admin.ModelAdmin):
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'get_student_matric', 'last_mood_check', 'average_mood_score')
+    list_display = ('user', 'get_student_matric', 'last_mood_check', 'average_mood_score', 'mood_count')
     list_filter = ('last_mood_check',)
     search_fields = ('user__username', 'user__email', 'student_record__matric_number')
     ordering = ('-last_mood_check',)
@@ -47,7 +48,28 @@ class NotificationAdmin(admin.ModelAdmin):
     search_fields = ('recipient__username', 'message')
     ordering = ('-created_at',)
     readonly_fields = ('created_at',)
-    
+
+    # Admin edits bypass users.notifications, so resync the affected counters
+    def save_model(self, request, obj, form, change):
+        previous = Notification.objects.filter(pk=obj.pk).values_list('recipient_id', flat=True).first()
+        super().save_model(request, obj, form, change)
+        recount_unread({obj.recipient_id, previous} - {None})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        recount_unread([obj.recipient_id])
+
+    def delete_queryset(self, request, queryset):
+        recipients = set(queryset.values_list('recipient_id', flat=True))
+        super().delete_queryset(request, queryset)
+        recount_unread(recipients)
+
     def get_message_preview(self, obj):
         return obj.message[:50] + '...' if len(obj.message) > 50 else obj.message
-    get_message_preview.short_description = 'Message Preview'
\ No newline at end of file
+    get_message_preview.short_description = 'Message Preview'
+@admin.register(IncompleteProfileAccessLog)
+class IncompleteProfileAccessLogAdmin(admin.ModelAdmin):
+    list_display = ('user', 'attempted_path', 'ip_address', 'timestamp')
+    list_filter = ('timestamp',)
+    search_fields = ('user__username', 'attempted_path')
+    ordering = ('-timestamp',)
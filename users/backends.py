@@ -1,19 +1,38 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from .throttle import LOGIN_THROTTLE, normalize_identifier
 
 User = get_user_model()
 
 class EmailOrUsernameModelBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
-        try:
-            # Allow login with either username or email
-            user = User.objects.get(email=username)
-        except User.DoesNotExist:
-            try:
-                user = User.objects.get(username=username)
-            except User.DoesNotExist:
-                return None
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if not username or password is None:
+            return None
 
-        if user.check_password(password) and self.user_can_authenticate(user):
+        # Rejected before any hashing; PermissionDenied stops the other backends too
+        if LOGIN_THROTTLE.retry_after(request, username):
+            raise PermissionDenied("Too many failed login attempts")
+
+        # Allow login with either username (matric number) or email, in one query
+        # on indexed columns that are stored normalised
+        identifier = normalize_identifier(username)
+        match = Q(username__in={username.strip(), identifier})
+        if "@" in identifier:
+            match |= Q(email=identifier)
+        candidates = list(User.objects.filter(match)[:2])
+        # An email match wins, as it did when email was tried first
+        user = next((c for c in candidates if c.email and c.email == identifier), None) \
+            or (candidates[0] if candidates else None)
+
+        if user is None:
+            # Hash anyway so response time doesn't reveal which accounts exist
+            User().set_password(password)
+        elif user.check_password(password) and self.user_can_authenticate(user):
+            LOGIN_THROTTLE.reset(username)
             return user
+        LOGIN_THROTTLE.record_failure(request, username)
         return None
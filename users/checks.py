@@ -0,0 +1,24 @@
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+from .throttle import LOGIN_THROTTLE
+
+
+@register(Tags.caches)
+def check_login_throttle_cache(app_configs, **kwargs):
+    """
+    The failure counters must be seen by every worker process; in a
+    per-process cache each worker would allow its own MAX_FAILURES.
+    """
+    cache = LOGIN_THROTTLE.cache
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        return [Error(
+            f"LOGIN_THROTTLE uses the {type(cache).__name__} cache {LOGIN_THROTTLE.cache_alias!r}, "
+            "which isn't shared between worker processes.",
+            hint="Point CACHES (or LOGIN_THROTTLE['CACHE']) at a shared backend such as "
+                 "FileBasedCache, DatabaseCache, Redis or Memcached.",
+            id="users.E001",
+        )]
+    return []
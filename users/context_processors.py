@@ -0,0 +1,16 @@
+from .fragments import FRAGMENT_CACHE_TIMEOUT, NOTIFICATIONS, fragment_version
+
+
+def notifications(request):
+    """Unread badge and latest notifications for the layout's notification menu."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'fragment_cache_timeout': FRAGMENT_CACHE_TIMEOUT}
+    return {
+        # Denormalised counter on the already-loaded user: no query
+        'unread_notifications': user.unread_notification_count,
+        # Lazy; only queried when the cached menu fragment has to be re-rendered
+        'recent_notifications': user.notifications.order_by('-id')[:5],
+        'notifications_version': fragment_version(NOTIFICATIONS, user.pk),
+        'fragment_cache_timeout': FRAGMENT_CACHE_TIMEOUT,
+    }
@@ -3,7 +3,7 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.core.exceptions import ValidationError
 from .models import *
-from django.contrib.auth import get_user_model
+from .throttle import LOGIN_THROTTLE
 
 
 class StudentVerificationForm(forms.Form):
@@ -101,14 +101,18 @@ class CustomAuthenticationForm(AuthenticationForm):
         })
     )
 
-    def clean_username(self):
-        username = self.cleaned_data.get('username', '').strip().upper()
-
-        # Ensure matric number exists as a username
-        User = get_user_model()
-        if not User.objects.filter(username=username).exists():
-            raise ValidationError("This matric number is not registered.")
-        return username
+    def clean(self):
+        # Checked here too so the user is told why, instead of "invalid login"
+        wait = LOGIN_THROTTLE.retry_after(self.request, self.data.get('username'))
+        if wait:
+            raise ValidationError(
+                f"Too many failed attempts. Please try again in {max(1, round(wait / 60))} minute(s).",
+                code='throttled',
+            )
+        # No separate lookup of the username: the backend finds the account by
+        # matric number or email in one query, and an unknown account counts
+        # against the throttle like a wrong password
+        return super().clean()
     
 
 class CombinedProfileForm(forms.ModelForm):
@@ -136,12 +140,14 @@ class CombinedProfileForm(forms.ModelForm):
     def save(self, commit=True):
         profile = super().save(commit=False)
         if commit:
-            profile.save()
+            # Likewise the profile's mood aggregates are maintained elsewhere
+            profile.save(update_fields=self._meta.fields)
             # Save related CustomUser fields
             self.user_instance.preferred_name = self.cleaned_data['preferred_name']
             self.user_instance.emergency_contact = self.cleaned_data['emergency_contact']
             self.user_instance.allow_data_collection = self.cleaned_data['allow_data_collection']
-            self.user_instance.save()
+            # Only these fields: a full save would write back a stale unread_notification_count
+            self.user_instance.save(update_fields=['preferred_name', 'emergency_contact', 'allow_data_collection'])
         return profile
 
     
\ No newline at end of file
@@ -0,0 +1,33 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Seconds a rendered panel may be reused; versions change on every relevant write
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, "DASHBOARD_FRAGMENT_CACHE_TIMEOUT", 60 * 10)
+
+CONVERSATIONS = "conversations"
+NOTIFICATIONS = "notifications"
+
+
+def _version_key(name, user_id):
+    return f"fragment-version:{name}:{user_id}"
+
+
+def fragment_version(name, user_id):
+    """
+    Token to pass as a {% cache %} vary_on argument for a per-user panel.
+    Touching the panel changes the token, so the old rendering is simply
+    never looked up again.
+    """
+    return cache.get_or_set(_version_key(name, user_id), lambda: uuid.uuid4().hex, None)
+
+
+def touch_fragments(name, user_ids):
+    """Invalidate panel `name` for `user_ids` once the current transaction commits."""
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: cache.set_many(
+            {_version_key(name, user_id): uuid.uuid4().hex for user_id in user_ids}, None,
+        ))
@@ -1,79 +1,61 @@
-import json
-from django.core.management.base import BaseCommand
-from django.db.utils import IntegrityError
-from users.models import UniversityStudent
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
 from pathlib import Path
+from users.roster import READERS, detect_format, import_roster
+
+# Error lines printed before the rest are only counted
+MAX_REPORTED_ERRORS = 50
+
 
 class Command(BaseCommand):
-    help = 'Loads student data from students.json (in project root) into UniversityStudent model'
+    help = 'Imports (upserts) the student roster into UniversityStudent from JSON, JSON Lines or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', default=None,
+                            help='Roster file (default: students.json in the project root)')
+        parser.add_argument('--format', choices=sorted(READERS), help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without writing')
+        parser.add_argument('--diff', action='store_true', help='Print the changed fields of each updated student')
+        parser.add_argument('--skip-existing', action='store_true',
+                            help='Leave students already on the roster untouched instead of updating them')
 
     def handle(self, *args, **options):
-        # Path to students.json in the same directory as manage.py
-        file_path = Path(__file__).resolve().parent.parent.parent.parent / 'students.json'
-
+        file_path = Path(options['file'] or Path(settings.BASE_DIR) / 'students.json')
         if not file_path.exists():
-            self.stdout.write(self.style.ERROR(f"File not found: {file_path}"))
-            return
+            raise CommandError(f"File not found: {file_path}")
+        reader = READERS[options['format'] or detect_format(file_path)]
 
+        started = time.perf_counter()
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                students = json.load(f)
-        except json.JSONDecodeError as e:
-            self.stdout.write(self.style.ERROR(f"Invalid JSON file: {e}"))
-            return
-
-        total = len(students)
-        created = 0
-        skipped = 0
-        errors = 0
-
-        for student in students:
-            try:
-                matric_number = student['matric_number'].strip().upper()
-                first_name = student['first_name'].strip()
-                last_name = student['last_name'].strip()
-                middle_name = student.get('middle_name', '').strip()
-                faculty = student['faculty'].strip()
-                department = student['department'].strip()
-                year_admitted = int(student['year_admitted'])
-                email = student['email'].strip().lower()
-
-                UniversityStudent.objects.create(
-                    matric_number=matric_number,
-                    first_name=first_name,
-                    middle_name=middle_name,
-                    last_name=last_name,
-                    faculty=faculty,
-                    department=department,
-                    year_admitted=year_admitted,
-                    email=email
-                )
-                created += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f"Added {matric_number} - {first_name} {last_name}")
-                )
-
-            except IntegrityError:
-                skipped += 1
-                self.stdout.write(
-                    self.style.WARNING(f"Skipped duplicate: {student.get('matric_number', 'UNKNOWN')}")
-                )
-            except KeyError as e:
-                errors += 1
-                self.stdout.write(
-                    self.style.ERROR(f"Missing required field {e} in record: {student}")
-                )
-            except Exception as e:
-                errors += 1
-                self.stdout.write(
-                    self.style.ERROR(f"Error processing {student.get('matric_number', 'UNKNOWN')}: {e}")
+            with open(file_path, 'r', encoding='utf-8', newline='') as f:
+                report = import_roster(
+                    reader(f),
+                    batch_size=options['batch_size'],
+                    dry_run=options['dry_run'],
+                    update_existing=not options['skip_existing'],
+                    collect_changes=options['diff'],
                 )
+        except ValueError as e:
+            raise CommandError(f"Invalid roster file: {e}")
+        elapsed = time.perf_counter() - started
+
+        for matric_number, changes in report.changes:
+            fields = ", ".join(f"{name}: {old!r} -> {new!r}" for name, (old, new) in changes.items())
+            self.stdout.write(f"~ {matric_number}: {fields}")
+        for number, matric_number, reason in report.errors[:MAX_REPORTED_ERRORS]:
+            self.stdout.write(self.style.ERROR(f"Record {number} ({matric_number}): {reason}"))
+        if len(report.errors) > MAX_REPORTED_ERRORS:
+            self.stdout.write(self.style.ERROR(f"... and {len(report.errors) - MAX_REPORTED_ERRORS} more errors"))
 
         self.stdout.write("\n" + "="*50)
         self.stdout.write(self.style.SUCCESS(
-            f"Import completed!\n"
-            f"Total records: {total}\n"
-            f"Created: {created}\n"
-            f"Skipped (duplicates): {skipped}\n"
-            f"Errors: {errors}"
-        ))
\ No newline at end of file
+            f"{'Dry run' if options['dry_run'] else 'Import'} completed in {elapsed:.1f}s!\n"
+            f"Total records: {report.total}\n"
+            f"Created: {report.created}\n"
+            f"Updated: {report.updated}\n"
+            f"Unchanged: {report.unchanged}\n"
+            f"Skipped (existing): {report.skipped}\n"
+            f"Errors: {len(report.errors)}"
+        ))
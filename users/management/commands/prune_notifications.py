@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from users.notifications import get_config, prune
+
+
+class Command(BaseCommand):
+    help = 'Archives (or deletes) notifications older than NOTIFICATIONS["RETENTION_DAYS"]; run it daily'
+
+    def add_arguments(self, parser):
+        config = get_config()
+        parser.add_argument('--days', type=int, default=config['RETENTION_DAYS'])
+        parser.add_argument('--delete', action='store_true', help='Delete instead of moving to ArchivedNotification')
+        parser.add_argument('--include-unread', action='store_true', help='Prune unread notifications too')
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'])
+
+    def handle(self, *args, **options):
+        archive = get_config()['ARCHIVE'] and not options['delete']
+        removed = prune(
+            days=options['days'],
+            archive=archive,
+            include_unread=options['include_unread'] or None,
+            batch_size=options['batch_size'],
+        )
+        action = 'Archived' if archive else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f"{action} {removed} notifications older than {options['days']} days"))
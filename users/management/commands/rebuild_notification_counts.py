@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from users.notifications import recount_unread
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every user\'s unread notification counter from Notification'
+
+    def handle(self, *args, **options):
+        updated = recount_unread()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt unread notification counts for {updated} users"))
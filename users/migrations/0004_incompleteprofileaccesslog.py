@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_userprofile_mood_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncompleteProfileAccessLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempted_path', models.CharField(max_length=500)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('user_agent', models.TextField(blank=True)),
+                ('timestamp', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='incomplete_profile_accesses', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
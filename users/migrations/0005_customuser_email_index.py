@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:35
+
+from django.db import migrations, models
+from django.db.models.functions import Lower, Trim
+
+
+def lowercase_emails(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    CustomUser.objects.update(email=Lower(Trim('email')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_incompleteprofileaccesslog'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='email',
+            field=models.EmailField(blank=True, db_index=True, max_length=254, verbose_name='email address'),
+        ),
+        migrations.RunPython(lowercase_emails, migrations.RunPython.noop),
+    ]
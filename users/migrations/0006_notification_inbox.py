@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_unread(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    users = CustomUser.objects.annotate(unread=Count('notifications', filter=Q(notifications__is_read=False)))
+    for user_id, unread in users.filter(unread__gt=0).values_list('id', 'unread'):
+        CustomUser.objects.filter(id=user_id).update(unread_notification_count=unread)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_customuser_email_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('is_read', models.BooleanField(default=False)),
+                ('link', models.URLField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='unread_notification_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'is_read', 'created_at'], name='notif_recipient_read_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivednotification',
+            name='recipient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,12 @@
-from django.db import models
+import math
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Count, F, Max, Sum
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
+from django.utils.timezone import localdate, now
 
 class UniversityStudent(models.Model):
     matric_number = models.CharField(max_length=20, unique=True)
@@ -17,6 +22,9 @@ class UniversityStudent(models.Model):
         return f"{self.matric_number} - {self.first_name} {self.last_name}"
 
 class CustomUser(AbstractUser):
+    # Indexed and stored lower-case so login by email is one exact lookup
+    email = models.EmailField(_("email address"), blank=True, db_index=True)
+
     # Additional user fields
     # phone_number = models.CharField(max_length=20, blank=True)
     date_of_birth = models.DateField(null=True, blank=True)
@@ -31,7 +39,15 @@ class CustomUser(AbstractUser):
         default=True,
         help_text="Allow anonymized data to be used for improving the service"
     )
+
+    # Denormalised from Notification so the unread badge costs no query;
+    # kept in step by users.notifications (and recounted by the admin on edits)
+    unread_notification_count = models.PositiveIntegerField(default=0)
     
+    def save(self, *args, **kwargs):
+        self.email = (self.email or "").strip().lower()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.username} ({self.email})"
 
@@ -49,27 +65,156 @@ class UserProfile(models.Model):
     last_mood_check = models.DateTimeField(null=True, blank=True)
     average_mood_score = models.FloatField(null=True, blank=True)
 
+    # Running mood aggregates, kept up to date by mood.signals on every
+    # MoodEntry save/delete so a check-in never rescans the user's history
+    mood_count = models.PositiveIntegerField(default=0)
+    mood_score_sum = models.PositiveIntegerField(default=0)
+    mood_score_sum_squares = models.PositiveIntegerField(default=0)
+    # {"YYYY-MM-DD": [count, score sum]} for the last MOOD_WINDOW_DAYS local days
+    mood_recent_days = models.JSONField(default=dict, blank=True)
+
+    MOOD_WINDOW_DAYS = 30
+
+    @classmethod
+    def apply_mood_change(cls, user_id, score, timestamp, delta):
+        """Add (delta=1) or remove (delta=-1) one mood entry from the user's running stats."""
+        with transaction.atomic():
+            profile = cls.objects.select_for_update().filter(user_id=user_id).first()
+            if profile is None:
+                if delta < 0:
+                    return None  # e.g. the user and profile are being deleted together
+                profile = cls.objects.create(user_id=user_id)
+            profile.mood_count = max(0, profile.mood_count + delta)
+            profile.mood_score_sum = max(0, profile.mood_score_sum + delta * score)
+            profile.mood_score_sum_squares = max(0, profile.mood_score_sum_squares + delta * score * score)
+            if not profile.mood_count:
+                profile.mood_score_sum = profile.mood_score_sum_squares = 0
+
+            days = profile._current_mood_days()
+            day = localdate(timestamp).isoformat()
+            if day >= profile._mood_window_start(cls.MOOD_WINDOW_DAYS):
+                count, total = days.get(day, [0, 0])
+                if count + delta > 0:
+                    days[day] = [count + delta, total + delta * score]
+                else:
+                    days.pop(day, None)
+            profile.mood_recent_days = days
+
+            if delta > 0:
+                if profile.last_mood_check is None or timestamp > profile.last_mood_check:
+                    profile.last_mood_check = timestamp
+            elif not profile.mood_count:
+                profile.last_mood_check = None
+            elif profile.last_mood_check and timestamp >= profile.last_mood_check:
+                # The latest entry went away; one indexed lookup finds the new one
+                latest = profile.user.moodentry_set.order_by('-timestamp').values_list('timestamp', flat=True).first()
+                profile.last_mood_check = latest
+
+            profile.average_mood_score = (
+                profile.mood_score_sum / profile.mood_count if profile.mood_count else None
+            )
+            profile.save(update_fields=[
+                'mood_count', 'mood_score_sum', 'mood_score_sum_squares', 'mood_recent_days',
+                'last_mood_check', 'average_mood_score',
+            ])
+        return profile
+
     def update_mood_stats(self):
+        """Recompute every mood aggregate from scratch (see the rebuild_mood_stats command)."""
         moods = self.user.moodentry_set.all()
-        if moods.exists():
-            self.last_mood_check = moods.latest('timestamp').timestamp
-            self.average_mood_score = sum(m.score for m in moods) / moods.count()
-            self.save()
+        totals = moods.aggregate(
+            count=Count('id'), total=Sum('score'), squares=Sum(F('score') * F('score')), latest=Max('timestamp'),
+        )
+        start = self._mood_window_start(self.MOOD_WINDOW_DAYS)
+        days = {}
+        recent = moods.filter(timestamp__gte=now() - timedelta(days=self.MOOD_WINDOW_DAYS + 1))
+        for timestamp, score in recent.values_list('timestamp', 'score'):
+            day = localdate(timestamp).isoformat()
+            if day >= start:
+                count, total = days.get(day, [0, 0])
+                days[day] = [count + 1, total + score]
+
+        self.mood_count = totals['count']
+        self.mood_score_sum = totals['total'] or 0
+        self.mood_score_sum_squares = totals['squares'] or 0
+        self.mood_recent_days = days
+        self.last_mood_check = totals['latest']
+        self.average_mood_score = self.mood_score_sum / self.mood_count if self.mood_count else None
+        self.save()
+
+    def _mood_window_start(self, days):
+        return (localdate() - timedelta(days=days - 1)).isoformat()
+
+    def _current_mood_days(self):
+        start = self._mood_window_start(self.MOOD_WINDOW_DAYS)
+        return {day: value for day, value in self.mood_recent_days.items() if day >= start}
+
+    def mood_window_average(self, days):
+        """Average score over the last `days` local days (including today), or None."""
+        start = self._mood_window_start(days)
+        recent = [value for day, value in self.mood_recent_days.items() if day >= start]
+        count = sum(value[0] for value in recent)
+        return sum(value[1] for value in recent) / count if count else None
+
+    @property
+    def mood_average_7d(self):
+        return self.mood_window_average(7)
+
+    @property
+    def mood_average_30d(self):
+        return self.mood_window_average(30)
+
+    @property
+    def mood_std_dev(self):
+        if not self.mood_count:
+            return None
+        mean = self.mood_score_sum / self.mood_count
+        return math.sqrt(max(0.0, self.mood_score_sum_squares / self.mood_count - mean * mean))
 
     def __str__(self):
         return f"Profile of {self.user.username}"
     
 
-from django.utils.timezone import now
 
 User = get_user_model()
 
 class Notification(models.Model):
+    """Create and mark these through users.notifications so the recipient's unread counter stays right."""
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     message = models.TextField()
     created_at = models.DateTimeField(default=now)
     is_read = models.BooleanField(default=False)
     link = models.URLField(blank=True, null=True)  # Optional link to chat or detail page
 
+    class Meta:
+        indexes = [
+            # Unread lookups and the newest-first inbox
+            models.Index(fields=['recipient', 'is_read', 'created_at'], name='notif_recipient_read_idx'),
+        ]
+
+    def __str__(self):
+        return f"To {self.recipient.username}: {self.message[:50]}"
+
+
+class ArchivedNotification(models.Model):
+    """Notifications past NOTIFICATIONS['RETENTION_DAYS'], moved out by prune_notifications."""
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications')
+    message = models.TextField()
+    created_at = models.DateTimeField()
+    is_read = models.BooleanField(default=False)
+    link = models.URLField(blank=True, null=True)
+    archived_at = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return f"To {self.recipient.username}: {self.message[:50]}"
+
+class IncompleteProfileAccessLog(models.Model):
+    """A gated page a user tried to open before completing their profile (see middleware.profile_cache)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='incomplete_profile_accesses')
+    attempted_path = models.CharField(max_length=500)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    user_agent = models.TextField(blank=True)
+    timestamp = models.DateTimeField(default=now, db_index=True)
+
     def __str__(self):
-        return f"To {self.recipient.username}: {self.message[:50]}"
\ No newline at end of file
+        return f"{self.user.username} -> {self.attempted_path}"
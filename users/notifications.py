@@ -0,0 +1,153 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from django.utils.timezone import now
+
+from live.broker import publish_to_users
+from .fragments import NOTIFICATIONS, touch_fragments
+from .models import ArchivedNotification, Notification
+
+User = get_user_model()
+
+DEFAULT_NOTIFICATIONS = {
+    "PAGE_SIZE": 20,
+    "MAX_PAGE_SIZE": 100,
+    # Notifications older than this are archived (or deleted) by prune_notifications
+    "RETENTION_DAYS": 90,
+    # Only read notifications are pruned unless this is set
+    "PRUNE_UNREAD": False,
+    "ARCHIVE": True,
+    "BATCH_SIZE": 1000,
+}
+
+
+def get_config():
+    return {**DEFAULT_NOTIFICATIONS, **getattr(settings, "NOTIFICATIONS", {})}
+
+
+# -------- Counter -------- #
+def _adjust_unread(counts):
+    """Apply {user id: delta} to the unread counters, one UPDATE per distinct delta."""
+    by_delta = {}
+    for user_id, delta in counts.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(user_id)
+    for delta, user_ids in by_delta.items():
+        User.objects.filter(pk__in=user_ids).update(
+            unread_notification_count=Greatest(F("unread_notification_count") + delta, 0)
+        )
+
+
+def recount_unread(user_ids=None):
+    """Recompute the unread counters from Notification (see rebuild_notification_counts)."""
+    users = User.objects.all() if user_ids is None else User.objects.filter(pk__in=user_ids)
+    counts = dict(
+        users.annotate(unread=Count("notifications", filter=Q(notifications__is_read=False)))
+        .values_list("id", "unread")
+    )
+    by_count = {}
+    for user_id, unread in counts.items():
+        by_count.setdefault(unread, []).append(user_id)
+    with transaction.atomic():
+        for unread, ids in by_count.items():
+            User.objects.filter(pk__in=ids).update(unread_notification_count=unread)
+        touch_fragments(NOTIFICATIONS, counts)
+    return len(counts)
+
+
+# -------- Writes -------- #
+def notify(recipients, message, link=None):
+    """
+    Send `message` to every user in `recipients` (users or ids): one
+    bulk insert and one counter UPDATE, however many recipients there are.
+    """
+    recipient_ids = [getattr(recipient, "pk", recipient) for recipient in recipients]
+    if not recipient_ids:
+        return []
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(
+            [Notification(recipient_id=user_id, message=message, link=link) for user_id in recipient_ids],
+            batch_size=get_config()["BATCH_SIZE"],
+        )
+        _adjust_unread(Counter(recipient_ids))
+        # Delivered on commit; clients bump their badge by one per event
+        publish_to_users(recipient_ids, "notification", {"message": message, "link": link})
+        touch_fragments(NOTIFICATIONS, recipient_ids)
+    return created
+
+
+def mark_read(user, ids=None):
+    """Mark `user`'s notifications (all, or just `ids`) read. Returns the new unread count."""
+    with transaction.atomic():
+        # Locks the counter row so concurrent mark_read calls can't double-subtract
+        unread = User.objects.select_for_update().values_list("unread_notification_count", flat=True).get(pk=user.pk)
+        pending = Notification.objects.filter(recipient=user, is_read=False)
+        if ids is not None:
+            pending = pending.filter(id__in=ids)
+        changed = pending.update(is_read=True)
+        if changed:
+            unread = max(0, unread - changed)
+            User.objects.filter(pk=user.pk).update(unread_notification_count=unread)
+    user.unread_notification_count = unread
+    if changed:
+        publish_to_users([user.pk], "notifications.read", {"unread": unread})
+        touch_fragments(NOTIFICATIONS, [user.pk])
+    return unread
+
+
+# -------- Reads -------- #
+def inbox_page(user, before=None, size=None, unread_only=False):
+    """
+    Newest-first page of `user`'s notifications with ids below `before`.
+    Returns (rows, cursor for the next page or None).
+    """
+    size = size or get_config()["PAGE_SIZE"]
+    rows = user.notifications.all()
+    if unread_only:
+        rows = rows.filter(is_read=False)
+    if before:
+        rows = rows.filter(id__lt=before)
+    rows = list(rows.order_by("-id")[:size + 1])
+    return rows[:size], (rows[size - 1].id if len(rows) > size else None)
+
+
+# -------- Retention -------- #
+def prune(days=None, archive=None, include_unread=None, batch_size=None):
+    """
+    Move notifications older than `days` to ArchivedNotification (or delete
+    them when `archive` is off), in batches. Returns how many were removed.
+    """
+    config = get_config()
+    days = config["RETENTION_DAYS"] if days is None else days
+    archive = config["ARCHIVE"] if archive is None else archive
+    include_unread = config["PRUNE_UNREAD"] if include_unread is None else include_unread
+    batch_size = batch_size or config["BATCH_SIZE"]
+
+    old = Notification.objects.filter(created_at__lt=now() - timedelta(days=days))
+    if not include_unread:
+        old = old.filter(is_read=True)
+
+    removed = 0
+    while True:
+        with transaction.atomic():
+            batch = list(old.order_by("id")[:batch_size])
+            if not batch:
+                return removed
+            if archive:
+                ArchivedNotification.objects.bulk_create([
+                    ArchivedNotification(
+                        recipient_id=n.recipient_id, message=n.message, created_at=n.created_at,
+                        is_read=n.is_read, link=n.link,
+                    )
+                    for n in batch
+                ])
+            Notification.objects.filter(id__in=[n.id for n in batch]).delete()
+            unread = Counter(n.recipient_id for n in batch if not n.is_read)
+            _adjust_unread({user_id: -count for user_id, count in unread.items()})
+            touch_fragments(NOTIFICATIONS, {n.recipient_id for n in batch})
+        removed += len(batch)
@@ -0,0 +1,196 @@
+import csv
+import json
+import re
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+
+from django.db import transaction
+
+from .models import UniversityStudent
+
+ROSTER_FIELDS = ["first_name", "middle_name", "last_name", "faculty", "department", "year_admitted", "email"]
+REQUIRED_FIELDS = ["matric_number", "first_name", "last_name", "faculty", "department", "year_admitted", "email"]
+
+# Whitespace and the commas between array items
+_SKIP = re.compile(r"[\s,]*")
+
+
+# -------- Streaming readers -------- #
+def iter_json_array(f, chunk_size=1 << 16):
+    """
+    Yield the objects of a top-level JSON array one at a time, reading the
+    file in chunks so memory use doesn't depend on the roster size.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    started = False
+
+    while True:
+        pos = _SKIP.match(buffer, pos).end()
+        if pos == len(buffer) or (not eof and len(buffer) - pos < chunk_size // 2):
+            if eof:
+                if not started or pos == len(buffer):
+                    raise ValueError("Unexpected end of JSON input")
+            else:
+                data = f.read(chunk_size)
+                eof = not data
+                buffer, pos = buffer[pos:] + data, 0
+                continue
+
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("Expected a JSON array of student records")
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            record, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Object straddles the chunk boundary; read more and retry
+            data = f.read(chunk_size)
+            eof = not data
+            buffer, pos = buffer[pos:] + data, 0
+            continue
+        yield record
+
+
+def iter_jsonl(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_csv(f):
+    yield from csv.DictReader(f)
+
+
+READERS = {"json": iter_json_array, "jsonl": iter_jsonl, "csv": iter_csv}
+
+
+def detect_format(path):
+    suffix = Path(path).suffix.lower().lstrip(".")
+    return {"ndjson": "jsonl"}.get(suffix, suffix) if suffix in ("json", "jsonl", "ndjson", "csv") else "json"
+
+
+# -------- Validation -------- #
+def clean_record(record):
+    """Normalise one roster record into UniversityStudent field values; raises ValueError."""
+    missing = [name for name in REQUIRED_FIELDS if not str(record.get(name) or "").strip()]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    try:
+        year_admitted = int(record["year_admitted"])
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid year_admitted {record['year_admitted']!r}")
+
+    cleaned = {
+        "matric_number": str(record["matric_number"]).strip().upper(),
+        "first_name": str(record["first_name"]).strip(),
+        "middle_name": str(record.get("middle_name") or "").strip(),
+        "last_name": str(record["last_name"]).strip(),
+        "faculty": str(record["faculty"]).strip(),
+        "department": str(record["department"]).strip(),
+        "year_admitted": year_admitted,
+        "email": str(record["email"]).strip().lower(),
+    }
+    for name, value in cleaned.items():
+        max_length = UniversityStudent._meta.get_field(name).max_length
+        if max_length and len(value) > max_length:
+            raise ValueError(f"{name} longer than {max_length} characters")
+    if "@" not in cleaned["email"]:
+        raise ValueError(f"invalid email {cleaned['email']!r}")
+    return cleaned
+
+
+# -------- Import -------- #
+@dataclass
+class ImportReport:
+    total: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)  # (record number, matric number, reason)
+    changes: list = field(default_factory=list)  # (matric number, {field: (old, new)})
+
+
+def import_roster(records, batch_size=2000, dry_run=False, update_existing=True, collect_changes=False):
+    """
+    Upsert roster records into UniversityStudent in batches.
+
+    Each batch is validated, compared against the existing rows in one
+    query, and written with a single bulk_create(update_conflicts=True) in
+    its own transaction; unchanged rows aren't written at all.
+    """
+    report = ImportReport()
+    numbered = enumerate(records, start=1)
+    while True:
+        batch = list(islice(numbered, batch_size))
+        if not batch:
+            return report
+        report.total += len(batch)
+        _import_batch(batch, report, dry_run, update_existing, collect_changes)
+
+
+def _import_batch(batch, report, dry_run, update_existing, collect_changes):
+    rows = {}
+    for number, record in batch:
+        try:
+            cleaned = clean_record(record)
+        except (ValueError, AttributeError) as e:
+            matric = record.get("matric_number", "UNKNOWN") if isinstance(record, dict) else "UNKNOWN"
+            report.errors.append((number, matric, str(e)))
+            continue
+        if cleaned["matric_number"] in rows:
+            report.errors.append((number, cleaned["matric_number"], "duplicate matric number in file"))
+            continue
+        rows[cleaned["matric_number"]] = (number, cleaned)
+
+    existing = {
+        student["matric_number"]: student
+        for student in UniversityStudent.objects.filter(matric_number__in=rows).values("matric_number", *ROSTER_FIELDS)
+    }
+    # email is unique too; a clash with a different student would abort the whole batch
+    email_owners = dict(
+        UniversityStudent.objects.filter(email__in=[cleaned["email"] for _, cleaned in rows.values()])
+        .values_list("email", "matric_number")
+    )
+
+    to_write = []
+    seen_emails = set()
+    for matric, (number, cleaned) in rows.items():
+        owner = email_owners.get(cleaned["email"])
+        if (owner and owner != matric) or cleaned["email"] in seen_emails:
+            report.errors.append((number, matric, f"email {cleaned['email']} belongs to another student"))
+            continue
+        seen_emails.add(cleaned["email"])
+
+        current = existing.get(matric)
+        if current is None:
+            report.created += 1
+        else:
+            diff = {name: (current[name], cleaned[name]) for name in ROSTER_FIELDS if current[name] != cleaned[name]}
+            if not diff:
+                report.unchanged += 1
+                continue
+            if not update_existing:
+                report.skipped += 1
+                continue
+            report.updated += 1
+            if collect_changes:
+                report.changes.append((matric, diff))
+        to_write.append(UniversityStudent(**cleaned))
+
+    if to_write and not dry_run:
+        with transaction.atomic():
+            UniversityStudent.objects.bulk_create(
+                to_write,
+                update_conflicts=True,
+                unique_fields=["matric_number"],
+                update_fields=ROSTER_FIELDS,
+            )
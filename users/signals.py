@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from middleware.profile_cache import gate_fields, invalidate_profile_status
+from .models import CustomUser, UserProfile
+
+
+def _affects_gate(fields, update_fields):
+    # Mood check-ins save the profile with update_fields on every entry
+    return update_fields is None or bool(fields & set(update_fields))
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_profile_status_on_profile_change(sender, instance, update_fields=None, **kwargs):
+    if _affects_gate(gate_fields()[0], update_fields):
+        invalidate_profile_status(instance.user_id)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_profile_status_on_user_change(sender, instance, update_fields=None, **kwargs):
+    if _affects_gate(gate_fields()[1], update_fields):
+        invalidate_profile_status(instance.pk)
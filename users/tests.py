@@ -1,3 +1,384 @@
-from django.test import TestCase
+import io
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.checks import run_checks
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+
+from chatbot.models import Conversation
+from .forms import CombinedProfileForm
+from .fragments import CONVERSATIONS, NOTIFICATIONS, fragment_version, touch_fragments
+from .models import ArchivedNotification, CustomUser, Notification, UniversityStudent, UserProfile
+from .notifications import mark_read, notify, prune, recount_unread
+from .roster import import_roster, iter_json_array
+from .throttle import LOGIN_THROTTLE, LoginThrottle
+
+
+class StudentDashboardTests(TestCase):
+    # Session, user, profile gate, profile + student record, recent notifications, recent conversations
+    COLD_QUERY_BUDGET = 6
+    # Both panels served from the fragment cache
+    WARM_QUERY_BUDGET = 3
+
+    def setUp(self):
+        cache.clear()
+        student = UniversityStudent.objects.create(
+            matric_number="210591032", first_name="Ada", last_name="Obi", faculty="Science",
+            department="Computer Science", year_admitted=2021, email="210591032@student.lasu.edu.ng",
+        )
+        self.user = CustomUser.objects.create_user("210591032", password="pw", emergency_contact="08012345678")
+        UserProfile.objects.create(user=self.user, student_record=student)
+        for i in range(8):
+            Conversation.objects.create(user=self.user, title=f"Chat {i}")
+            notify([self.user], f"Notification {i}")
+        self.client.force_login(self.user)
+        self.url = reverse("dashboard")
+
+    def get_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_budget(self):
+        _, cold = self.get_dashboard()
+        self.assertLessEqual(cold, self.COLD_QUERY_BUDGET)
+        _, warm = self.get_dashboard()
+        self.assertLessEqual(warm, self.WARM_QUERY_BUDGET)
+
+    def test_query_count_does_not_grow_with_history(self):
+        _, before = self.get_dashboard()
+        for i in range(20):
+            Conversation.objects.create(user=self.user, title=f"More {i}")
+            notify([self.user], f"More {i}")
+        cache.clear()
+        _, after = self.get_dashboard()
+        self.assertEqual(before, after)
+
+    def test_new_conversation_invalidates_panel(self):
+        self.get_dashboard()
+        # Panels are invalidated on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            Conversation.objects.create(user=self.user, title="Exam stress")
+        response, _ = self.get_dashboard()
+        self.assertContains(response, "Exam stress")
+
+    def test_renamed_conversation_invalidates_panel(self):
+        self.get_dashboard()
+        convo = Conversation.objects.filter(user=self.user).latest("started_at")
+        convo.title = "Renamed chat"
+        with self.captureOnCommitCallbacks(execute=True):
+            convo.save()
+        response, _ = self.get_dashboard()
+        self.assertContains(response, "Renamed chat")
+
+    def test_notifications_invalidate_menu(self):
+        self.get_dashboard()
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.user], "Your counsellor replied")
+        response, _ = self.get_dashboard()
+        self.assertContains(response, "Your counsellor replied")
+        self.assertEqual(response.context["unread_notifications"], 9)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_read(self.user)
+        response, _ = self.get_dashboard()
+        self.assertEqual(response.context["unread_notifications"], 0)
+        self.assertNotContains(response, 'class="dropdown-item fw-bold"')
+
+    def test_panels_are_per_user(self):
+        self.get_dashboard()
+        other = CustomUser.objects.create_user("OTHER1", password="pw", emergency_contact="08012345678")
+        UserProfile.objects.create(user=other)
+        self.client.force_login(other)
+        response, _ = self.get_dashboard()
+        self.assertNotContains(response, "Chat 7")
+        self.assertNotContains(response, "Notification 7")
+
+
+class FragmentVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_version_is_stable_until_touched_on_commit(self):
+        version = fragment_version(CONVERSATIONS, 1)
+        self.assertEqual(fragment_version(CONVERSATIONS, 1), version)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            touch_fragments(CONVERSATIONS, [1, 1])
+        # Not before the transaction commits, so a rollback leaves the panel alone
+        self.assertEqual(fragment_version(CONVERSATIONS, 1), version)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertNotEqual(fragment_version(CONVERSATIONS, 1), version)
+
+    def test_versions_are_per_panel_and_user(self):
+        others = [fragment_version(NOTIFICATIONS, 1), fragment_version(CONVERSATIONS, 2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            touch_fragments(CONVERSATIONS, [1])
+        self.assertEqual([fragment_version(NOTIFICATIONS, 1), fragment_version(CONVERSATIONS, 2)], others)
+
+    def test_touching_nobody_schedules_nothing(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            touch_fragments(CONVERSATIONS, [])
+        self.assertEqual(callbacks, [])
+
+
+def roster_record(matric, **fields):
+    return {
+        "matric_number": matric, "first_name": "Ada", "last_name": "Obi", "faculty": "Science",
+        "department": "Physics", "year_admitted": 2021, "email": f"{matric}@student.lasu.edu.ng", **fields,
+    }
+
+
+class JsonArrayReaderTests(SimpleTestCase):
+    records = [roster_record(f"21059{i:04d}", first_name="Ada " * (i % 7)) for i in range(50)]
+
+    def read(self, text, chunk_size):
+        return list(iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+
+    def test_objects_straddling_chunk_boundaries(self):
+        text = json.dumps(self.records, indent=1)
+        # Chunks smaller than one object, and sizes that land mid-token
+        for chunk_size in (16, 57, 100, 1 << 16):
+            self.assertEqual(self.read(text, chunk_size), self.records)
+
+    def test_empty_array_and_surrounding_whitespace(self):
+        self.assertEqual(self.read("  [ ]  ", 4), [])
+        self.assertEqual(self.read("\n[{\"a\": 1} , {\"b\": 2}]\n", 4), [{"a": 1}, {"b": 2}])
+
+    def test_truncated_input_is_an_error(self):
+        text = json.dumps(self.records)
+        for cut in (len(text) - 1, len(text) // 2, 1, 0):
+            with self.subTest(cut=cut), self.assertRaises(ValueError):
+                self.read(text[:cut], 64)
+
+    def test_top_level_must_be_an_array(self):
+        with self.assertRaisesMessage(ValueError, "Expected a JSON array"):
+            self.read('{"matric_number": "X"}', 64)
+
+
+class RosterImportTests(TestCase):
+    def setUp(self):
+        import_roster([roster_record("210591001"), roster_record("210591002")])
+
+    def counts(self, report):
+        return report.created, report.updated, report.unchanged, report.skipped, len(report.errors)
+
+    def test_upsert_counts(self):
+        report = import_roster([
+            roster_record("210591001"),
+            roster_record("210591002", department="Chemistry"),
+            roster_record("210591003"),
+            {"matric_number": "210591004", "first_name": "Ada"},
+        ], collect_changes=True)
+
+        self.assertEqual(self.counts(report), (1, 1, 1, 0, 1))
+        self.assertEqual(report.total, 4)
+        self.assertEqual(report.changes, [("210591002", {"department": ("Physics", "Chemistry")})])
+        self.assertEqual(UniversityStudent.objects.get(matric_number="210591002").department, "Chemistry")
+        self.assertEqual(UniversityStudent.objects.count(), 3)
+
+    def test_existing_students_can_be_left_alone(self):
+        report = import_roster([roster_record("210591002", department="Chemistry")], update_existing=False)
+        self.assertEqual(self.counts(report), (0, 0, 0, 1, 0))
+        self.assertEqual(UniversityStudent.objects.get(matric_number="210591002").department, "Physics")
+
+    def test_dry_run_reports_without_writing(self):
+        report = import_roster(
+            [roster_record("210591002", department="Chemistry"), roster_record("210591003")], dry_run=True,
+        )
+        self.assertEqual(self.counts(report), (1, 1, 0, 0, 0))
+        self.assertEqual(UniversityStudent.objects.count(), 2)
+        self.assertEqual(UniversityStudent.objects.get(matric_number="210591002").department, "Physics")
+
+    def test_email_clash_within_a_batch(self):
+        report = import_roster([
+            roster_record("210591003", email="shared@student.lasu.edu.ng"),
+            roster_record("210591004", email="Shared@student.lasu.edu.ng"),
+        ])
+        self.assertEqual(self.counts(report), (1, 0, 0, 0, 1))
+        self.assertEqual(report.errors[0][:2], (2, "210591004"))
+        self.assertFalse(UniversityStudent.objects.filter(matric_number="210591004").exists())
+
+    def test_email_clash_across_batches(self):
+        report = import_roster([
+            roster_record("210591003", email="shared@student.lasu.edu.ng"),
+            roster_record("210591004", email="shared@student.lasu.edu.ng"),
+            # Already owned by a student from an earlier import
+            roster_record("210591005", email="210591001@student.lasu.edu.ng"),
+        ], batch_size=1)
+        self.assertEqual(self.counts(report), (1, 0, 0, 0, 2))
+        self.assertEqual([error[1] for error in report.errors], ["210591004", "210591005"])
+        self.assertEqual(UniversityStudent.objects.count(), 3)
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user("210591032", email="ada.obi@student.lasu.edu.ng", password="pw")
+        self.url = reverse("login")
+
+    def login(self, username, password="pw", ip="10.0.0.1"):
+        return self.client.post(self.url, {"username": username, "password": password}, REMOTE_ADDR=ip)
+
+    def test_matric_number_or_email_in_any_case(self):
+        for username in ["210591032", " 210591032 ", "ADA.OBI@student.lasu.edu.ng", "ada.obi@student.lasu.edu.ng"]:
+            with self.subTest(username=username):
+                response = self.login(username)
+                self.assertRedirects(response, reverse("dashboard"), fetch_redirect_response=False)
+                self.client.logout()
+
+    def test_unknown_account_looks_like_a_wrong_password(self):
+        unknown = [str(message) for message in self.login("210599999").context["messages"]]
+        wrong = [str(message) for message in self.login("210591032", password="nope").context["messages"]]
+        self.assertEqual(unknown, wrong)
+        self.assertNotIn("registered", " ".join(unknown))
+
+    def test_repeated_failures_lock_the_username(self):
+        for _ in range(LOGIN_THROTTLE.limits["user"]):
+            self.login("210591032", password="nope")
+        # Even the right password is refused now, from any address
+        response = self.login("210591032", ip="10.0.0.2")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Too many failed attempts", " ".join(str(m) for m in response.context["messages"]))
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+    def test_success_resets_the_username_count(self):
+        for _ in range(LOGIN_THROTTLE.limits["user"] - 1):
+            self.login("210591032", password="nope")
+        self.assertEqual(self.login("210591032").status_code, 302)
+        self.client.logout()
+        self.login("210591032", password="nope")
+        self.assertEqual(self.login("210591032").status_code, 302)
+
+
+class LoginThrottleTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.throttle = LoginThrottle(window=100, max_per_username=4, max_per_ip=6)
+        self.request = RequestFactory().post("/", REMOTE_ADDR="10.0.0.1")
+
+    def record(self, username, times, request=None):
+        for _ in range(times):
+            self.throttle.record_failure(request or self.request, username)
+
+    @mock.patch("users.throttle.time.time", return_value=1050.0)
+    def test_limit_per_username_and_per_ip(self, _):
+        self.record("210591032", 3)
+        self.assertEqual(self.throttle.retry_after(self.request, "210591032"), 0)
+        # Counted under the normalised identifier
+        self.record("  210591032", 1)
+        self.assertGreater(self.throttle.retry_after(None, "210591032"), 0)
+
+        self.record("210591033", 2)
+        self.assertGreater(self.throttle.retry_after(self.request, "210591034"), 0)
+        other_ip = RequestFactory().post("/", REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(self.throttle.retry_after(other_ip, "210591034"), 0)
+
+    @mock.patch("users.throttle.time.time")
+    def test_previous_window_counts_by_its_overlap(self, time):
+        time.return_value = 1050.0
+        self.record("210591032", 4)
+        # Until this window has ended and then fully slid past the limit
+        self.assertEqual(self.throttle.retry_after(None, "210591032"), 50)
+
+        # A fifth into the next window the old failures weigh 4 * 0.8 = 3.2
+        time.return_value = 1120.0
+        self.assertEqual(self.throttle.retry_after(None, "210591032"), 0)
+        self.record("210591032", 1)
+        # 4.2 now; allowed again once the old weight is down to 3
+        self.assertEqual(self.throttle.retry_after(None, "210591032"), 5)
+        time.return_value = 1125.0
+        self.assertEqual(self.throttle.retry_after(None, "210591032"), 0)
+
+    @mock.patch("users.throttle.time.time", return_value=1050.0)
+    def test_reset_forgets_the_username_but_not_the_ip(self, _):
+        self.record("210591032", 6)
+        self.throttle.reset("210591032")
+        self.assertGreater(self.throttle.retry_after(self.request, "210591032"), 0)
+        self.assertEqual(self.throttle.retry_after(None, "210591032"), 0)
+
+    def test_a_per_process_cache_is_an_error(self):
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([error.id for error in run_checks(tags=["caches"])], ["users.E001"])
+        self.assertEqual(run_checks(tags=["caches"]), [])
+
+
+class NotificationCounterTests(TestCase):
+    def setUp(self):
+        self.ada = CustomUser.objects.create_user("210591032", password="pw")
+        self.ben = CustomUser.objects.create_user("210591033", password="pw")
+
+    def unread(self, user):
+        stored = CustomUser.objects.values_list("unread_notification_count", flat=True).get(pk=user.pk)
+        # The counter must always match what a recount would find
+        self.assertEqual(stored, Notification.objects.filter(recipient=user, is_read=False).count())
+        return stored
+
+    def test_notify_counts_every_recipient(self):
+        created = notify([self.ada, self.ben.pk], "Counselling hours changed")
+        self.assertEqual(len(created), 2)
+        notify([self.ada], "Your counsellor replied", link="https://mindcare.ng/c/history/")
+        self.assertEqual((self.unread(self.ada), self.unread(self.ben)), (2, 1))
+        self.assertEqual(notify([], "Nobody"), [])
+
+    def test_mark_read_some_or_all(self):
+        first, second, third = (notify([self.ada], f"Message {i}")[0] for i in range(3))
+        notify([self.ben], "Not Ada's")
+
+        self.assertEqual(mark_read(self.ada, [first.id, self.ben.notifications.get().id]), 2)
+        self.assertEqual(self.unread(self.ada), 2)
+        self.assertEqual(self.unread(self.ben), 1)
+        # Already read: nothing changes
+        self.assertEqual(mark_read(self.ada, [first.id]), 2)
+        self.assertEqual(mark_read(self.ada), 0)
+        self.assertEqual(self.ada.unread_notification_count, 0)
+        self.assertEqual(self.unread(self.ada), 0)
+
+    def test_prune_archives_old_read_notifications(self):
+        old_read, old_unread, recent = (notify([self.ada], f"Message {i}")[0] for i in range(3))
+        mark_read(self.ada, [old_read.id])
+        Notification.objects.filter(id__in=[old_read.id, old_unread.id]).update(created_at=now() - timedelta(days=100))
+
+        self.assertEqual(prune(days=90, batch_size=1), 1)
+        self.assertEqual(list(ArchivedNotification.objects.values_list("message", "is_read")), [("Message 0", True)])
+        self.assertEqual(self.unread(self.ada), 2)
+
+        self.assertEqual(prune(days=90, include_unread=True, archive=False), 1)
+        self.assertEqual(ArchivedNotification.objects.count(), 1)
+        self.assertEqual(list(Notification.objects.values_list("id", flat=True)), [recent.id])
+        self.assertEqual(self.unread(self.ada), 1)
+
+    def test_recount_repairs_drifted_counters(self):
+        notify([self.ada, self.ben], "Hello")
+        CustomUser.objects.update(unread_notification_count=7)
+        self.assertEqual(recount_unread([self.ada.pk]), 1)
+        self.assertEqual(self.unread(self.ada), 1)
+        self.assertEqual(CustomUser.objects.get(pk=self.ben.pk).unread_notification_count, 7)
+        recount_unread()
+        self.assertEqual(self.unread(self.ben), 1)
+
+    def test_profile_form_leaves_the_counter_alone(self):
+        profile = UserProfile.objects.create(user=self.ada)
+        user = CustomUser.objects.get(pk=self.ada.pk)
+        # Arrives while the form is being filled in
+        notify([self.ada], "Your counsellor replied")
+
+        form = CombinedProfileForm(
+            {"bio": "Hi", "preferred_name": "Ada", "emergency_contact": "08012345678", "allow_data_collection": "on"},
+            instance=profile, user_instance=user,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(self.unread(self.ada), 1)
+        user.refresh_from_db()
+        self.assertEqual((user.preferred_name, user.emergency_contact), ("Ada", "08012345678"))
+        self.assertEqual(UserProfile.objects.get(pk=profile.pk).bio, "Hi")
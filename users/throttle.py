@@ -0,0 +1,124 @@
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_LOGIN_THROTTLE = {
+    # Sliding window over failed logins, in seconds
+    "WINDOW": 15 * 60,
+    "MAX_FAILURES_PER_USERNAME": 5,
+    "MAX_FAILURES_PER_IP": 50,
+    # Only behind a proxy that sets it; otherwise clients can pick their own IP
+    "TRUST_X_FORWARDED_FOR": False,
+    # Must be shared by every worker process (see users.checks)
+    "CACHE": "default",
+}
+
+
+class LoginThrottle:
+    """
+    Sliding-window limit on failed logins per username and per client IP,
+    kept in the cache so it's checked before any password is hashed.
+
+    Each scope keeps a counter for the current and the previous fixed
+    window; the previous one is weighted by how much of it still overlaps
+    the sliding window, which approximates a true sliding log closely
+    without storing one entry per attempt.
+    """
+
+    def __init__(self, window=15 * 60, max_per_username=5, max_per_ip=50, trust_forwarded_for=False,
+                 cache_alias="default"):
+        self.window = window
+        self.limits = {"user": max_per_username, "ip": max_per_ip}
+        self.trust_forwarded_for = trust_forwarded_for
+        self.cache_alias = cache_alias
+
+    @classmethod
+    def from_settings(cls):
+        config = {**DEFAULT_LOGIN_THROTTLE, **getattr(settings, "LOGIN_THROTTLE", {})}
+        return cls(
+            window=config["WINDOW"],
+            max_per_username=config["MAX_FAILURES_PER_USERNAME"],
+            max_per_ip=config["MAX_FAILURES_PER_IP"],
+            trust_forwarded_for=config["TRUST_X_FORWARDED_FOR"],
+            cache_alias=config["CACHE"],
+        )
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def client_ip(self, request):
+        if request is None:
+            return None
+        if self.trust_forwarded_for and request.META.get("HTTP_X_FORWARDED_FOR"):
+            return request.META["HTTP_X_FORWARDED_FOR"].split(",")[0].strip()
+        return request.META.get("REMOTE_ADDR")
+
+    def _subjects(self, request, username):
+        subjects = []
+        if username:
+            subjects.append(("user", normalize_identifier(username)))
+        ip = self.client_ip(request)
+        if ip:
+            subjects.append(("ip", ip))
+        return subjects
+
+    def _key(self, scope, subject, bucket):
+        digest = hashlib.sha256(subject.encode("utf-8")).hexdigest()[:32]
+        return f"login-failures:{scope}:{digest}:{bucket}"
+
+    def retry_after(self, request, username):
+        """Seconds until another attempt is allowed, or 0 if it is allowed now."""
+        now = time.time()
+        bucket = int(now // self.window)
+        elapsed = (now % self.window) / self.window
+        subjects = self._subjects(request, username)
+        keys = {
+            (scope, subject): (self._key(scope, subject, bucket), self._key(scope, subject, bucket - 1))
+            for scope, subject in subjects
+        }
+        counts = self.cache.get_many([key for pair in keys.values() for key in pair])
+
+        wait = 0
+        for (scope, subject), (current_key, previous_key) in keys.items():
+            current, previous = counts.get(current_key, 0), counts.get(previous_key, 0)
+            limit = self.limits[scope]
+            if current + previous * (1 - elapsed) < limit:
+                continue
+            if current >= limit:
+                # Blocked until the next window, and then until this one's weight has dropped enough
+                wait = max(wait, self.window * (1 - elapsed + 1 - limit / current))
+            else:
+                # The previous window's weight has to drop far enough
+                needed = 1 - (limit - current) / previous
+                wait = max(wait, self.window * (needed - elapsed))
+        return math.ceil(wait)
+
+    def record_failure(self, request, username):
+        bucket = int(time.time() // self.window)
+        for scope, subject in self._subjects(request, username):
+            key = self._key(scope, subject, bucket)
+            # add() is a no-op if the key exists, so concurrent failures aren't lost
+            self.cache.add(key, 0, timeout=self.window * 2)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, 1, timeout=self.window * 2)  # evicted in between
+
+    def reset(self, username):
+        """Forget a username's failures after a successful login (the IP count is kept)."""
+        bucket = int(time.time() // self.window)
+        subject = normalize_identifier(username)
+        self.cache.delete_many([self._key("user", subject, bucket), self._key("user", subject, bucket - 1)])
+
+
+def normalize_identifier(value):
+    """Matric numbers are stored upper-case and emails lower-case."""
+    value = (value or "").strip()
+    return value.lower() if "@" in value else value.upper()
+
+
+LOGIN_THROTTLE = LoginThrottle.from_settings()
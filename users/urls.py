@@ -12,4 +12,6 @@ urlpatterns = [
     path('profile/', edit_profile, name='profile'),
 
     path('notifications/', notification_list, name='notification_list'),
+    path('notifications/inbox/', notification_inbox, name='notification_inbox'),
+    path('notifications/read/', mark_notifications_read, name='mark_notifications_read'),
 ]
\ No newline at end of file
@@ -10,6 +10,10 @@ from django.shortcuts import render
 from datetime import datetime
 from types import SimpleNamespace
 from chatbot.models import Conversation
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from . import notifications as inbox
+from .fragments import CONVERSATIONS, fragment_version
 
 # Step 1: Verify Matric Number
 def register_view(request):
@@ -70,16 +74,14 @@ def login_view(request):
     if request.method == 'POST':
         form = CustomAuthenticationForm(request, data=request.POST)
         if form.is_valid():
-            username = form.cleaned_data['username']
-            password = form.cleaned_data['password']
-            user = authenticate(username=username, password=password)
-
-            if user:
-                login(request, user)
-                messages.success(request, f"Welcome back, {username}!")
-                return redirect('dashboard')
-            else:
-                messages.error(request, "Invalid matric number or password.")
+            # The form has already authenticated; a second authenticate() would hash the password again
+            user = form.get_user()
+            login(request, user)
+            messages.success(request, f"Welcome back, {user.username}!")
+            return redirect('dashboard')
+        # The login template doesn't render form errors itself
+        for error in [e for errors in form.errors.values() for e in errors] or ["Invalid matric number or password."]:
+            messages.error(request, error)
     else:
         form = CustomAuthenticationForm()
 
@@ -97,12 +99,11 @@ def logout_view(request):
 @login_required
 def student_dashboard(request):
     user = request.user
-    profile = user.userprofile
+    # Profile and student record in one query; accounts made with createsuperuser have no profile yet
+    profile = UserProfile.objects.select_related('student_record').filter(user=user).first() \
+        or UserProfile.objects.create(user=user)
     student_record = profile.student_record  # Optional shortcut
 
-    unread = request.user.notifications.filter(is_read=False).count()
-    notifications = request.user.notifications.all()[:5]
-    
     # Greeting based on time
     hour = datetime.now().hour
     if hour < 12:
@@ -112,16 +113,16 @@ def student_dashboard(request):
     else:
         greeting = "Good evening"
 
-    # Fetch last 5 conversations
-    conversations = Conversation.objects.filter(user=user).order_by('-started_at')[:5]
+    # Last 5 conversations; lazy, so only queried when the cached panel is re-rendered
+    conversations = Conversation.objects.filter(user=user).only('id', 'title', 'started_at').order_by('-started_at')[:5]
 
     context = {
         "profile": profile,
         "student_record": student_record,
         "greeting": greeting,
         "conversations": conversations,
-        "unread_notifications": unread,
-        "recent_notifications": notifications,
+        "conversations_version": fragment_version(CONVERSATIONS, user.pk),
+        # unread_notifications / recent_notifications come from users.context_processors
     }
     return render(request, "users/dashboard.html", context)
 
@@ -142,13 +143,65 @@ def edit_profile(request):
     return render(request, "users/edit_profile.html", {"form": form})
 
 
+def _cursor(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
 @login_required
 def notification_list(request):
-    notifications = request.user.notifications.order_by('-created_at')
+    notifications, next_before = inbox.inbox_page(request.user, before=_cursor(request.GET.get('before')))
 
-    # Optional: mark all as read when visiting the page
-    notifications.filter(is_read=False).update(is_read=True)
+    # Mark what's being shown as read; the template still sees the old flags
+    unread_ids = [notif.id for notif in notifications if not notif.is_read]
+    if unread_ids:
+        inbox.mark_read(request.user, unread_ids)
 
     return render(request, 'users/notification_list.html', {
-        'notifications': notifications
-    })
\ No newline at end of file
+        'notifications': notifications,
+        'next_before': next_before,
+    })
+
+
+@login_required
+def notification_inbox(request):
+    """JSON inbox: ?before=<notification id>&limit=<n>&unread=1, newest first."""
+    config = inbox.get_config()
+    try:
+        before = int(request.GET['before']) if request.GET.get('before') else None
+        limit = min(int(request.GET.get('limit', config['PAGE_SIZE'])), config['MAX_PAGE_SIZE'])
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+    if limit < 1:
+        return JsonResponse({"error": "Invalid cursor."}, status=400)
+
+    notifications, next_before = inbox.inbox_page(
+        request.user, before=before, size=limit, unread_only=request.GET.get('unread') == '1',
+    )
+    return JsonResponse({
+        "notifications": [
+            {
+                "id": notif.id,
+                "message": notif.message,
+                "link": notif.link,
+                "is_read": notif.is_read,
+                "created_at": notif.created_at.isoformat(),
+            }
+            for notif in notifications
+        ],
+        "next_before": next_before,
+        "unread": request.user.unread_notification_count,
+    })
+
+
+@login_required
+@require_POST
+def mark_notifications_read(request):
+    """Mark the posted `ids` read, or every notification if none are given."""
+    try:
+        ids = [int(value) for value in request.POST.getlist('ids')] or None
+    except ValueError:
+        return JsonResponse({"error": "Invalid notification id."}, status=400)
+    return JsonResponse({"unread": inbox.mark_read(request.user, ids)})